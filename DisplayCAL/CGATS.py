@@ -9,6 +9,8 @@ Copyright (C) 2008 Florian Hoech
 from __future__ import with_statement
 import math, os, re, sys
 
+import numpy
+
 import colormath
 from log import safe_print
 from options import debug, verbose
@@ -16,6 +18,14 @@ from util_io import GzipFileProper, StringIOu as StringIO
 from util_str import safe_unicode
 
 
+CONTROL_CHARS = re.compile('[^\x09\x20-\x7E\x80-\xFF]')
+TOKEN_DELIMITERS = re.compile('[\t "#]')
+
+# Minimum number of rows for which columnar storage pays off. Smaller DATA
+# sections are cheaper to use (and to edit row by row) with row storage
+COLUMNAR_MIN_ROWS = 1000
+
+
 def get_device_value_labels(color_rep=None):
 	return filter(bool, map(lambda v: v[1] if not color_rep or v[0] == color_rep
 									  else False,
@@ -23,6 +33,17 @@ def get_device_value_labels(color_rep=None):
 							 "RGB": ("RGB_R", "RGB_G", "RGB_B")}.iteritems()))
 
 
+def device_values_key(values):
+	"""
+	Return hashable key for device values
+	
+	Values are rounded to 4 decimal digits like add_data does for device
+	values, so tiny floating point differences don't matter.
+	
+	"""
+	return tuple(round(v, 4) for v in values)
+
+
 def rpad(value, width):
 	"""
 	If value isn't a number, return a quoted string representation.
@@ -49,6 +70,111 @@ def rpad(value, width):
 	return strval
 
 
+def tokenize(line):
+	"""
+	Split a (stripped) line into values.
+	
+	Quoted values are unquoted and comments are removed. Return the values
+	and the line without comment.
+	
+	"""
+	if not '#' in line and not '"' in line:
+		return line.split(), line
+	# Deal with comments and quotes. Only delimiters and the last character
+	# can change the state, so all other characters are skipped.
+	positions = [match.start() for match in TOKEN_DELIMITERS.finditer(line)]
+	end = len(line) - 1
+	if positions[-1] != end:
+		positions.append(end)
+	quoted = False
+	values = []
+	token_start = 0
+	for i in positions:
+		char = line[i]
+		if char == '"':
+			if quoted is False:
+				if not line[token_start:i]:
+					token_start = i
+				quoted = True
+			else:
+				quoted = False
+		if (quoted is False and char in '# \t') or i == end:
+			if i == end:
+				i += 1
+			value = line[token_start:i]
+			if value:
+				if value[0] == '"' == value[-1]:
+					# Unquote
+					value = value[1:-1]
+				# Need to unescape double quote -> single quote
+				values.append(value.replace('""', '"'))
+			if char == '#':
+				# Strip comment
+				line = line[:i].strip()
+				break
+			elif char in ' \t':
+				token_start = i + 1
+	return values, line
+
+
+def sort_order(values, sortfns, reverse=False):
+	"""
+	Return indexes of values in the order sorting them successively by each
+	of the given cmp style sort functions would produce, or None if not all
+	of the sort functions have an array version.
+	
+	values   (N, 6) RGB/XYZ array
+	sortfns  Sort functions. Each needs a 'keys' attribute, a function which
+	         takes the values array and returns a list of key arrays (most
+	         significant first) that order the values like the sort function.
+	
+	Successive stable sorts are the same as a single stable sort with the
+	keys of the last sort function being the most significant, so the
+	order is determined by one lexsort.
+	
+	"""
+	keys = []
+	for sortfn in sortfns:
+		if not hasattr(sortfn, "keys"):
+			return None
+		keys = sortfn.keys(values) + keys
+	if reverse:
+		# Stable reverse: equal values keep their relative order
+		values = values[::-1]
+		keys = [key[::-1] for key in keys]
+	if keys:
+		# numpy.lexsort uses the last key as primary key
+		order = numpy.lexsort(keys[::-1])
+	else:
+		order = numpy.arange(len(values))
+	if reverse:
+		order = (len(values) - 1 - order)[::-1]
+	return order
+
+
+def sort_valueslist(valueslist, sortfns, reverse=False):
+	"""
+	Return RGB/XYZ valueslist sorted successively by each of the given cmp
+	style sort functions (None entries are ignored).
+	
+	"""
+	sortfns = filter(None, sortfns)
+	if not valueslist or not sortfns:
+		return list(valueslist)
+	order = sort_order(numpy.array(valueslist, dtype=numpy.float64),
+					   sortfns, reverse)
+	if order is None:
+		valueslist = list(valueslist)
+		for sortfn in sortfns:
+			valueslist.sort(sortfn, reverse=reverse)
+		return valueslist
+	return [valueslist[i] for i in order]
+
+
+def _is_gray(values):
+	return (values[:, 0] == values[:, 1]) & (values[:, 1] == values[:, 2])
+
+
 def sort_RGB_gray_to_top(a, b):
 	if a[0] == a[1] == a[2]:
 		if b[0] == b[1] == b[2]:
@@ -57,6 +183,8 @@ def sort_RGB_gray_to_top(a, b):
 	else:
 		return 0
 
+sort_RGB_gray_to_top.keys = lambda values: [~_is_gray(values)]
+
 
 def sort_RGB_to_top_factory(i1, i2, i3, i4):
 	def sort_RGB_to_top(a, b):
@@ -66,6 +194,10 @@ def sort_RGB_to_top_factory(i1, i2, i3, i4):
 			return -1
 		else:
 			return 0
+	def keys(values):
+		return [~((values[:, i1] == values[:, i2]) & (0 <= values[:, i3]) &
+				  (values[:, i3] < values[:, i4]))]
+	sort_RGB_to_top.keys = keys
 	return sort_RGB_to_top
 
 
@@ -76,6 +208,13 @@ def sort_RGB_white_to_top(a, b):
 	else:
 		return 0
 
+sort_RGB_white_to_top.keys = lambda values: [_RGB_sum(values) != 300]
+
+
+def _hue_keys(HSx):
+	""" Hue rounded to (radian to) degrees, then saturation, then value """
+	return [numpy.floor(numpy.degrees(HSx[:, 0]) + .5), HSx[:, 1], HSx[:, 2]]
+
 
 def sort_by_HSI(a, b):
 	a = list(colormath.RGB2HSI(*a[:3]))
@@ -89,6 +228,8 @@ def sort_by_HSI(a, b):
 	else:
 		return 0
 
+sort_by_HSI.keys = lambda values: _hue_keys(colormath.RGB2HSI_array(values[:, :3]))
+
 
 def sort_by_HSL(a, b):
 	a = list(colormath.RGB2HSL(*a[:3]))
@@ -102,6 +243,8 @@ def sort_by_HSL(a, b):
 	else:
 		return 0
 
+sort_by_HSL.keys = lambda values: _hue_keys(colormath.RGB2HSL_array(values[:, :3]))
+
 
 def sort_by_HSV(a, b):
 	a = list(colormath.RGB2HSV(*a[:3]))
@@ -115,6 +258,8 @@ def sort_by_HSV(a, b):
 	else:
 		return 0
 
+sort_by_HSV.keys = lambda values: _hue_keys(colormath.RGB2HSV_array(values[:, :3]))
+
 
 def sort_by_RGB(a, b):
 	if a[:3] > b[:3]:
@@ -124,6 +269,8 @@ def sort_by_RGB(a, b):
 	else:
 		return 0
 
+sort_by_RGB.keys = lambda values: [values[:, 0], values[:, 1], values[:, 2]]
+
 
 def sort_by_BGR(a, b):
 	if a[:3][::-1] > b[:3][::-1]:
@@ -133,6 +280,12 @@ def sort_by_BGR(a, b):
 	else:
 		return -1
 
+sort_by_BGR.keys = lambda values: [values[:, 2], values[:, 1], values[:, 0]]
+
+
+def _RGB_sum(values):
+	return values[:, 0] + values[:, 1] + values[:, 2]
+
 
 def sort_by_RGB_sum(a, b):
 	sum1, sum2 = sum(a[:3]), sum(b[:3])
@@ -143,6 +296,8 @@ def sort_by_RGB_sum(a, b):
 	else:
 		return 0
 
+sort_by_RGB_sum.keys = lambda values: [_RGB_sum(values)]
+
 
 def sort_by_RGB_pow_sum(a, b):
 	sum1, sum2 = sum(v ** 2.2 for v in a[:3]), sum(v ** 2.2 for v in b[:3])
@@ -153,6 +308,8 @@ def sort_by_RGB_pow_sum(a, b):
 	else:
 		return 0
 
+sort_by_RGB_pow_sum.keys = lambda values: [_RGB_sum(values[:, :3] ** 2.2)]
+
 
 def sort_by_L(a, b):
 	Lab1 = colormath.XYZ2Lab(*a[3:])
@@ -164,6 +321,8 @@ def sort_by_L(a, b):
 	else:
 		return 0
 
+sort_by_L.keys = lambda values: [colormath.XYZ2Lab_array(values[:, 3:])[:, 0]]
+
 
 def sort_by_luma_factory(RY, GY, BY, gamma=1):
 	def sort_by_luma(a, b):
@@ -175,6 +334,10 @@ def sort_by_luma_factory(RY, GY, BY, gamma=1):
 			return -1
 		else:
 			return 0
+	def keys(values):
+		return [RY * values[:, 0] ** gamma + GY * values[:, 1] ** gamma +
+				BY * values[:, 2] ** gamma]
+	sort_by_luma.keys = keys
 	return sort_by_luma
 
 
@@ -220,6 +383,8 @@ class CGATS(dict):
 	fileName = property(lambda self: self.filename,
 						lambda self, filename: setattr(self, "filename", filename))
 	key = None
+	_device_index = None
+	_dirty = None
 	_lvl = 0
 	_modified = False
 	mtime = None
@@ -229,7 +394,7 @@ class CGATS(dict):
 	vmaxlen = 0
 	
 	def __init__(self, cgats=None, normalize_fields=False, file_identifier="CTI3",
-				 emit_keywords=False, strict=False):
+				 emit_keywords=False, strict=False, columnar=False):
 		"""
 		Return a CGATS instance.
 		
@@ -241,6 +406,11 @@ class CGATS(dict):
 		
 		file_identifier is used as fallback if no file identifier is present
 		
+		If columnar evaluates to True, DATA sections are stored as one array
+		per field and rows are only created when accessed (see
+		CGATSColumnarData). If columnar is a number (e.g. COLUMNAR_MIN_ROWS),
+		only DATA sections with at least that many rows are stored that way
+		
 		"""
 		
 		self.normalize_fields = normalize_fields
@@ -273,45 +443,33 @@ class CGATS(dict):
 				cgats.close()
 
 			context = self
+			columnar_data = []
+			pending = None
+
+			# Find out once if lines need cleaning at all
+			if not isinstance(cgats, list):
+				text = "".join(raw_lines)
+				replace_ind = "1.#IND00" in text
+				strip_control_chars = bool(CONTROL_CHARS.search(
+					text.replace("\n", "")))
+			else:
+				replace_ind = strip_control_chars = True
 
 			for raw_line in raw_lines:
-				# Replace 1.#IND00 with NaN
-				raw_line = raw_line.replace("1.#IND00", "NaN")
+				if replace_ind:
+					# Replace 1.#IND00 with NaN
+					raw_line = raw_line.replace("1.#IND00", "NaN")
 				# strip control chars and leading/trailing whitespace
-				line = re.sub('[^\x09\x20-\x7E\x80-\xFF]', '', 
-								raw_line.strip())
-				if '#' in line or '"' in line:
-					# Deal with comments and quotes
-					quoted = False
-					values = []
-					token_start = 0
-					end = len(line) - 1
-					for i, char in enumerate(line):
-						if char == '"':
-							if quoted is False:
-								if not line[token_start:i]:
-									token_start = i
-								quoted = True
-							else:
-								quoted = False
-						if (quoted is False and char in '# \t') or i == end:
-							if i == end:
-								i += 1
-							value = line[token_start:i]
-							if value:
-								if value[0] == '"' == value[-1]:
-									# Unquote
-									value = value[1:-1]
-								# Need to unescape double quote -> single quote
-								values.append(value.replace('""', '"'))
-							if char == '#':
-								# Strip comment
-								line = line[:i].strip()
-								break
-							elif char in ' \t':
-								token_start = i + 1
-				else:
-					values = line.split()
+				line = raw_line.strip()
+				if strip_control_chars:
+					line = CONTROL_CHARS.sub('', line)
+				values, line = tokenize(line)
+				if (pending is not None and line[:4] != 'END_' and
+					line[:6] != 'BEGIN_'):
+					# Columnar DATA
+					if values:
+						pending.append(values)
+					continue
 				if line[:6] == 'BEGIN_':
 					key = line[6:]
 					if key in context:
@@ -333,7 +491,15 @@ class CGATS(dict):
 				elif line == 'END_DATA_FORMAT':
 					context = context.parent
 				elif line == 'BEGIN_DATA':
-					context['DATA'] = CGATS()
+					if columnar and 'DATA_FORMAT' in context:
+						if columnar is True:
+							min_rows = 0
+						else:
+							min_rows = columnar
+						context['DATA'] = CGATSColumnarData(min_rows)
+						columnar_data.append(context['DATA'])
+					else:
+						context['DATA'] = CGATS()
 					context['DATA'].key = 'DATA'
 					context['DATA'].parent = context
 					context['DATA'].root = self
@@ -374,6 +540,12 @@ class CGATS(dict):
 				elif values and values[0] not in ('Comment:', 'Date:') and \
 				     len(line) >= 3 and not re.search("[^ 0-9A-Za-z/.]", line):
 					context = self.add_data(line)
+				if isinstance(context, CGATSColumnarData):
+					pending = context._pending
+				else:
+					pending = None
+			for data in columnar_data:
+				data._build()
 			if 0 in self and self[0].get("NORMALIZED_TO_Y_100") == "NO":
 				# Always normalize to Y = 100
 				reprstr = (self.filename or "<%s.%s instance at 0x%016x>" %
@@ -394,7 +566,13 @@ class CGATS(dict):
 		if (self.type not in ('DATA', 'DATA_FORMAT', 'KEYWORDS', 'SECTION') and
 			name in self._keys):
 			self._keys.remove(name)
+		if self._device_index:
+			self._unindex_device_values(name)
 		dict.__delitem__(self, name)
+		if (self.type == 'SAMPLE' and self.parent is not None and
+			self.parent._dirty is not None):
+			# Columnar DATA writes changed rows back to its columns
+			self.parent._dirty.add(self.key)
 		self.setmodified()
 
 	def __getattr__(self, name):
@@ -484,7 +662,9 @@ class CGATS(dict):
 		return desc
 
 	def __setattr__(self, name, value):
-		if name in ('_keys', '_lvl'):
+		if name in ('_keys', '_lvl', '_columns', '_device_index', '_dirty',
+					'_fields', '_min_rows', '_nrows', '_pending', '_raw',
+					'_vmaxlen'):
 			object.__setattr__(self, name, value)
 		elif name == 'modified':
 			self.setmodified(value)
@@ -500,7 +680,18 @@ class CGATS(dict):
 		if (self.type not in ('DATA', 'DATA_FORMAT', 'KEYWORDS', 'SECTION') and
 			not name in self):
 			self._keys.append(name)
+		if self._device_index:
+			self._unindex_device_values(name)
+			self._index_device_values(name, value)
+		elif (self.type == 'SAMPLE' and self.parent is not None and
+			  self.parent._device_index):
+			# Device values of an indexed row may change
+			self.parent._device_index = None
 		dict.__setitem__(self, name, value)
+		if (self.type == 'SAMPLE' and self.parent is not None and
+			self.parent._dirty is not None):
+			# Columnar DATA writes changed rows back to its columns
+			self.parent._dirty.add(self.key)
 		self.setmodified()
 	
 	def setmodified(self, modified=True):
@@ -575,12 +766,16 @@ class CGATS(dict):
 			result.append('')
 			result.append('NUMBER_OF_SETS %s' % (len(data)))
 			result.append('BEGIN_DATA')
-			for key in data:
-				result.append(' '.join([rpad(data[key][item], 
-											 data.vmaxlen + 
-											 (1 if data[key][item] < 0 else 0)) 
-										for item in 
-										data.parent['DATA_FORMAT'].values()]))
+			fields = data.parent['DATA_FORMAT'].values()
+			rows = data._get_rows(fields)
+			if rows is None:
+				rows = ([data[key][item] for item in fields] for key in data)
+			vmaxlen = data.vmaxlen
+			for values in rows:
+				result.append(' '.join([rpad(value, 
+											 vmaxlen + 
+											 (1 if value < 0 else 0)) 
+										for value in values]))
 			result.append('END_DATA')
 		if (self.parent and self.parent.type or
 			self.type) == 'ROOT' and result and result[-1] != '' and lvl == 0:
@@ -649,8 +844,26 @@ class CGATS(dict):
 			data = data.queryi(field_names)
 		return data
 	
+	def _get_columns(self, labels):
+		"""
+		Return list of value arrays for labels (one per label)
+		
+		Only columnar DATA sections have columns, None is returned otherwise.
+		
+		"""
+		return None
+
+	def _get_rows(self, fields):
+		""" Return list of value lists for fields (columnar DATA only) """
+		return None
+
 	def get_RGB_XYZ_values(self):
 		field_names = ("RGB_R", "RGB_G", "RGB_B", "XYZ_X", "XYZ_Y", "XYZ_Z")
+		data = self.queryv1("DATA")
+		if data:
+			columns = data._get_columns(field_names)
+			if columns:
+				return data, numpy.column_stack(columns).tolist()
 		data = self.get_data(field_names)
 		if not data:
 			return False, False
@@ -669,16 +882,84 @@ class CGATS(dict):
 				self[i][field_name] = values[j]
 		return True
 	
+	def find_device_values(self, values):
+		"""
+		Return first DATA row with the given RGB or CMYK device values
+		(depending on the number of values), or None if there is none.
+		
+		Rows are looked up in an index (see device_values_key) which is built
+		on first use and kept up to date when rows are added, moved or
+		removed.
+		
+		"""
+		if self.type != 'DATA':
+			data = self.queryv1("DATA")
+			if data is None:
+				return None
+			return data.find_device_values(values)
+		labels = {3: ("RGB_R", "RGB_G", "RGB_B"),
+				  4: ("CMYK_C", "CMYK_M", "CMYK_Y", "CMYK_K")}.get(len(values))
+		if not labels:
+			raise CGATSValueError("Expected 3 (RGB) or 4 (CMYK) device "
+								  "values, got %i" % len(values))
+		keys = self._get_device_index(labels).get(device_values_key(values))
+		if keys:
+			return self[min(keys)]
+
+	def _get_device_index(self, labels):
+		"""
+		Return dict mapping device_values_key to list of row keys for labels,
+		building it if needed
+		
+		"""
+		index = (self._device_index or {}).get(labels)
+		if index is None:
+			index = {}
+			columns = self._get_columns(labels)
+			if columns:
+				rows = enumerate(zip(*[column.tolist() for column in columns]))
+			else:
+				rows = ((key, [row[label] for label in labels])
+						for key, row in self.iteritems()
+						if isinstance(row, CGATS) and
+						all(label in row for label in labels))
+			for key, values in rows:
+				index.setdefault(device_values_key(values), []).append(key)
+			if self._device_index is None:
+				self._device_index = {}
+			self._device_index[labels] = index
+		return index
+
+	def _index_device_values(self, key, row):
+		""" Add row with key to the device value index """
+		if not isinstance(row, CGATS):
+			return
+		for labels, index in self._device_index.iteritems():
+			if all(label in row for label in labels):
+				values = [row[label] for label in labels]
+				index.setdefault(device_values_key(values), []).append(key)
+
+	def _unindex_device_values(self, key):
+		""" Remove row with key from the device value index """
+		row = dict.get(self, key)
+		if not isinstance(row, CGATS):
+			return
+		for labels, index in self._device_index.iteritems():
+			if all(label in row for label in labels):
+				values = device_values_key([row[label] for label in labels])
+				keys = index.get(values)
+				if keys and key in keys:
+					keys.remove(key)
+					if not keys:
+						del index[values]
+
 	def checkerboard(self, sort1=sort_by_L, sort2=sort_RGB_white_to_top,
 					 split_grays=False, shift=False):
 		data, valueslist = self.get_RGB_XYZ_values()
 		if not valueslist:
 			return False
 		numvalues = len(valueslist)
-		if sort1:
-			valueslist.sort(sort1)
-		if sort2:
-			valueslist.sort(sort2)
+		valueslist = sort_valueslist(valueslist, (sort1, sort2))
 		gray = []
 		if split_grays:
 			# Split values into gray and color. First gray in a consecutive
@@ -755,10 +1036,7 @@ class CGATS(dict):
 							   "is only black and white")
 				gray.extend(color)
 				color = []
-				if sort1:
-					gray.sort(sort1)
-				if sort2:
-					gray.sort(sort2)
+				gray = sort_valueslist(gray, (sort1, sort2))
 			if debug:
 				for i, values in enumerate(gray):
 					safe_print("%4i" % (i + 1), "GRAY", ("%8.4f " * 3) %
@@ -875,11 +1153,20 @@ class CGATS(dict):
 		return self.sort_data_RGB_XYZ(sort_by_rec709_luma)
 
 	def sort_data_RGB_XYZ(self, cmp=None, key=None, reverse=False):
-		""" Sort RGB/XYZ data """
+		"""
+		Sort RGB/XYZ data
+		
+		cmp style sort functions with an array version (see sort_order) are
+		applied to all values at once.
+		
+		"""
 		data, valueslist = self.get_RGB_XYZ_values()
 		if not valueslist:
 			return False
-		valueslist.sort(cmp, key, reverse)
+		if cmp and not key:
+			valueslist = sort_valueslist(valueslist, (cmp, ), reverse)
+		else:
+			valueslist.sort(cmp, key, reverse)
 		return data.set_RGB_XYZ_values(valueslist)
 	
 	@property
@@ -1560,17 +1847,18 @@ Transform {
 		if format != "VRML":
 			safe_print("Generating", format)
 			x3d = x3dom.vrml2x3dom(out)
-			if format == "HTML":
-				out = x3d.html(title=os.path.basename(filename))
-			else:
-				out = x3d.x3d()
 		if compress:
 			writer = GzipFileProper
 		else:
 			writer = open
 		safe_print("Writing", filename)
 		with writer(filename, "wb") as outfile:
-			outfile.write(out)
+			if format == "HTML":
+				x3d.html(title=os.path.basename(filename), stream=outfile)
+			elif format != "VRML":
+				x3d.x3d(outfile)
+			else:
+				outfile.write(out)
 	
 	@property
 	def NUMBER_OF_FIELDS(self):
@@ -1620,7 +1908,7 @@ Transform {
 				
 				match_count = 0
 				for query_key in query:
-					if query_key in item or (type(item) is CGATS and 
+					if query_key in item or (isinstance(item, CGATS) and 
 					   ((query_key == 'NUMBER_OF_FIELDS' and 'DATA_FORMAT' in 
 					   item) or (query_key == 'NUMBER_OF_SETS' and 'DATA' in 
 					   item))):
@@ -1655,7 +1943,7 @@ Transform {
 							else:
 								result[n] = result_n
 				
-				if type(item) == CGATS and item != self:
+				if isinstance(item, CGATS) and item != self:
 					result_n = item.query(query, query_value, get_value, 
 										  get_first)
 					if result_n != None:
@@ -1690,7 +1978,7 @@ Transform {
 	
 	def remove(self, item):
 		""" Remove an item from the internal CGATS structure. """
-		if type(item) == CGATS:
+		if isinstance(item, CGATS):
 			key = item.key
 		else:
 			key = item
@@ -1702,6 +1990,8 @@ Transform {
 		if (self.type not in ('DATA', 'DATA_FORMAT', 'KEYWORDS', 'SECTION') and
 			name in self._keys):
 			self._keys.remove(name)
+		if self._device_index:
+			self._unindex_device_values(name)
 		dict.pop(self, name)
 		self.setmodified()
 		return result
@@ -1750,9 +2040,16 @@ Transform {
 				data.parent.DATA_FORMAT.add_data((label, ))
 
 		# Add L*a*b* to each sample
-		for key, sample in data.iteritems():
-			cie_values = [sample[label] for label in cie_labels]
-			Lab = colormath.XYZ2Lab(*cie_values)
+		columns = data._get_columns(cie_labels)
+		if columns:
+			Lab = colormath.XYZ2Lab_array(numpy.column_stack(columns))
+			data._set_columns(Lab_data_format, Lab.T)
+			return
+		samples = data.values()
+		Lab_values = colormath.XYZ2Lab_array([[sample[label] for label in
+											   cie_labels]
+											  for sample in samples]).tolist()
+		for sample, Lab in zip(samples, Lab_values):
 			for i, label in enumerate(Lab_data_format):
 				sample[label] = Lab[i]
 
@@ -1859,10 +2156,16 @@ Transform {
 									 "%.4f %.4f %.4f" % (white_cie["XYZ_X"],
 														 white_cie["XYZ_Y"],
 														 white_cie["XYZ_Z"]))
-					for sample in self.DATA.itervalues():
-						for label in "XYZ":
-							v = sample["XYZ_" + label]
-							sample["XYZ_" + label] = v / white_Y * 100
+					labels = ("XYZ_X", "XYZ_Y", "XYZ_Z")
+					columns = self.DATA._get_columns(labels)
+					if columns:
+						self.DATA._set_columns(labels, [v / white_Y * 100
+														for v in columns])
+					else:
+						for sample in self.DATA.itervalues():
+							for label in "XYZ":
+								v = sample["XYZ_" + label]
+								sample["XYZ_" + label] = v / white_Y * 100
 				self.add_keyword("NORMALIZED_TO_Y_100", "YES")
 				return True
 		return False
@@ -1882,6 +2185,13 @@ Transform {
 				digits = 4
 			color_rep = (data.parent.queryv1("COLOR_REP") or "").split("_")[0]
 			for labels in get_device_value_labels(color_rep):
+				columns = data._get_columns(labels)
+				if columns:
+					quantize = lambda v: round(quantizer(v / maxv * q) / q * maxv,
+											   digits)
+					data._set_columns(labels, [map_unique(quantize, v)
+											   for v in columns])
+					continue
 				for item in data.queryi(labels).itervalues():
 					for label in labels:
 						item[label] = round(quantizer(item[label] / maxv * q) /
@@ -1891,6 +2201,10 @@ Transform {
 		""" Scales device values by multiplying with factor. """
 		for labels in get_device_value_labels(color_rep):
 			for data in self.queryv("DATA").itervalues():
+				columns = data._get_columns(labels)
+				if columns:
+					data._set_columns(labels, [v * factor for v in columns])
+					continue
 				for item in data.queryi(labels).itervalues():
 					for label in labels:
 						item[label] *= factor
@@ -1911,7 +2225,28 @@ Transform {
 				whitepoint_source = dataset.get_white_cie("XYZ")
 			if whitepoint_source:
 				n += 1
-				for item in dataset.queryv1("DATA").itervalues():
+				data = dataset.queryv1("DATA")
+				XYZ_labels = ("XYZ_X", "XYZ_Y", "XYZ_Z")
+				Lab_labels = ("LAB_L", "LAB_A", "LAB_B")
+				XYZ = data._get_columns(XYZ_labels)
+				Lab = data._get_columns(Lab_labels)
+				if XYZ or Lab:
+					if XYZ:
+						XYZ_values = numpy.column_stack(XYZ)
+					else:
+						XYZ_values = colormath.Lab2XYZ_array(
+							numpy.column_stack(Lab), scale=100)
+					XYZ_values = colormath.adapt_array(XYZ_values,
+													   whitepoint_source,
+													   whitepoint_destination,
+													   cat)
+					if Lab:
+						data._set_columns(Lab_labels,
+										  colormath.XYZ2Lab_array(XYZ_values).T)
+					if XYZ:
+						data._set_columns(XYZ_labels, XYZ_values.T)
+					continue
+				for item in data.itervalues():
 					if "XYZ_X" in item:
 						X, Y, Z = item["XYZ_X"], item["XYZ_Y"], item["XYZ_Z"]
 					else:
@@ -2037,13 +2372,13 @@ Transform {
 		data_format = self.get_cie_data_format()
 		if data_format:
 			if "RGB_R" in data_format.values():
-				white = {"RGB_R": 100, "RGB_G": 100, "RGB_B": 100}
+				white = (100, 100, 100)
 			elif "CMYK_C" in data_format.values():
-				white = {"CMYK_C": 0, "CMYK_M": 0, "CMYK_Y": 0, "CMYK_K": 0}
+				white = (0, 0, 0, 0)
 			else:
 				white = None
 			if white:
-				white = self.queryi1(white)
+				white = self.find_device_values(white)
 			if not white:
 				for key in ("LUMINANCE_XYZ_CDM2", "APPROX_WHITE_POINT"):
 					white = self.queryv1(key)
@@ -2121,3 +2456,457 @@ Transform {
 		if isinstance(stream_or_filename, basestring):
 			stream.close()
 	
+
+
+def map_unique(func, values):
+	"""
+	Apply scalar function to each unique value of a float array
+	
+	Values are compared bitwise, so e.g. 0.0 and -0.0 are kept apart.
+	
+	"""
+	values = numpy.asarray(values, dtype=numpy.float64)
+	unique, inverse = numpy.unique(values.view(numpy.int64),
+								   return_inverse=True)
+	mapped = numpy.array([func(v) for v in unique.view(numpy.float64).tolist()],
+						 dtype=numpy.float64)
+	return mapped[inverse].reshape(values.shape)
+
+
+class CGATSColumnarData(CGATS):
+
+	"""
+	DATA section with columnar storage.
+	
+	Values are held in one array per DATA_FORMAT field (float64 for numeric
+	fields, lists for INDEX/SAMPLE_ID and SAMPLE_NAME/SAMPLE_LOC). Rows are
+	regular CGATS instances which are created on first access. Changes to
+	rows are written back to the columns before whole-column operations.
+	Adding, inserting or removing rows converts the section to regular row
+	storage. Sections with less than min_rows rows use regular row storage
+	right away.
+	
+	Values are kept as the raw strings read from the file until a field is
+	first accessed, so invalid values only raise CGATSValueError then.
+	
+	"""
+
+	_columns = None
+	_fields = ()
+	_min_rows = 0
+	_nrows = 0
+	_pending = None
+	_raw = None
+	_vmaxlen = 0
+	type = 'DATA'
+
+	def __init__(self, min_rows=0):
+		CGATS.__init__(self)
+		self._columns = {}
+		self._dirty = set()
+		self._min_rows = min_rows
+		self._pending = []
+
+	def _build(self):
+		""" Convert rows collected while parsing to columns """
+		fields = []
+		for item in self.parent['DATA_FORMAT'].values():
+			if self.root.normalize_fields:
+				if item.upper() == 'SAMPLEID':
+					item = 'SAMPLE_ID'
+				elif item.upper() == 'SAMPLENAME':
+					item = 'SAMPLE_NAME'
+			fields.append(item)
+		rows = self._pending
+		if len(rows) < self._min_rows:
+			self._demote()
+			for values in rows:
+				self.add_data(values)
+			return
+		if rows and not fields:
+			raise CGATSInvalidOperationError('Cannot add to DATA '
+				'because of missing DATA_FORMAT')
+		for values in rows:
+			if len(values) != len(fields):
+				raise CGATSTypeError('DATA entries take exactly %s '
+									 'values (%s given)' % (len(fields),
+															len(values)))
+		if rows:
+			raw_columns = zip(*rows)
+		else:
+			raw_columns = [()] * len(fields)
+		self._raw = dict(zip(fields, raw_columns))
+		self._fields = fields
+		self._nrows = len(rows)
+		self._pending = None
+
+	def _column(self, item):
+		""" Return column for field, converting raw values if needed """
+		column = self._columns.get(item)
+		if column is None:
+			column = self._convert(item, self._raw.pop(item))
+			self._columns[item] = column
+		return column
+
+	def _convert(self, item, raw):
+		""" Convert raw values like add_data does """
+		if item.upper() in ('INDEX', 'SAMPLE_ID', 'SAMPLEID'):
+			if "".join(raw).isdigit():
+				return map(int, raw)
+			column = []
+			for value in raw:
+				match = re.match(
+					'(?:\d+|((?:\d*\.\d+|\d+)(?:e[+-]?\d+)?))$', value)
+				if match:
+					if match.groups()[0]:
+						value = float(value)
+					else:
+						value = int(value)
+				column.append(value)
+			return column
+		elif item.upper() in ('SAMPLE_NAME', 'SAMPLE_LOC', 'SAMPLENAME'):
+			return list(raw)
+		try:
+			column = numpy.array(raw, dtype=numpy.float64)
+		except ValueError:
+			raise CGATSValueError('Invalid data type for %s '
+								  '(expected float, got %s)' %
+								  (item, type(raw[0])))
+		return self._check_values(item, column)
+
+	@property
+	def vmaxlen(self):
+		# Needs all numeric values
+		for item in self._raw.keys():
+			self._column(item)
+		return self._vmaxlen
+
+	@vmaxlen.setter
+	def vmaxlen(self, vmaxlen):
+		self._vmaxlen = vmaxlen
+
+	def _check_values(self, item, column):
+		"""
+		Round device values and update vmaxlen like add_data does
+		
+		Only unique values are looked at.
+		
+		"""
+		round_device_values = (self.parent.type != "CAL" and
+							   item.startswith("RGB_") or
+							   item.startswith("CMYK_"))
+		unique = numpy.unique(column.view(numpy.int64)).view(numpy.float64)
+		rounded = {}
+		for value in unique.tolist():
+			strval = str(abs(value))
+			if round_device_values:
+				# Assuming 0..100, 4 decimal digits is
+				# enough for roughly 19 bits integer
+				# device values
+				parts = strval.split(".")
+				if len(parts) == 2 and len(parts[-1]) > 4:
+					rounded[value] = round(value, 4)
+					strval = str(abs(rounded[value]))
+			parts = strval.split("e")
+			lencheck = len(parts[0])
+			if len(parts) > 1:
+				lencheck += abs(int(parts[1]))
+			if lencheck > self._vmaxlen:
+				self._vmaxlen = lencheck
+		if rounded:
+			column = map_unique(lambda v: rounded.get(v, v), column)
+		return column
+
+	def _value(self, item, key):
+		column = self._column(item)
+		if isinstance(column, numpy.ndarray):
+			return column.item(key)
+		return column[key]
+
+	def _row(self, key):
+		""" Return row, creating it from the columns if needed """
+		row = dict.get(self, key)
+		if row is None:
+			row = CGATS()
+			for item in self._fields:
+				dict.__setitem__(row, item, self._value(item, key))
+			row._keys = list(self._fields)
+			for name, value in (("key", key), ("parent", self),
+								("root", self.root), ("type", "SAMPLE")):
+				object.__setattr__(row, name, value)
+			dict.__setitem__(self, key, row)
+		return row
+
+	def _flush(self):
+		"""
+		Write values of existing rows back to the columns
+		
+		If a row no longer fits the columns (fields were added or removed, or
+		a numeric value was replaced by something else than a float), convert
+		to row storage and return False.
+		
+		"""
+		for key in self._dirty:
+			row = dict.__getitem__(self, key)
+			if len(row) != len(self._fields):
+				self._materialize()
+				return False
+			for item in self._fields:
+				if not item in row:
+					self._materialize()
+					return False
+				value = dict.__getitem__(row, item)
+				column = self._column(item)
+				if isinstance(column, numpy.ndarray):
+					if type(value) is not float:
+						self._materialize()
+						return False
+				column[key] = value
+		self._dirty.clear()
+		return True
+
+	def _demote(self):
+		""" Turn into a regular CGATS instance """
+		for name in ("_columns", "_dirty", "_fields", "_min_rows", "_nrows",
+					 "_pending", "_raw", "_vmaxlen"):
+			self.__dict__.pop(name, None)
+		object.__setattr__(self, "__class__", CGATS)
+
+	def _materialize(self):
+		""" Convert to regular row storage """
+		vmaxlen = self.vmaxlen
+		for key in xrange(self._nrows):
+			self._row(key)
+		self._demote()
+		object.__setattr__(self, "vmaxlen", vmaxlen)
+
+	def _get_columns(self, labels):
+		if not self._flush():
+			return None
+		columns = []
+		for label in labels:
+			if not label in self._fields:
+				return None
+			column = self._column(label)
+			if not isinstance(column, numpy.ndarray):
+				return None
+			columns.append(column)
+		return columns
+
+	def _set_columns(self, labels, columns):
+		"""
+		Replace (or add) float columns for labels and update existing rows
+		
+		"""
+		for label, column in zip(labels, columns):
+			column = numpy.array(column, dtype=numpy.float64)
+			if not label in self._fields:
+				self._fields.append(label)
+			self._raw.pop(label, None)
+			self._columns[label] = column
+			self._device_index = None
+			for key, row in dict.iteritems(self):
+				row[label] = column.item(key)
+		self.setmodified()
+
+	def _get_rows(self, fields):
+		if not self._flush():
+			return None
+		columns = []
+		for item in fields:
+			if not item in self._fields:
+				return None
+			column = self._column(item)
+			if isinstance(column, numpy.ndarray):
+				column = column.tolist()
+			if item.upper() in ('INDEX', 'SAMPLE_ID', 'SAMPLEID'):
+				# Same as CGATS.__getitem__ on a row
+				index = item.upper() == 'INDEX'
+				column = [value if type(value) not in (int, float) else
+						  key if index else
+						  # Rows have no DATA, so NUMBER_OF_SETS is zero
+						  1.0 / (0 - 1) * key if type(value) == float else
+						  key + 1
+						  for key, value in enumerate(column)]
+			columns.append(column)
+		return zip(*columns)
+
+	def _match(self, query, query_value):
+		"""
+		Return indexes of rows matching query, or None if the query can't be
+		answered from the columns
+		
+		"""
+		if not self._flush():
+			return None
+		mask = numpy.ones(self._nrows, dtype=bool)
+		for query_key in query:
+			if (not isinstance(query_key, basestring) or
+				query_key.upper() in ('INDEX', 'SAMPLE_ID', 'SAMPLEID')):
+				return None
+			if not query_key in self._fields:
+				return []
+			if query_value is None and isinstance(query, dict):
+				current_query_value = query[query_key]
+			else:
+				current_query_value = query_value
+			if current_query_value is None:
+				continue
+			column = self._column(query_key)
+			if not isinstance(column, numpy.ndarray):
+				mask &= numpy.array([not value != current_query_value
+									 for value in column], dtype=bool)
+			elif isinstance(current_query_value, (int, long, float)):
+				mask &= column == current_query_value
+			else:
+				return []
+		return numpy.flatnonzero(mask).tolist()
+
+	def query(self, query, query_value=None, get_value=False,
+			  get_first=False):
+		if not isinstance(query, dict):
+			if type(query) not in (list, tuple):
+				query = (query, )
+		indexes = self._match(query, query_value)
+		if indexes is None:
+			return CGATS.query(self, query, query_value, get_value, get_first)
+
+		modified = self.modified
+
+		if not get_first:
+			result = CGATS()
+		else:
+			result = None
+
+		for key in indexes:
+			item = self._row(key)
+			if get_value:
+				result_n = CGATS()
+				for query_key in query:
+					result_n[len(result_n)] = item[query_key]
+				if len(result_n) == 1:
+					result_n = result_n[0]
+			else:
+				result_n = item
+			if get_first:
+				result = result_n
+				break
+			elif not isinstance(result_n, dict) or len(result_n):
+				result[len(result)] = result_n
+
+		if isinstance(result, CGATS):
+			result.setmodified(modified)
+		return result
+
+	def set_RGB_XYZ_values(self, valueslist):
+		field_names = ("RGB_R", "RGB_G", "RGB_B", "XYZ_X", "XYZ_Y", "XYZ_Z")
+		if (len(valueslist) != len(self) or
+			not self._get_columns(field_names)):
+			return CGATS.set_RGB_XYZ_values(self, valueslist)
+		self._set_columns(field_names,
+						  numpy.array(valueslist, dtype=numpy.float64).T)
+		return True
+
+	# Row access
+
+	def __contains__(self, name):
+		if self._columns is None:
+			return False
+		return (isinstance(name, (int, long)) and
+				0 <= name < self._nrows)
+
+	has_key = __contains__
+
+	def __eq__(self, other):
+		if other is self:
+			return True
+		if not isinstance(other, dict):
+			return NotImplemented
+		if len(other) != len(self):
+			return False
+		for key in self:
+			if not key in other or self[key] != other[key]:
+				return False
+		return True
+
+	def __ne__(self, other):
+		result = self.__eq__(other)
+		if result is NotImplemented:
+			return result
+		return not result
+
+	def __iter__(self):
+		return iter(xrange(self._nrows))
+
+	def __len__(self):
+		return self._nrows
+
+	def get(self, name, default=None):
+		if name == -1:
+			name = len(self) - 1
+		if name in self:
+			return self._row(name)
+		return CGATS.get(self, name, default)
+
+	def items(self):
+		return list(self.iteritems())
+
+	def iteritems(self):
+		for key in self:
+			yield key, self._row(key)
+
+	iterkeys = __iter__
+
+	def itervalues(self):
+		for key in self:
+			yield self._row(key)
+
+	def keys(self):
+		return range(self._nrows)
+
+	def values(self):
+		return list(self.itervalues())
+
+	# Structural changes convert to row storage
+
+	def add_data(self, data, key=None):
+		if self._pending is not None:
+			# Parsing
+			self._pending.append(data)
+			return self
+		self._materialize()
+		return self.add_data(data, key)
+
+	def clear(self):
+		self._materialize()
+		self.clear()
+
+	def __delitem__(self, name):
+		self._materialize()
+		del self[name]
+
+	def moveby1(self, start, inc=1):
+		self._materialize()
+		self.moveby1(start, inc)
+
+	def popitem(self):
+		self._materialize()
+		return self.popitem()
+
+	def remove(self, item):
+		self._materialize()
+		return self.remove(item)
+
+	pop = remove
+
+	def __setitem__(self, name, value):
+		self._materialize()
+		self[name] = value
+
+	def setdefault(self, name, value=None):
+		self._materialize()
+		return self.setdefault(name, value)
+
+	def update(self, *args, **kwargs):
+		self._materialize()
+		self.update(*args, **kwargs)
@@ -7106,7 +7106,7 @@ class MainFrame(ReportFrame, BaseFrame):
 		chart = getcfg("measurement_report.chart")
 		
 		try:
-			chart = CGATS.CGATS(chart, True)
+			chart = CGATS.CGATS(chart, True, columnar=CGATS.COLUMNAR_MIN_ROWS)
 		except (IOError, CGATS.CGATSError), exception:
 			show_result_dialog(exception, getattr(self, "reportframe", self))
 			return
@@ -12745,7 +12745,7 @@ class MainFrame(ReportFrame, BaseFrame):
 									   self)
 					return
 			setcfg("last_ti3_path", path)
-			ti3 = CGATS.CGATS(ti3)
+			ti3 = CGATS.CGATS(ti3, columnar=CGATS.COLUMNAR_MIN_ROWS)
 			if self.measurement_file_check_confirm(ti3, True):
 				if ti3.modified:
 					if profile:
@@ -12813,7 +12813,7 @@ class MainFrame(ReportFrame, BaseFrame):
 				return True
 		try:
 			if not isinstance(ti3, CGATS.CGATS):
-				ti3 = CGATS.CGATS(ti3)
+				ti3 = CGATS.CGATS(ti3, columnar=CGATS.COLUMNAR_MIN_ROWS)
 			ti3_1 = verify_ti1_rgb_xyz(ti3)
 		except (IOError, CGATS.CGATSError), exception:
 			show_result_dialog(exception, self)
@@ -14251,13 +14251,15 @@ class MainFrame(ReportFrame, BaseFrame):
 		try:
 			if ext.lower() in (".ti1", ".ti3"):
 				if ext.lower() == ".ti3":
-					ti1 = CGATS.CGATS(ti3_to_ti1(open(path, "rU")))
+					ti1 = CGATS.CGATS(ti3_to_ti1(open(path, "rU")),
+									  columnar=CGATS.COLUMNAR_MIN_ROWS)
 				else:
-					ti1 = CGATS.CGATS(path)
+					ti1 = CGATS.CGATS(path, columnar=CGATS.COLUMNAR_MIN_ROWS)
 			else: # icc or icm profile
 				profile = ICCP.ICCProfile(path)
 				ti1 = CGATS.CGATS(ti3_to_ti1(profile.tags.get("CIED", "") or 
-											 profile.tags.get("targ", "")))
+											 profile.tags.get("targ", "")),
+								  columnar=CGATS.COLUMNAR_MIN_ROWS)
 			try:
 				ti1_1 = verify_ti1_rgb_xyz(ti1)
 			except CGATS.CGATSError, exception:
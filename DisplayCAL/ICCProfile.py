@@ -7,18 +7,23 @@ import atexit
 import binascii
 import ctypes
 import datetime
+import functools
+import inspect
 import locale
 import math
 import os
 import re
 import struct
 import sys
+import threading
 import warnings
 import zlib
-from itertools import izip, imap
+from itertools import chain, izip, imap
 from time import localtime, mktime, strftime
 from UserString import UserString
-from weakref import WeakValueDictionary
+
+import numpy
+
 if sys.platform == "win32":
 	import _winreg
 else:
@@ -47,7 +52,7 @@ import colormath
 import edid
 import imfile
 from colormath import NumberTuple
-from defaultpaths import iccprofiles, iccprofiles_home
+from defaultpaths import iccprofiles
 from encoding import get_encodings
 from options import test_input_curve_clipping
 from ordereddict import OrderedDict
@@ -542,6 +547,53 @@ def create_RGB_A2B_XYZ(input_curves, clut, logfn=safe_print):
 	return itable
 
 
+def _profile_cache(create):
+	"""
+	Let a synthetic profile creation function use a profile cache
+	
+	The decorated function takes an additional 'cache' keyword argument
+	(profilecache.ProfileCache instance or None). The cache key is made from
+	the function name and the values of all other arguments including
+	defaults, with xicclu lookup instances represented by their profile, and
+	'worker' and 'logfile' left out. The key is also available as
+	<function>.cachekey(cache, *args, **kwargs), which lets callers check the
+	cache before starting lookup processes.
+	
+	"""
+	spec = inspect.getargspec(create)
+	defaults = dict(zip(spec.args[-len(spec.defaults or ()):],
+						spec.defaults or ()))
+
+	def cachekey(cache, *args, **kwargs):
+		params = dict(defaults)
+		params.update(zip(spec.args, args))
+		params.update(kwargs)
+		params.pop("worker", None)
+		params.pop("logfile", None)
+		for name, value in params.items():
+			if hasattr(value, "profile_path"):
+				# Xicclu instance
+				params[name] = ICCProfile(value.profile_path)
+		return cache.key(create.__name__, params)
+
+	@functools.wraps(create)
+	def wrapper(*args, **kwargs):
+		cache = kwargs.pop("cache", None)
+		if cache:
+			key = cachekey(cache, *args, **kwargs)
+			profile = cache.get(key)
+			if profile:
+				return profile
+		profile = create(*args, **kwargs)
+		if cache:
+			cache.set(key, profile)
+		return profile
+
+	wrapper.cachekey = cachekey
+	return wrapper
+
+
+@_profile_cache
 def create_synthetic_clut_profile(rgb_space, description, XYZbp=None,
 								  white_Y=1.0, clutres=9, entries=2049,
 								  cat="Bradford"):
@@ -677,7 +729,8 @@ def create_synthetic_smpte2084_clut_profile(rgb_space, description,
 											generate_B2A=False,
 											worker=None,
 											logfile=None,
-											cat="Bradford"):
+											cat="Bradford",
+											cache=None):
 	"""
 	Create a synthetic cLUT profile with the SMPTE 2084 TRC from a colorspace
 	definition
@@ -720,9 +773,11 @@ def create_synthetic_smpte2084_clut_profile(rgb_space, description,
 											 generate_B2A,
 											 worker,
 											 logfile,
-											 cat)
+											 cat,
+											 cache=cache)
 
 
+@_profile_cache
 def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 									  black_cdm2=0, white_cdm2=400,
 									  master_black_cdm2=0,  # Not used for HLG
@@ -741,10 +796,14 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 									  generate_B2A=False,
 									  worker=None,
 									  logfile=None,
-									  cat="Bradford"):
+									  cat="Bradford",
+									  tonemap_tolerance=0.0001):
 	"""
 	Create a synthetic HDR cLUT profile from a colorspace definition
 	
+	tonemap_tolerance:  Precision of the chroma scale found when fitting
+	                    tonemapped colors into the PCS gamut (PQ only)
+	
 	"""
 
 	rgb_space = colormath.get_rgb_space(rgb_space)
@@ -761,11 +820,18 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 		if preserve_saturated_detail:
 			bt2390s = colormath.BT2390(black_cdm2, white_cdm2, master_black_cdm2,
 									   10000)
+			bt2390s_array = numpy.vectorize(bt2390s.apply,
+											otypes=[numpy.float64])
 
 		maxv = white_cdm2 / 10000.0
 		eotf = lambda v: colormath.specialpow(v, -2084)
 		oetf = eotf_inverse = lambda v: colormath.specialpow(v, 1.0 / -2084)
 		eetf = bt2390.apply
+		# Array versions
+		eotf_array = lambda v: colormath.specialpow_array(v, -2084)
+		eotf_inverse_array = lambda v: colormath.specialpow_array(v,
+																  1.0 / -2084)
+		eetf_array = numpy.vectorize(eetf, otypes=[numpy.float64])
 
 		# Apply a slight power to the segments to optimize encoding
 		encpow = min(max(bt2390.omaxi * (5 / 3.0), 1.0), 1.5)
@@ -806,6 +872,10 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 		eotf_inverse = lambda v: hlg.eotf(v, True)
 		oetf = hlg.oetf
 		eetf = lambda v: v
+		# Array versions
+		eotf_array = hlg.eotf_array
+		eotf_inverse_array = lambda v: hlg.eotf_array(v, True)
+		eetf_array = eetf
 
 		encf = lambda v: v
 	else:
@@ -1017,11 +1087,6 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 	blendmode = "Lpt"
 	IPT_white_XYZ = colormath.get_cat_matrix("IPT").inverted() * (1, 1, 1)
 	Cmode = ("all", "primaries_secondaries")[0]
-	RGB_in = []
-	HDR_ICtCp = []
-	HDR_RGB = []
-	HDR_XYZ = []
-	HDR_min_I = []
 	logmsg = "\rGenerating lookup table"
 	if hdr_format == "PQ" and tonemap:
 		logmsg += " and applying HDR tone mapping"
@@ -1042,178 +1107,171 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 	# red, orange, yellow, green, cyan, cyan/blue, red
 	sinterp = colormath.Interp([0, 0.083333, 0.166666, 0.333333, 0.5, 0.583333, 1],
 							   [1, 1, 0.5, 0.5, 0.5, 1, 1], use_numpy=True)
-	for R in xrange(clutres):
-		for G in xrange(clutres):
-			for B in xrange(clutres):
-				if worker and worker.thread_abort:
-					if forward_xicclu:
-						forward_xicclu.exit()
-					if backward_xicclu:
-						backward_xicclu.exit()
-					raise Exception("aborted")
-				# Apply a slight power to the segments to optimize encoding
-				RGB = [encf(v * step) for v in (R, G, B)]
-				RGB_in.append(tuple(RGB))
-				if debug and R == G == B:
-					safe_print("RGB %5.3f %5.3f %5.3f" % tuple(RGB), end=" ")
-				RGB_sum = sum(RGB)
-				if hdr_format == "PQ" and mode in ("HSV", "HSV_ICtCp", "ICtCp",
-												   "RGB_ICtCp"):
-					# Record original hue angle, saturation and value
-					H, S, V = colormath.RGB2HSV(*RGB)
-				if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
-					I1, Ct1, Cp1 = colormath.RGB2ICtCp(*RGB, rgb_space=rgb_space,
-													   eotf=eotf,
-													   oetf=eotf_inverse)
-					if debug and R == G == B:
-						safe_print("-> ICtCp % 5.3f % 5.3f % 5.3f" %
-								   (I1, Ct1, Cp1,), end=" ")
-					I2 = eetf(I1)
-					if preserve_saturated_detail and S:
-						sf = S
-						I2 *= (1 - sf)
-						I2 += bt2390s.apply(I1) * sf
-				if hdr_format == "HLG":
-					X, Y, Z = hlg.RGB2XYZ(*RGB)
-					if Y:
-						Y1 = Y
-						I1 = hlg.eotf(Y, True)
-						I2 = min(I1, maxsignal)
-						Y2 = hlg.eotf(I2)
-						Y3 = Y2 / Ymax
-						X, Y, Z = (v / Y * Y3 if Y else v for v in (X, Y, Z))
-						if R == G == B and logfile and debug:
-							logfile.write("\rE %.4f -> E' %.4f -> roll-off -> %.4f -> E %.4f -> scale (%i%%) -> %.4f\n" % (Y1, I1, I2, Y2, Y3 / Y2 * 100, Y3))
-				elif mode == "XYZ":
-					X, Y, Z = colormath.RGB2XYZ(*RGB, rgb_space=rgb_space,
-												eotf=eotf)
-					if Y:
-						I1 = colormath.specialpow(Y, 1.0 / -2084)
-						I2 = eetf(I1)
-						Y2 = colormath.specialpow(I2, -2084)
-						X, Y, Z = (v / Y * Y2 for v in (X, Y, Z))
-					else:
-						I1 = I2 = 0
-				elif mode in ("HSV", "HSV_ICtCp", "ICtCp", "RGB", "RGB_ICtCp"):
-					if mode in ("HSV", "RGB"):
-						I1 = max(RGB)
-					if mode in ("HSV", "HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
-						# Allow hue shift based on hue angle
-						hf = hinterp(H)
-
-						# Saturation adjustment
-						cf = sinterp(H)
-					for i, v in enumerate(RGB):
-						RGB[i] = eetf(v)
-						if preserve_saturated_detail and S:
-							sf = S
-							RGB[i] *= (1 - sf)
-							RGB[i] += bt2390s.apply(v) * sf
-					RGB_shifted = RGB  # Potentially hue shifted RGB
-					if mode in ("HSV", "HSV_ICtCp"):
-						HSV = list(colormath.RGB2HSV(*RGB_shifted))
-
-						if mode == "HSV":
-							# Allow hue shift based on hue angle
-							H = H * hf + HSV[0] * (1 - hf)
-
-						# Set hue angle
-						HSV[0] = H
-						RGB = colormath.HSV2RGB(*HSV)
-					if mode in ("HSV", "RGB"):
-						I2 = max(RGB)
-				elif mode == "YRGB":
-					LinearRGB = [eotf(v) for v in RGB]
-					I1 = 0.2627 * LinearRGB[0] + 0.678 * LinearRGB[1] + 0.0593 * LinearRGB[2]
-					I2 = eotf(eetf(eotf_inverse(I1)))
-					if I1:
-						min_I = I2 / I1
-					else:
-						min_I = 1
-					RGB = [eotf_inverse(min_I * v) for v in LinearRGB]
-				if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp", "XYZ") and I1 and I2:
-					if mode != "ICtCp" or (forward_xicclu and  backward_xicclu):
-						# Don't desaturate colors which are lighter after
-						# roll-off if mode is not ICtCp or if doing
-						# display-based desaturation
-						dsat = 1.0
-					else:
-						# Desaturate colors which are lighter after roll-off
-						# if mode is ICtCp and not doing display-based
-						# desaturation
-						dsat = I1 / I2
-					min_I = min(dsat, I2 / I1)
-				else:
-					min_I = 1
-				if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
-					if debug and R == G == B:
-						safe_print("* %5.3f" % min_I, "->", end=" ")
-					Ct2, Cp2 = (min_I * v for v in (Ct1, Cp1))
-					if debug and R == G == B:
-						safe_print("% 5.3f % 5.3f % 5.3f" % (I2, Ct2, Cp2),
-								   "->", end=" ")
-				if hdr_format == "HLG":
-					pass
-				elif mode == "XYZ":
-					X, Y, Z = colormath.XYZsaturation(X, Y, Z,
-													  min_I,
-													  rgb_space[1])[0]
-					RGB = colormath.XYZ2RGB(X, Y, Z, rgb_space,
-											oetf=eotf_inverse)
-				elif mode == "ICtCp":
-					X, Y, Z = colormath.ICtCp2XYZ(I2, Ct2, Cp2)
-					RGB = colormath.XYZ2RGB(X, Y, Z, rgb_space, clamp=False,
-											oetf=eotf_inverse)
-				if debug and R == G == B:
-					safe_print("RGB %5.3f %5.3f %5.3f" % tuple(RGB))
-				HDR_RGB.append(RGB)
-				if hdr_format == "HLG":
-					pass
-				elif mode not in ("XYZ", "ICtCp"):
-					X, Y, Z = colormath.RGB2XYZ(*RGB, rgb_space=rgb_space,
-												eotf=eotf)
-				if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
-					# Use hue and chroma from ICtCp
-					I, Ct, Cp = colormath.XYZ2ICtCp(X, Y, Z)
-					L, C, H = colormath.Lab2LCHab(I * 100, Ct * 100, Cp * 100)
-					L2, C2, H2 = colormath.Lab2LCHab(I2 * 100, Ct2 * 100, Cp2 * 100)
-
-					# Allow hue shift based on hue angle
-					I3, Ct3, Cp3 = colormath.RGB2ICtCp(*RGB_shifted,
-													   rgb_space=rgb_space,
-													   eotf=eotf,
-													   oetf=eotf_inverse)
-					L3, C3, H3 = colormath.Lab2LCHab(I3 * 100, Ct3 * 100, Cp3 * 100)
-					L = L * hf + L3 * (1 - hf)
-					C = C * hf + C3 * (1 - hf)
-					H2 = H2 * hf + H3 * (1 - hf)
-
-					# Saturation adjustment
-					C = colormath.convert_range(I1, I2, 1, C2, min(C2, C) * cf)
-					I, Ct2, Cp2 = (v / 100.0 for v in colormath.LCHab2Lab(L, C, H2))
-					Ct, Cp = Ct2, Cp2
-					if I1 > I2:
-						f = colormath.convert_range(I1, I2, 1, 1, 0)
-						Ct2, Cp2 = (v * f for v in (Ct2, Cp2))
-					if mode in ("HSV_ICtCp", "RGB_ICtCp"):
-						f = colormath.convert_range(sum(RGB_in[-1]), 0, 3, 1, sat)
-						Ct2 = Ct * f + Ct2 * (1 - f)
-						Cp2 = Cp * f + Cp2 * (1 - f)
-						I2 = I * f + I2 * (1 - f)
-					X, Y, Z = colormath.ICtCp2XYZ(I2, Ct2, Cp2)
-					RGB_ICtCp_XYZ = list((X, Y, Z))
-				else:
-					#RGB_ICtCp_XYZ = [v / maxv for v in (X, Y, Z)]
-					RGB_ICtCp_XYZ = [X, Y, Z]
-				#X, Y, Z = (v / maxv for v in (X, Y, Z))
-				HDR_XYZ.append((RGB_in[-1], [X, Y, Z], RGB_ICtCp_XYZ))
-				HDR_min_I.append(min_I)
-				count += 1
-				perc = startperc + math.floor(count / clutres ** 3.0 *
-											  (endperc - startperc))
-				if logfile and perc > prevperc:
-					logfile.write("\r%i%%" % perc)
-					prevperc = perc
+	if worker and worker.thread_abort:
+		if forward_xicclu:
+			forward_xicclu.exit()
+		if backward_xicclu:
+			backward_xicclu.exit()
+		raise Exception("aborted")
+	# The whole cLUT grid is processed at once. Rows are in cLUT order, i.e.
+	# the red channel changes slowest.
+	grid = numpy.indices((clutres, ) * 3).reshape((3, -1)).T
+	# Apply a slight power to the segments to optimize encoding
+	steps_in = [encf(v * step) for v in xrange(clutres)]
+	RGB_in = numpy.array(steps_in)[grid]
+	R, G, B = RGB_in.T
+	if hdr_format == "PQ" and mode in ("HSV", "HSV_ICtCp", "ICtCp",
+									   "RGB_ICtCp"):
+		# Record original hue angle, saturation and value
+		H, S, V = colormath.RGB2HSV_array(RGB_in).T
+	if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
+		I1, Ct1, Cp1 = colormath.XYZ2ICtCp_array(colormath.RGB2XYZ_array(RGB_in,
+																		 rgb_space,
+																		 eotf=eotf_array),
+												 oetf=eotf_inverse_array).T
+		I2 = eetf_array(I1)
+		if preserve_saturated_detail:
+			I2 = numpy.where(S, I2 * (1 - S) + bt2390s_array(I1) * S, I2)
+	if hdr_format == "HLG":
+		X, Y, Z = hlg.RGB2XYZ_array(RGB_in).T
+		I1 = eotf_inverse_array(Y)
+		I2 = numpy.minimum(I1, maxsignal)
+		Y2 = eotf_array(I2)
+		Y3 = Y2 / Ymax
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			X, Y, Z = (numpy.where(Y, v / Y * Y3, v) for v in (X, Y, Z))
+	elif mode == "XYZ":
+		X, Y, Z = colormath.RGB2XYZ_array(RGB_in, rgb_space,
+										  eotf=eotf_array).T
+		I1 = numpy.where(Y, colormath.specialpow_array(Y, 1.0 / -2084), 0)
+		I2 = numpy.where(Y, eetf_array(I1), 0)
+		Y2 = colormath.specialpow_array(I2, -2084)
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			X, Y, Z = (numpy.where(Y, v / Y * Y2, v) for v in (X, Y, Z))
+	elif mode in ("HSV", "HSV_ICtCp", "ICtCp", "RGB", "RGB_ICtCp"):
+		if mode in ("HSV", "RGB"):
+			I1 = RGB_in.max(axis=1)
+		if mode in ("HSV", "HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
+			# Allow hue shift based on hue angle
+			hf = hinterp(H)
+
+			# Saturation adjustment
+			cf = sinterp(H)
+		# Per channel roll-off only depends on the grid step
+		RGB = numpy.array([eetf(v) for v in steps_in])[grid]
+		if preserve_saturated_detail:
+			sf = S[:, None]
+			RGB = numpy.where(sf, RGB * (1 - sf) + bt2390s_array(RGB_in) * sf,
+							  RGB)
+		RGB_shifted = RGB  # Potentially hue shifted RGB
+		if mode in ("HSV", "HSV_ICtCp"):
+			HSV = colormath.RGB2HSV_array(RGB_shifted)
+
+			if mode == "HSV":
+				# Allow hue shift based on hue angle
+				H = H * hf + HSV[:, 0] * (1 - hf)
+
+			# Set hue angle
+			HSV[:, 0] = H
+			RGB = colormath.HSV2RGB_array(HSV)
+		if mode in ("HSV", "RGB"):
+			I2 = RGB.max(axis=1)
+	elif mode == "YRGB":
+		LinearRGB = eotf_array(RGB_in)
+		I1 = (0.2627 * LinearRGB[:, 0] + 0.678 * LinearRGB[:, 1] +
+			  0.0593 * LinearRGB[:, 2])
+		I2 = eotf_array(eetf_array(eotf_inverse_array(I1)))
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			min_I = numpy.where(I1, I2 / I1, 1)
+		RGB = eotf_inverse_array(min_I[:, None] * LinearRGB)
+	if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp", "XYZ"):
+		if mode != "ICtCp" or (forward_xicclu and  backward_xicclu):
+			# Don't desaturate colors which are lighter after
+			# roll-off if mode is not ICtCp or if doing
+			# display-based desaturation
+			dsat = 1.0
+		else:
+			# Desaturate colors which are lighter after roll-off
+			# if mode is ICtCp and not doing display-based
+			# desaturation
+			dsat = I1 / I2
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			min_I = numpy.where((I1 != 0) & (I2 != 0),
+								numpy.minimum(dsat, I2 / I1), 1)
+	else:
+		min_I = numpy.ones(len(RGB_in))
+	if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
+		Ct2, Cp2 = (min_I * v for v in (Ct1, Cp1))
+	if hdr_format == "HLG":
+		RGB = RGB_in
+	elif mode == "XYZ":
+		wx, wy = colormath.XYZ2xyY(*colormath.get_whitepoint(rgb_space[1]))[:2]
+		x, y, Y = colormath.XYZ2xyY_array(numpy.column_stack((X, Y, Z))).T
+		x, y, Y = colormath.xyYsaturation(x, y, Y, wx, wy, min_I)
+		X, Y, Z = colormath.xyY2XYZ_array(numpy.column_stack((x, y, Y))).T
+		RGB = colormath.XYZ2RGB_array(numpy.column_stack((X, Y, Z)), rgb_space,
+									  oetf=eotf_inverse_array)
+	elif mode == "ICtCp":
+		X, Y, Z = colormath.ICtCp2XYZ_array(numpy.column_stack((I2, Ct2,
+																Cp2))).T
+		RGB = colormath.XYZ2RGB_array(numpy.column_stack((X, Y, Z)), rgb_space,
+									  clamp=False, oetf=eotf_inverse_array)
+	if debug:
+		for i in numpy.flatnonzero((R == G) & (G == B)):
+			safe_print("RGB %5.3f %5.3f %5.3f" % tuple(RGB_in[i]), "->",
+					   "RGB %5.3f %5.3f %5.3f" % tuple(RGB[i]))
+	HDR_RGB = RGB
+	if hdr_format == "HLG":
+		pass
+	elif mode not in ("XYZ", "ICtCp"):
+		X, Y, Z = colormath.RGB2XYZ_array(RGB, rgb_space, eotf=eotf_array).T
+	if hdr_format == "PQ" and mode in ("HSV_ICtCp", "ICtCp", "RGB_ICtCp"):
+		# Use hue and chroma from ICtCp
+		I, Ct, Cp = colormath.XYZ2ICtCp_array(numpy.column_stack((X, Y, Z))).T
+		L, C, H = colormath.Lab2LCHab_array(numpy.column_stack((I * 100,
+																Ct * 100,
+																Cp * 100))).T
+		L2, C2, H2 = colormath.Lab2LCHab_array(numpy.column_stack((I2 * 100,
+																   Ct2 * 100,
+																   Cp2 * 100))).T
+
+		# Allow hue shift based on hue angle
+		I3, Ct3, Cp3 = colormath.XYZ2ICtCp_array(colormath.RGB2XYZ_array(RGB_shifted,
+																		 rgb_space,
+																		 eotf=eotf_array),
+												 oetf=eotf_inverse_array).T
+		L3, C3, H3 = colormath.Lab2LCHab_array(numpy.column_stack((I3 * 100,
+																   Ct3 * 100,
+																   Cp3 * 100))).T
+		L = L * hf + L3 * (1 - hf)
+		C = C * hf + C3 * (1 - hf)
+		H2 = H2 * hf + H3 * (1 - hf)
+
+		# Saturation adjustment (same as colormath.convert_range(I1, I2, 1,
+		# C2, min(C2, C) * cf), which only accepts a scalar range)
+		C = ((I1 - I2) * (numpy.minimum(C2, C) * cf - C2)) / (1 - I2) + C2
+		I, Ct2, Cp2 = (v / 100.0 for v in
+					   colormath.LCHab2Lab_array(numpy.column_stack((L, C,
+																	 H2))).T)
+		Ct, Cp = Ct2, Cp2
+		# Same as colormath.convert_range(I1, I2, 1, 1, 0)
+		f = ((I1 - I2) * -1) / (1 - I2) + 1
+		Ct2, Cp2 = (numpy.where(I1 > I2, v * f, v) for v in (Ct2, Cp2))
+		if mode in ("HSV_ICtCp", "RGB_ICtCp"):
+			f = colormath.convert_range(R + G + B, 0, 3, 1, sat)
+			Ct2 = Ct * f + Ct2 * (1 - f)
+			Cp2 = Cp * f + Cp2 * (1 - f)
+			I2 = I * f + I2 * (1 - f)
+		X, Y, Z = colormath.ICtCp2XYZ_array(numpy.column_stack((I2, Ct2,
+																Cp2))).T
+	# Rows of input RGB, ICtCp XYZ and RGB/ICtCp XYZ. The latter two differ
+	# only in the tonemapping stage.
+	HDR_XYZ = numpy.column_stack((RGB_in, X, Y, Z, X, Y, Z))
+	HDR_min_I = min_I
+	perc = endperc
+	if logfile and perc > prevperc:
+		logfile.write("\r%i%%" % perc)
+		prevperc = perc
 
 	if hdr_format == "PQ" and tonemap:
 		from multiprocess import cpu_count, pool_slice
@@ -1224,41 +1282,36 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 			num_workers -= 1
 		num_batches = clutres // 6
 
-		HDR_XYZ = sum(pool_slice(_mp_hdr_tonemap, HDR_XYZ,
-												  (rgb_space, maxv, sat, cat),
-												  {}, num_workers,
-												  worker and worker.thread_abort,
-												  logfile, num_batches, perc),
-												  [])
+		results = pool_slice(_mp_hdr_tonemap, HDR_XYZ,
+							 (rgb_space, maxv, sat, cat, tonemap_tolerance),
+							 {}, num_workers,
+							 worker and worker.thread_abort,
+							 logfile, num_batches, perc)
+		if [result for result in results
+			if not isinstance(result, numpy.ndarray)]:
+			# Aborted
+			if forward_xicclu:
+				forward_xicclu.exit()
+			if backward_xicclu:
+				backward_xicclu.exit()
+			raise Exception("aborted")
+		HDR_XYZ = numpy.concatenate(results)
 		prevperc = startperc = perc = 75
 	else:
 		prevperc = startperc = perc = 50
 
-	for i, item in enumerate(HDR_XYZ):
-		if not item:  # Aborted
-			if worker and worker.thread_abort:
-				if forward_xicclu:
-					forward_xicclu.exit()
-				if backward_xicclu:
-					backward_xicclu.exit()
-				raise Exception("aborted")
-		(RGB, (X, Y, Z), RGB_ICtCp_XYZ) = item
-		I, Ct, Cp = colormath.XYZ2ICtCp(X, Y, Z, oetf=eotf_inverse)
-		X, Y, Z = (v / maxv for v in (X, Y, Z))
-		HDR_ICtCp.append((I, Ct, Cp))
-		# Adapt to D50
-		X, Y, Z = colormath.adapt(X, Y, Z,
-								  whitepoint_source=rgb_space[1], cat=cat)
-		if max(X, Y, Z) * 32768 > 65535 or min(X, Y, Z) < 0 or round(Y, 6) > 1:
-			# This should not happen
-			safe_print("#%i"  % i, "RGB %.3f %.3f %.3f" % tuple(RGB),
-					   "XYZ %.6f %.6f %.6f" % (X, Y, Z), "not in range [0,1]")
-		HDR_XYZ[i] = (X, Y, Z)
-		perc = startperc + math.floor(i / clutres ** 3.0 *
-									  (100 - startperc))
-		if logfile and perc > prevperc:
-			logfile.write("\r%i%%" % perc)
-			prevperc = perc
+	XYZ = HDR_XYZ[:, 3:6]
+	HDR_ICtCp = colormath.XYZ2ICtCp_array(XYZ, oetf=eotf_inverse_array)
+	# Adapt to D50
+	HDR_XYZ = colormath.adapt_array(XYZ / maxv, whitepoint_source=rgb_space[1],
+									cat=cat)
+	X, Y, Z = HDR_XYZ.T
+	for i in numpy.flatnonzero((HDR_XYZ.max(axis=1) * 32768 > 65535) |
+							   (HDR_XYZ.min(axis=1) < 0) |
+							   (numpy.round(Y, 6) > 1)):
+		# This should not happen
+		safe_print("#%i"  % i, "RGB %.3f %.3f %.3f" % tuple(RGB_in[i]),
+				   "XYZ %.6f %.6f %.6f" % tuple(HDR_XYZ[i]), "not in range [0,1]")
 	prevperc = startperc = perc = 0
 
 	if forward_xicclu and backward_xicclu and logfile:
@@ -1544,178 +1597,187 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 		##forward_xicclu.spawn()
 	##if backward_xicclu:
 		##backward_xicclu.spawn()
-	for col_0 in xrange(clutres):
-		for col_1 in xrange(clutres):
-			itable.clut.append([])
-			debugtable0.clut.append([])
-			if not display_RGB:
-				debugtable1.clut.append([])
-			debugtable2.clut.append([])
-			for col_2 in xrange(clutres):
-				if worker and worker.thread_abort:
-					if forward_xicclu:
-						forward_xicclu.exit()
-					if backward_xicclu:
-						backward_xicclu.exit()
-					raise Exception("aborted")
-				R, G, B = HDR_RGB[row]
-				I, Ct, Cp = HDR_ICtCp[row]
-				X, Y, Z = HDR_XYZ[row]
-				min_I = HDR_min_I[row]
-				if not (col_0 == col_1 == col_2) and display_XYZ:
-					# Desaturate based on compression factor
-					if display_LCH:
-						blend = 1
-					else:
-						# Blending threshold: Don't desaturate dark colors
-						# (< 26 cd/m2). Preserves more "pop"
-						thresh_I = .381
-						blend = min_I * min(max((I - thresh_I) / (.5081 - thresh_I), 0), 1)
-					if blend:
-						if blendmode == "XYZ":
-							wx, wy = colormath.XYZ2xyY(*colormath.get_whitepoint())[:2]
-							x, y, Y = colormath.XYZ2xyY(X, Y, Z)
-							x -= wx
-							y -= wy
-							L, C, H = colormath.Lab2LCHab(*(v * 100 for v in (Y, x, y)))
-						elif blendmode == "ICtCp":
-							L, C, H = colormath.Lab2LCHab(I * 100, Cp * 100, Ct * 100)
-						elif blendmode == "DIN99d":
-							XYZ = X, Y, Z
-							L, C, H = colormath.XYZ2DIN99dLCH(*[v * 100
-																for v in XYZ])
-						elif blendmode == "IPT":
-							XYZ = colormath.adapt(X, Y, Z,
-												  whitepoint_destination=IPT_white_XYZ,
-												  cat=cat)
-							I, CP, CT = colormath.XYZ2IPT(*XYZ)
-							L, C, H = colormath.Lab2LCHab(I * 100, CP * 100, CT * 100)
-						elif blendmode == "Lpt":
-							XYZ = X, Y, Z
-							L, p, t = colormath.XYZ2Lpt(*[v * 100 for v in XYZ])
-							L, C, H = colormath.Lab2LCHab(L, p, t)
-						if blendmode:
-							if display_LCH:
-								Ld, Cd, Hd = display_LCH[row]
-								##Cdmaxk = tuple(map(round, (Ld, Hd), (2, 2)))
-								### Lookup HDR max chroma for given display 
-								### luminance and hue
-								##HCmax = Cmax[Cdmaxk]
-								##if C and HCmax:
-									### Lookup display max chroma for given display 
-									### luminance and hue
-									##HCdmax = Cdmax[Cdmaxk]
-									### Display max chroma in 0..1 range
-									##maxCc = min(HCdmax / HCmax, 1.0)
-									##KSCc = 1.5 * maxCc - 0.5
-									### HDR chroma in 0..1 range
-									##Cc1 = min(C / HCmax, 1.0)
-									##if Cc1 >= KSCc <= 1 and maxCc > KSCc >= 0:
-										### Roll-off chroma
-										##Cc2 = bt2390.apply(Cc1, KSCc,
-														   ##maxCc, 1.0, 0,
-														   ##normalize=False)
-										##C = HCmax * Cc2
-									##else:
-										### Use display chroma as-is (clip)
-										##if debug:
-											##safe_print("CLUT grid point %i %i %i: "
-													   ##"C %6.4f Cd %6.4f HCmax %6.4f maxCc "
-													   ##"%6.4f KSCc %6.4f Cc1 %6.4f" %
-													   ##(col_0, col_1, col_2, C, Cd,
-														##HCmax, maxCc, KSCc, Cc1))
-										##C = Cd
-								if C:
-									C *= min(Cd / C, 1.0)
-									C *= min(Ld / L, 1.0)
-							else:
-								Cc = general_compression_factor
-								Cc **= (C / Cmaxv)
-								C = C * (1 - blend) + (C * Cc) * blend
-						if blendmode == "ICtCp":
-							I, Cp, Ct = [v / 100.0 for v in
-										 colormath.LCHab2Lab(L, C, H)]
-							XYZ = colormath.ICtCp2XYZ(I, Ct, Cp, eotf=eotf)
-							X, Y, Z = (v / maxv for v in XYZ)
-							# Adapt to D50
-							X, Y, Z = colormath.adapt(X, Y, Z,
-													  whitepoint_source=rgb_space[1],
-													  cat=cat)
-						elif blendmode == "DIN99d":
-							L, a, b = colormath.DIN99dLCH2Lab(L, C, H)
-							X, Y, Z = colormath.Lab2XYZ(L, a, b)
-						elif blendmode == "IPT":
-							I, CP, CT = [v / 100.0 for v in
-										 colormath.LCHab2Lab(L, C, H)]
-							X, Y, Z = colormath.IPT2XYZ(I, CP, CT)
-							# Adapt to D50
-							X, Y, Z = colormath.adapt(X, Y, Z,
-													  whitepoint_source=IPT_white_XYZ,
+	if display_XYZ:
+		for col_0 in xrange(clutres):
+			for col_1 in xrange(clutres):
+				itable.clut.append([])
+				debugtable0.clut.append([])
+				if not display_RGB:
+					debugtable1.clut.append([])
+				debugtable2.clut.append([])
+				for col_2 in xrange(clutres):
+					if worker and worker.thread_abort:
+						if forward_xicclu:
+							forward_xicclu.exit()
+						if backward_xicclu:
+							backward_xicclu.exit()
+						raise Exception("aborted")
+					R, G, B = HDR_RGB[row]
+					I, Ct, Cp = HDR_ICtCp[row]
+					X, Y, Z = HDR_XYZ[row]
+					min_I = HDR_min_I[row]
+					if not (col_0 == col_1 == col_2) and display_XYZ:
+						# Desaturate based on compression factor
+						if display_LCH:
+							blend = 1
+						else:
+							# Blending threshold: Don't desaturate dark colors
+							# (< 26 cd/m2). Preserves more "pop"
+							thresh_I = .381
+							blend = min_I * min(max((I - thresh_I) / (.5081 - thresh_I), 0), 1)
+						if blend:
+							if blendmode == "XYZ":
+								wx, wy = colormath.XYZ2xyY(*colormath.get_whitepoint())[:2]
+								x, y, Y = colormath.XYZ2xyY(X, Y, Z)
+								x -= wx
+								y -= wy
+								L, C, H = colormath.Lab2LCHab(*(v * 100 for v in (Y, x, y)))
+							elif blendmode == "ICtCp":
+								L, C, H = colormath.Lab2LCHab(I * 100, Cp * 100, Ct * 100)
+							elif blendmode == "DIN99d":
+								XYZ = X, Y, Z
+								L, C, H = colormath.XYZ2DIN99dLCH(*[v * 100
+																	for v in XYZ])
+							elif blendmode == "IPT":
+								XYZ = colormath.adapt(X, Y, Z,
+													  whitepoint_destination=IPT_white_XYZ,
 													  cat=cat)
-						elif blendmode == "Lpt":
-							L, p, t = colormath.LCHab2Lab(L, C, H)
-							X, Y, Z = colormath.Lpt2XYZ(L, p, t)
-						elif blendmode == "XYZ":
-							Y, x, y = [v / 100.0 for v in
-									   colormath.LCHab2Lab(L, C, H)]
-							x += wx
-							y += wy
-							X, Y, Z = colormath.xyY2XYZ(x, y, Y)
+								I, CP, CT = colormath.XYZ2IPT(*XYZ)
+								L, C, H = colormath.Lab2LCHab(I * 100, CP * 100, CT * 100)
+							elif blendmode == "Lpt":
+								XYZ = X, Y, Z
+								L, p, t = colormath.XYZ2Lpt(*[v * 100 for v in XYZ])
+								L, C, H = colormath.Lab2LCHab(L, p, t)
+							if blendmode:
+								if display_LCH:
+									Ld, Cd, Hd = display_LCH[row]
+									##Cdmaxk = tuple(map(round, (Ld, Hd), (2, 2)))
+									### Lookup HDR max chroma for given display 
+									### luminance and hue
+									##HCmax = Cmax[Cdmaxk]
+									##if C and HCmax:
+										### Lookup display max chroma for given display 
+										### luminance and hue
+										##HCdmax = Cdmax[Cdmaxk]
+										### Display max chroma in 0..1 range
+										##maxCc = min(HCdmax / HCmax, 1.0)
+										##KSCc = 1.5 * maxCc - 0.5
+										### HDR chroma in 0..1 range
+										##Cc1 = min(C / HCmax, 1.0)
+										##if Cc1 >= KSCc <= 1 and maxCc > KSCc >= 0:
+											### Roll-off chroma
+											##Cc2 = bt2390.apply(Cc1, KSCc,
+															   ##maxCc, 1.0, 0,
+															   ##normalize=False)
+											##C = HCmax * Cc2
+										##else:
+											### Use display chroma as-is (clip)
+											##if debug:
+												##safe_print("CLUT grid point %i %i %i: "
+														   ##"C %6.4f Cd %6.4f HCmax %6.4f maxCc "
+														   ##"%6.4f KSCc %6.4f Cc1 %6.4f" %
+														   ##(col_0, col_1, col_2, C, Cd,
+															##HCmax, maxCc, KSCc, Cc1))
+											##C = Cd
+									if C:
+										C *= min(Cd / C, 1.0)
+										C *= min(Ld / L, 1.0)
+								else:
+									Cc = general_compression_factor
+									Cc **= (C / Cmaxv)
+									C = C * (1 - blend) + (C * Cc) * blend
+							if blendmode == "ICtCp":
+								I, Cp, Ct = [v / 100.0 for v in
+											 colormath.LCHab2Lab(L, C, H)]
+								XYZ = colormath.ICtCp2XYZ(I, Ct, Cp, eotf=eotf)
+								X, Y, Z = (v / maxv for v in XYZ)
+								# Adapt to D50
+								X, Y, Z = colormath.adapt(X, Y, Z,
+														  whitepoint_source=rgb_space[1],
+														  cat=cat)
+							elif blendmode == "DIN99d":
+								L, a, b = colormath.DIN99dLCH2Lab(L, C, H)
+								X, Y, Z = colormath.Lab2XYZ(L, a, b)
+							elif blendmode == "IPT":
+								I, CP, CT = [v / 100.0 for v in
+											 colormath.LCHab2Lab(L, C, H)]
+								X, Y, Z = colormath.IPT2XYZ(I, CP, CT)
+								# Adapt to D50
+								X, Y, Z = colormath.adapt(X, Y, Z,
+														  whitepoint_source=IPT_white_XYZ,
+														  cat=cat)
+							elif blendmode == "Lpt":
+								L, p, t = colormath.LCHab2Lab(L, C, H)
+								X, Y, Z = colormath.Lpt2XYZ(L, p, t)
+							elif blendmode == "XYZ":
+								Y, x, y = [v / 100.0 for v in
+										   colormath.LCHab2Lab(L, C, H)]
+								x += wx
+								y += wy
+								X, Y, Z = colormath.xyY2XYZ(x, y, Y)
+						else:
+							safe_print("CLUT grid point %i %i %i: blend = 0" %
+									   (col_0, col_1, col_2))
+					##if backward_xicclu and forward_xicclu:
+						##backward_xicclu((X, Y, Z))
+					##else:
+						##HDR_XYZ[row] = (X, Y, Z)
+					##row += 1
+					##perc = startperc + math.floor(row / clutres ** 3.0 *
+												  ##(90 - startperc))
+					##if logfile and perc > prevperc:
+						##logfile.write("\r%i%%" % perc)
+						##prevperc = perc
+		##startperc = perc
+
+		##if backward_xicclu and forward_xicclu:
+			### Get XYZ clipped to display RGB
+			##backward_xicclu.exit()
+			##for R, G, B in backward_xicclu.get():
+				##forward_xicclu((R, G, B))
+			##forward_xicclu.exit()
+			##display_XYZ = forward_xicclu.get()
+		##else:
+			##display_XYZ = HDR_XYZ
+		##row = 0
+		##for a in xrange(clutres):
+			##for b in xrange(clutres):
+				##itable.clut.append([])
+				##debugtable0.clut.append([])
+				##for c in xrange(clutres):
+					##if worker and worker.thread_abort:
+						##if forward_xicclu:
+							##forward_xicclu.exit()
+						##if backward_xicclu:
+							##backward_xicclu.exit()
+						##raise Exception("aborted")
+					##X, Y, Z = display_XYZ[row]
+					itable.clut[-1].append([min(max(v * 32768, 0), 65535)
+											for v in (X, Y, Z)])
+					debugtable0.clut[-1].append([min(max(v * 65535, 0), 65535)
+												for v in (R, G, B)])
+					if not display_RGB:
+						debugtable1.clut[-1].append([0, 0, 0])
+					if display_XYZ:
+						XYZdisp = display_XYZ[row]
 					else:
-						safe_print("CLUT grid point %i %i %i: blend = 0" %
-								   (col_0, col_1, col_2))
-				##if backward_xicclu and forward_xicclu:
-					##backward_xicclu((X, Y, Z))
-				##else:
-					##HDR_XYZ[row] = (X, Y, Z)
-				##row += 1
-				##perc = startperc + math.floor(row / clutres ** 3.0 *
-											  ##(90 - startperc))
-				##if logfile and perc > prevperc:
-					##logfile.write("\r%i%%" % perc)
-					##prevperc = perc
-	##startperc = perc
-
-	##if backward_xicclu and forward_xicclu:
-		### Get XYZ clipped to display RGB
-		##backward_xicclu.exit()
-		##for R, G, B in backward_xicclu.get():
-			##forward_xicclu((R, G, B))
-		##forward_xicclu.exit()
-		##display_XYZ = forward_xicclu.get()
-	##else:
-		##display_XYZ = HDR_XYZ
-	##row = 0
-	##for a in xrange(clutres):
-		##for b in xrange(clutres):
-			##itable.clut.append([])
-			##debugtable0.clut.append([])
-			##for c in xrange(clutres):
-				##if worker and worker.thread_abort:
-					##if forward_xicclu:
-						##forward_xicclu.exit()
-					##if backward_xicclu:
-						##backward_xicclu.exit()
-					##raise Exception("aborted")
-				##X, Y, Z = display_XYZ[row]
-				itable.clut[-1].append([min(max(v * 32768, 0), 65535)
-										for v in (X, Y, Z)])
-				debugtable0.clut[-1].append([min(max(v * 65535, 0), 65535)
-											for v in (R, G, B)])
-				if not display_RGB:
-					debugtable1.clut[-1].append([0, 0, 0])
-				if display_XYZ:
-					XYZdisp = display_XYZ[row]
-				else:
-					XYZdisp = [0, 0, 0]
-				debugtable2.clut[-1].append([min(max(v * 65535, 0), 65535)
-											for v in XYZdisp])
-				row += 1
-				perc = startperc + math.floor(row / clutres ** 3.0 *
-											  (100 - startperc))
-				if logfile and perc > prevperc:
-					logfile.write("\r%i%%" % perc)
-					prevperc = perc
+						XYZdisp = [0, 0, 0]
+					debugtable2.clut[-1].append([min(max(v * 65535, 0), 65535)
+												for v in XYZdisp])
+					row += 1
+					perc = startperc + math.floor(row / clutres ** 3.0 *
+												  (100 - startperc))
+					if logfile and perc > prevperc:
+						logfile.write("\r%i%%" % perc)
+						prevperc = perc
+	else:
+		shape = (clutres ** 2, clutres, 3)
+		itable.clut_array = numpy.clip(HDR_XYZ * 32768, 0,
+									   65535).reshape(shape)
+		debugtable0.clut_array = numpy.clip(HDR_RGB * 65535, 0,
+											65535).reshape(shape)
+		debugtable1.clut_array = numpy.zeros(shape)
+		debugtable2.clut_array = numpy.zeros(shape)
 	prevperc = startperc = perc = 0
 
 	if debug:
@@ -1725,30 +1787,30 @@ def create_synthetic_hdr_clut_profile(hdr_format, rgb_space, description,
 		if logfile:
 			logfile.write("\rGenerating PCS-to-device table...\n")
 		
-		otable.clut = []
-		count = 0
-		for R in xrange(clutres):
-			for G in xrange(clutres):
-				otable.clut.append([])
-				for B in xrange(clutres):
-					RGB = [v * step for v in (R, G, B)]
-					X, Y, Z = colormath.RGB2XYZ(*RGB, rgb_space=rgb_space,
-												eotf=eotf)
-					if hdr_format == "PQ":
-						I1, Ct1, Cp1 = colormath.XYZ2ICtCp(X, Y, Z)
-						I2 = eetf(I1)
-						Ct2, Cp2 = (min(I1 / I2, I2 / I1) * v for v in (Ct1, Cp1))
-						RGB = colormath.ICtCp2RGB(I1, Ct2, Cp2, rgb_space)
-					else:
-						RGB = hlg.XYZ2RGB(X, Y, Z)
-					if (max(X, Y, Z) * 32768 > 65535 or min(X, Y, Z) < 0 or
-						round(Y, 6) > 1 or max(RGB) > 1 or min(RGB) < 0):
-						safe_print("#%i" % count, "RGB %.3f %.3f %.3f" %
-								   tuple(RGB), "XYZ %.6f %.6f %.6f" % (X, Y, Z),
-								   "not in range [0,1]")
-					otable.clut[-1].append([min(max(v, 0), 1) * 65535
-											for v in RGB])
-					count += 1
+		RGB = grid * step
+		XYZ = colormath.RGB2XYZ_array(RGB, rgb_space, eotf=eotf_array)
+		X, Y, Z = XYZ.T
+		if hdr_format == "PQ":
+			I1, Ct1, Cp1 = colormath.XYZ2ICtCp_array(XYZ).T
+			I2 = eetf_array(I1)
+			Ct2, Cp2 = (numpy.minimum(I1 / I2, I2 / I1) * v for v in (Ct1, Cp1))
+			RGB = colormath.XYZ2RGB_array(colormath.ICtCp2XYZ_array(numpy.column_stack((I1,
+																					   Ct2,
+																					   Cp2))),
+										  rgb_space, clamp=False,
+										  oetf=eotf_inverse_array)
+		else:
+			RGB = hlg.XYZ2RGB_array(XYZ)
+		for count in numpy.flatnonzero((XYZ.max(axis=1) * 32768 > 65535) |
+									   (XYZ.min(axis=1) < 0) |
+									   (numpy.round(Y, 6) > 1) |
+									   (RGB.max(axis=1) > 1) |
+									   (RGB.min(axis=1) < 0)):
+			safe_print("#%i" % count, "RGB %.3f %.3f %.3f" %
+					   tuple(RGB[count]), "XYZ %.6f %.6f %.6f" %
+					   tuple(XYZ[count]), "not in range [0,1]")
+		otable.clut_array = (numpy.clip(RGB, 0, 1) *
+							 65535).reshape((clutres ** 2, clutres, 3))
 
 	if logfile:
 		logfile.write("\n")
@@ -1783,7 +1845,8 @@ def create_synthetic_hlg_clut_profile(rgb_space, description,
 											generate_B2A=True,
 											worker=None,
 											logfile=None,
-											cat="Bradford"):
+											cat="Bradford",
+											cache=None):
 	"""
 	Create a synthetic cLUT profile with the HLG TRC from a colorspace
 	definition
@@ -1818,7 +1881,8 @@ def create_synthetic_hlg_clut_profile(rgb_space, description,
 											 generate_B2A,
 											 worker,
 											 logfile,
-											 cat)
+											 cat,
+											 cache=cache)
 
 
 def _colord_get_display_profile(display_no=0, path_only=False, use_cache=True):
@@ -2412,7 +2476,6 @@ def _mp_apply(blocks, thread_abort_event, progress_queue, pcs, fn, args, D50,
 			for i, ointerp in enumerate(interp_list):
 				interp_list[i] = colormath.Interp(ointerp.xp, ointerp.fp,
 												  use_numpy=True)
-				interp_list[i].lookup = ointerp.lookup
 			if interp_tuple is interp:
 				interp = interp_list
 			else:
@@ -2466,97 +2529,145 @@ def _mp_apply_black(blocks, thread_abort_event, progress_queue, pcs, bp, bp_out,
 					interp, rinterp, abortmessage)
 
 
+def _hdr_tonemap_clip(XYZ, rgb_space, maxv, cat="Bradford"):
+	""" Return boolean array which is True where XYZ exceeds the PCS gamut """
+	X, Y, Z = colormath.adapt_array(XYZ / maxv,
+									whitepoint_source=rgb_space[1],
+									cat=cat).T
+	return ((numpy.minimum(numpy.minimum(X, Y), Z) < 0) |
+			(numpy.round(X, 4) > 0.9642) | (Y > 1) |
+			(numpy.round(Z, 4) > 0.8249))
+
+
+def _hdr_tonemap_desaturate(ICtCp, scale, Y):
+	"""
+	Scale ICtCp chroma, not exceeding Y
+	
+	Return XYZ and ICtCp (re-computed where Y was restored)
+	
+	"""
+	ICtCp = ICtCp * numpy.column_stack((numpy.ones(len(scale)), scale, scale))
+	XYZ = colormath.ICtCp2XYZ_array(ICtCp)
+	# Desaturating CtCp increases Y!
+	# As we desaturate different amounts per color,
+	# restore initial Y if lower than adjusted Y
+	# to keep luminance relation
+	restore = XYZ[:, 1] > Y
+	if restore.any():
+		XYZ[restore] = (XYZ[restore] / XYZ[restore, 1:2] *
+						Y[restore][:, None])
+		ICtCp[restore] = colormath.XYZ2ICtCp_array(XYZ[restore])
+	return XYZ, ICtCp
+
+
 def _mp_hdr_tonemap(HDR_XYZ, thread_abort_event, progress_queue, rgb_space,
-					maxv, sat, cat="Bradford"):
+					maxv, sat, cat="Bradford", tolerance=0.0001):
 	"""
 	Worker for HDR tonemapping
 	
+	HDR_XYZ is an array with rows of input RGB, ICtCp XYZ and RGB/ICtCp XYZ.
+	Colors outside the PCS gamut are desaturated in ICtCp in steps of 1%,
+	restoring the initial Y after each step where it increased, until they
+	fit. This is done for all colors at once. The chroma scale of the last
+	step is then found by bisection (to within tolerance).
+	
 	This should be spawned as a multiprocessing process
 	
 	"""
+	RGB_in = HDR_XYZ[:, :3]
+	ICtCp_XYZ = HDR_XYZ[:, 3:6]
+	RGB_ICtCp_XYZ = HDR_XYZ[:, 6:]
+	is_neutral = (RGB_in == RGB_in[:, :1]).all(axis=1)
+	if sat == 1:
+		# ICtCp XYZ will be set to RGB/ICtCp XYZ
+		separate = numpy.zeros(len(HDR_XYZ), dtype=bool)
+	else:
+		separate = (ICtCp_XYZ != RGB_ICtCp_XYZ).any(axis=1)
+	XYZ = numpy.concatenate((ICtCp_XYZ[separate], RGB_ICtCp_XYZ))
+	clip = (~numpy.concatenate((is_neutral[separate], is_neutral)) &
+			_hdr_tonemap_clip(XYZ, rgb_space, maxv, cat))
+	XYZo = XYZ[clip]
+	amount = len(XYZo)
+	# This is the initial intensity, and hue + saturation
+	ICtCpo = colormath.XYZ2ICtCp_array(XYZo)
+	# Last out of gamut ICtCp and first in gamut XYZ
+	ICtCp_out = ICtCpo.copy()
+	XYZ_in = XYZo.copy()
+	todo = numpy.arange(amount)  # Indexes of colors still out of gamut
+	its = 0
 	prevperc = 0
-	amount = len(HDR_XYZ)
-	dI = 0
-	dI_max = 0
-	dC = 0
-	dC_max = 0
-	I_reduced_count = 0
-	its_hi = 0  # Highest number pf iterations seen per color
-	for i, (RGB_in, ICtCp_XYZ, RGB_ICtCp_XYZ) in enumerate(HDR_XYZ):
+	while len(todo) and its < 10000:
 		if thread_abort_event and thread_abort_event.is_set():
 			return [False]
-		is_neutral = all(v == RGB_in[0] for v in RGB_in)
-		for j, XYZ in enumerate((ICtCp_XYZ, RGB_ICtCp_XYZ)):
-			if j == 0 and (sat == 1 or ICtCp_XYZ == RGB_ICtCp_XYZ):
-				# Set ICtCp_XYZ to the same object as RGB_ICtCp_XYZ which we
-				# are going to change in-place in the next iteration of the loop
-				# so that at the end of this loop, both will point to the same
-				# changed data
-				ICtCp_XYZ = RGB_ICtCp_XYZ
-				continue
-			X, Y, Z = XYZ
-			H = None
-			its = 10000  # Remaining iterations (limit)
-			while not is_neutral and its:
-				X_D50, Y_D50, Z_D50 = colormath.adapt(*(v / maxv for v in (X, Y, Z)),
-													  whitepoint_source=rgb_space[1],
-													  cat=cat)
-				negative_clip = min(X_D50, Y_D50, Z_D50) < 0
-				positive_clip = round(X_D50, 4) > 0.9642 or Y_D50 > 1 or round(Z_D50, 4) > 0.8249
-				if not (negative_clip or positive_clip):
-					break
-				if H is None:
-					# Record hue angle
-					H = colormath.RGB2HSV(*RGB_in)[0]
-					# This is the initial intensity, and hue + saturation
-					I, Ct, Cp = colormath.XYZ2ICtCp(X, Y, Z)
-					Io, Cto, Cpo = I, Ct, Cp
-					Co = colormath.Lab2LCHab(I, Ct, Cp)[1]
-				# Desaturate
-				Ct *= 0.99
-				Cp *= 0.99
-				# Update XYZ
-				X, Y, Z = colormath.ICtCp2XYZ(I, Ct, Cp)
-				if Y > XYZ[1]:
-					# Desaturating CtCp increases Y!
-					# As we desaturate different amounts per color,
-					# restore initial Y if lower than adjusted Y
-					# to keep luminance relation
-					X, Y, Z = (v / Y * XYZ[1] for v in (X, Y, Z))
-					I, Ct, Cp = colormath.XYZ2ICtCp(X, Y, Z)
-				its -= 1
-			if H is not None and round(Io - I, 4):
-				# Intensity was reduced by >= 0.0001, gather statistics
-				C = colormath.Lab2LCHab(I, Ct, Cp)[1]
-				dI += Io - I
-				dI_max = max(dI_max, Io - I)
-				dC += Co - C
-				dC_max = max(dC_max, Co - C)
-				I_reduced_count += 1
-			if not its:
-				# Max iterations exceeded, print diagnostics
-				# XXX: This should not happen (testing OK)
-				oX_D50, oY_D50, oZ_D50 = colormath.adapt(*(v / maxv for v in XYZ),
-														 whitepoint_source=rgb_space[1],
-														 cat=cat)
-				X_D50, Y_D50, Z_D50 = colormath.adapt(*(v / maxv for v in (X, Y, Z)),
-													  whitepoint_source=rgb_space[1],
-													  cat=cat)
-				safe_print("Reached iteration limit, XYZ %.4f %.4f %.4f -> %.4f %.4f %.4f" %
-						   (oX_D50, oY_D50, oZ_D50, X_D50, Y_D50, Z_D50))
-			its_hi = max(its_hi, 10000 - its)
-			XYZ[:] = X, Y, Z
-		HDR_XYZ[i] = (RGB_in, ICtCp_XYZ, RGB_ICtCp_XYZ)
-		perc = round((i + 1.0) / amount * 50)
+		# Desaturate
+		XYZ_step, ICtCp_step = _hdr_tonemap_desaturate(ICtCp_out[todo],
+													   numpy.repeat(0.99,
+																	len(todo)),
+													   XYZo[todo, 1])
+		its += 1
+		out = _hdr_tonemap_clip(XYZ_step, rgb_space, maxv, cat)
+		ICtCp_out[todo[out]] = ICtCp_step[out]
+		XYZ_in[todo[~out]] = XYZ_step[~out]
+		todo = todo[out]
+		perc = round((1 - float(len(todo)) / amount) * 50)
 		if progress_queue and perc > prevperc:
 			progress_queue.put(perc - prevperc)
 			prevperc = perc
-	if I_reduced_count:
+	if len(todo):
+		# Max iterations exceeded, print diagnostics
+		# XXX: This should not happen (testing OK)
+		XYZ_in[todo] = colormath.ICtCp2XYZ_array(ICtCp_out[todo])
+		for oXYZ, XYZ_D50 in izip(XYZo[todo], XYZ_in[todo]):
+			oX_D50, oY_D50, oZ_D50 = colormath.adapt(*(v / maxv for v in oXYZ),
+													 whitepoint_source=rgb_space[1],
+													 cat=cat)
+			X_D50, Y_D50, Z_D50 = colormath.adapt(*(v / maxv for v in XYZ_D50),
+												  whitepoint_source=rgb_space[1],
+												  cat=cat)
+			safe_print("Reached iteration limit, XYZ %.4f %.4f %.4f -> %.4f %.4f %.4f" %
+					   (oX_D50, oY_D50, oZ_D50, X_D50, Y_D50, Z_D50))
+	# Find the chroma scale between the last out of gamut and the first in
+	# gamut step by bisection
+	fit = numpy.ones(amount, dtype=bool)
+	fit[todo] = False
+	ICtCp_out = ICtCp_out[fit]
+	lo = numpy.repeat(0.99, len(ICtCp_out))  # In gamut chroma scale
+	hi = numpy.ones(len(ICtCp_out))  # Out of gamut chroma scale
+	if len(ICtCp_out):
+		bisections = max(int(math.ceil(math.log(0.01 / tolerance, 2))), 0)
+	else:
+		bisections = 0
+	for i in xrange(bisections):
+		if thread_abort_event and thread_abort_event.is_set():
+			return [False]
+		scale = (lo + hi) / 2
+		out = _hdr_tonemap_clip(_hdr_tonemap_desaturate(ICtCp_out, scale,
+														XYZo[fit, 1])[0],
+								rgb_space, maxv, cat)
+		hi = numpy.where(out, scale, hi)
+		lo = numpy.where(out, lo, scale)
+	if bisections:
+		XYZ_in[fit] = _hdr_tonemap_desaturate(ICtCp_out, lo, XYZo[fit, 1])[0]
+	if progress_queue and prevperc < 50:
+		progress_queue.put(50 - prevperc)
+	XYZ[clip] = XYZ_in
+	ICtCp = colormath.XYZ2ICtCp_array(XYZ_in)
+	dI = ICtCpo[:, 0] - ICtCp[:, 0]
+	# Intensity was reduced by >= 0.0001, gather statistics
+	reduced = numpy.round(dI, 4) != 0
+	if reduced.any():
 		# Intensity was reduced, print informational statistics
+		dC = (numpy.hypot(ICtCpo[:, 1], ICtCpo[:, 2]) -
+			  numpy.hypot(ICtCp[:, 1], ICtCp[:, 2]))[reduced]
+		dI = dI[reduced]
 		safe_print("Max iterations %i dI avg %.4f max %.4f dC avg %.4f max %.4f" %
-				   (its_hi, dI / I_reduced_count, dI_max, dC / I_reduced_count, dC_max))
-	elif its_hi:
-		safe_print("Max iterations", its_hi)
+				   (its, dI.mean(), dI.max(), dC.mean(), dC.max()))
+	elif its:
+		safe_print("Max iterations", its)
+	count = separate.sum()
+	RGB_ICtCp_XYZ[:] = XYZ[count:]
+	ICtCp_XYZ[separate] = XYZ[:count]
+	ICtCp_XYZ[~separate] = RGB_ICtCp_XYZ[~separate]
 	return HDR_XYZ
 
 
@@ -2635,6 +2746,14 @@ def uInt16Number_tohex(num):
 	return struct.pack(">H", int(round(num)))
 
 
+def uInt16Array_tohex(array):
+	""" Pack array of numbers as big-endian unsigned 16-bit integers """
+	array = numpy.floor(numpy.asarray(array, dtype=numpy.float64) + .5)
+	if array.size and (array.min() < 0 or array.max() > 65535):
+		raise ValueError("uInt16 value out of range")
+	return array.astype(">u2").tostring()
+
+
 def uInt32Number(binaryString):
 	return struct.unpack(">I", binaryString)[0]
 
@@ -2949,6 +3068,19 @@ class Illuminant(ADict):
 
 class LUT16Type(ICCProfileTag):
 
+	"""
+	ICC lut16Type (mft2)
+	
+	Input curves, cLUT and output curves are available as NumPy arrays
+	(input_array, clut_array, output_array), which are read-only views of the
+	big-endian tag data until replaced, as well as nested lists (input, clut,
+	output) for compatibility. Whichever representation was accessed last
+	is authoritative, i.e. accessing the list form converts the array form and
+	vice versa. Code that keeps a reference to one form must not modify it
+	after the other form was accessed.
+	
+	"""
+
 	def __init__(self, tagData=None, tagSignature=None, profile=None):
 		ICCProfileTag.__init__(self, tagData, tagSignature)
 		self.profile = profile
@@ -2956,6 +3088,10 @@ class LUT16Type(ICCProfileTag):
 		self._input = None
 		self._clut = None
 		self._output = None
+		self._input_array = None
+		self._clut_array = None
+		self._output_array = None
+		self._modified = False
 		self._i = (tagData and uInt8Number(tagData[8])) or 0  # Input channel count
 		self._o = (tagData and uInt8Number(tagData[9])) or 0  # Output channel count
 		self._g = (tagData and uInt8Number(tagData[10])) or 0  # cLUT grid res
@@ -2976,8 +3112,9 @@ class LUT16Type(ICCProfileTag):
 	def _apply_black(self, bp_out, use_bpc=False, weight=False, logfile=None,
 					 thread_abort=None, abortmessage="Aborted"):
 		pcs = self.profile and self.profile.connectionColorSpace
-		bp_row = list(self.clut[0][0])
-		wp_row = list(self.clut[-1][-1])
+		clut = self.clut_array
+		bp_row = clut[0, 0].tolist()
+		wp_row = clut[-1, -1].tolist()
 		nonzero_bp = tuple(bp_out) != (0, 0, 0)
 		interp = []
 		rinterp = []
@@ -3011,7 +3148,7 @@ class LUT16Type(ICCProfileTag):
 
 			from multiprocess import pool_slice
 
-			if len(self.clut[0]) < 33:
+			if clut.shape[1] < 33:
 				num_workers = 1
 			else:
 				num_workers = None
@@ -3021,12 +3158,18 @@ class LUT16Type(ICCProfileTag):
 				##bp_out = (0, 0, 0)
 
 			if bp != bp_out:
-				self.clut = sum(pool_slice(_mp_apply_black, self.clut,
-										   (pcs, bp, bp_out, wp,
-										    use_bpc, weight, D50, interp,
-										    rinterp, abortmessage), {},
-										   num_workers, thread_abort, logfile),
-										   [])
+				self.clut_array = numpy.concatenate(pool_slice(_mp_apply_black,
+															   clut,
+															   (pcs, bp,
+															    bp_out, wp,
+															    use_bpc,
+															    weight, D50,
+															    interp,
+															    rinterp,
+															    abortmessage),
+															   {}, num_workers,
+															   thread_abort,
+															   logfile))
 
 			##if pcs != "Lab" and nonzero_bp:
 				### Apply black offset to output curves
@@ -3045,29 +3188,123 @@ class LUT16Type(ICCProfileTag):
 					##out[2].append(v * 65535)
 				##self.output = out
 
+	def _get_array(self, name, cache=True):
+		"""
+		Get array form of input, clut or output without conversion
+		
+		If the list form was accessed before, it is converted and (if cache is
+		True) replaced by the array.
+		
+		"""
+		array = getattr(self, "_%s_array" % name)
+		if array is None:
+			value = getattr(self, "_" + name)
+			if value is None:
+				array = getattr(self, "_%s_view" % name)()
+			else:
+				array = numpy.array(value, dtype=numpy.float64)
+				if not cache:
+					return array
+				# The list may have been modified in-place
+				if not self._modified and self._list_modified(name):
+					self._modified = True
+				setattr(self, "_" + name, None)
+			setattr(self, "_%s_array" % name, array)
+		return array
+
+	def _get_list(self, name):
+		""" Get list form of input, clut or output (lazy compatibility view) """
+		value = getattr(self, "_" + name)
+		if value is None:
+			array = getattr(self, "_%s_array" % name)
+			if array is None:
+				array = getattr(self, "_%s_view" % name)()
+			value = array.tolist()
+			setattr(self, "_" + name, value)
+			setattr(self, "_%s_array" % name, None)
+		return value
+
+	def _list_modified(self, name):
+		""" Return whether the list form of input, clut or output differs from
+		the tag data (lists may be modified in-place) """
+		value = getattr(self, "_" + name)
+		return (value is not None and
+				not numpy.array_equal(value, getattr(self, "_%s_view" % name)()))
+
+	def _set_array(self, name, array):
+		setattr(self, "_%s_array" % name, array)
+		setattr(self, "_" + name, None)
+		self._modified = True
+
+	def _set_list(self, name, value):
+		setattr(self, "_" + name, value)
+		setattr(self, "_%s_array" % name, None)
+		self._modified = True
+
+	def _clut_view(self):
+		""" Zero-copy view of the big-endian cLUT tag data """
+		i, o, g, n = self._i, self._o, self._g, self._n
+		if not g:
+			return numpy.zeros((0, 0, o))
+		return numpy.frombuffer(self._tagData, ">u2", g ** i * o,
+								52 + n * i * 2).reshape((g ** i // g, g, o))
+
+	def _input_view(self):
+		""" Zero-copy view of the big-endian input curves tag data """
+		i, n = self._i, self._n
+		if not n:
+			return numpy.zeros((i, 0))
+		return numpy.frombuffer(self._tagData, ">u2", n * i,
+								52).reshape((i, n))
+
+	def _output_view(self):
+		""" Zero-copy view of the big-endian output curves tag data """
+		i, o, g, n, m = self._i, self._o, self._g, self._n, self._m
+		if not m:
+			return numpy.zeros((o, 0))
+		return numpy.frombuffer(self._tagData, ">u2", m * o,
+								52 + n * i * 2 + g ** i * o * 2).reshape((o, m))
+
 	@Property
 	def clut():
+		doc = """
+		cLUT as nested lists [<grid steps> ** (<input channels> - 1)]
+		[<grid steps>][<output channels>]
+		"""
+
 		def fget(self):
-			if self._clut is None:
-				i, o, g, n = self._i, self._o, self._g, self._n
-				tagData = self._tagData
-				self._clut = [[[uInt16Number(tagData[52 + n * i * 2 + o * 2 * (g * x + y) + z * 2:
-													 54 + n * i * 2 + o * 2 * (g * x + y) + z * 2])
-								for z in xrange(o)]
-							   for y in xrange(g)] for x in xrange(g ** i / g)]
-			return self._clut
+			return self._get_list("clut")
+		
+		def fset(self, value):
+			self._set_list("clut", value)
+		
+		return locals()
+
+	@Property
+	def clut_array():
+		doc = """
+		cLUT as array of shape (<grid steps> ** (<input channels> - 1),
+		<grid steps>, <output channels>)
+		
+		Unless set to a new array, this is a read-only view of the tag data.
+		To modify, set a (modified) copy.
+		"""
+
+		def fget(self):
+			return self._get_array("clut")
 		
 		def fset(self, value):
-			self._clut = value
+			self._set_array("clut", value)
 		
 		return locals()
 
 	def clut_writepng(self, stream_or_filename):
 		""" Write the cLUT as PNG image organized in <grid steps> * <grid steps>
 		sized squares, ordered vertically """
-		if len(self.clut[0][0]) != 3:
+		clut = self._get_array("clut")
+		if clut.shape[-1] != 3:
 			raise NotImplementedError("clut_writepng: output channels != 3")
-		imfile.write(self.clut, stream_or_filename)
+		imfile.write(clut, stream_or_filename)
 
 	def clut_writecgats(self, stream_or_filename):
 		""" Write the cLUT as CGATS """
@@ -3123,34 +3360,47 @@ BEGIN_DATA
 	@property
 	def clut_grid_steps(self):
 		""" Return number of grid points per dimension. """
-		return self._g or len(self.clut[0])
+		if self._clut is not None:
+			return len(self._clut[0])
+		return self._get_array("clut").shape[1]
 	
 	@Property
 	def input():
 		def fget(self):
-			if self._input is None:
-				i, n = self._i, self._n
-				tagData = self._tagData
-				self._input = [[uInt16Number(tagData[52 + n * 2 * z + y * 2:
-													 54 + n * 2 * z + y * 2])
-								for y in xrange(n)]
-							   for z in xrange(i)]
-			return self._input
+			return self._get_list("input")
+		
+		def fset(self, value):
+			self._set_list("input", value)
+		
+		return locals()
+
+	@Property
+	def input_array():
+		doc = """
+		Input curves as array of shape (<input channels>, <entries>)
+		"""
+
+		def fget(self):
+			return self._get_array("input")
 		
 		def fset(self, value):
-			self._input = value
+			self._set_array("input", value)
 		
 		return locals()
 	
 	@property
 	def input_channels_count(self):
 		""" Return number of input channels. """
-		return self._i or len(self.input)
+		if self._input is not None:
+			return len(self._input)
+		return self._get_array("input").shape[0]
 	
 	@property
 	def input_entries_count(self):
 		""" Return number of entries per input channel. """
-		return self._n or len(self.input[0])
+		if self._input is not None:
+			return len(self._input[0])
+		return self._get_array("input").shape[1]
 	
 	def invert(self):
 		"""
@@ -3164,11 +3414,11 @@ BEGIN_DATA
 				maxv = len(entries) - 1.0
 				for i, entry in enumerate(entries):
 					lut[entry / 65535.0 * maxv] = i / maxv * 65535
-				xp = lut.keys()
-				fp = lut.values()
+				interp = colormath.Interp(lut.keys(), lut.values(),
+										  cachesize=0)
 				for i in xrange(len(entries)):
 					if not i in lut:
-						lut[i] = colormath.interp(i, xp, fp)
+						lut[i] = interp(i)
 				lut.sort()
 				channel[e] = lut.values()
 
@@ -3221,21 +3471,14 @@ BEGIN_DATA
 		Shift cLUT columns, altering slowest to fastest changing column
 		
 		"""
-		if len(self.input) != 3:
+		if self.input_channels_count != 3:
 			raise NotImplementedError("input channels != 3")
-		steps = len(self.clut[0])
-		clut = []
-		coord = [0, 0, 0]
-		for a in xrange(steps):
-			coord[order[0]] = a
-			for b in xrange(steps):
-				coord[order[1]] = b
-				clut.append([])
-				for c in xrange(steps):
-					coord[order[2]] = c
-					z, y, x = coord
-					clut[-1].append(self.clut[z * steps + y][x])
-		self.clut = clut
+		clut = self.clut_array
+		steps = clut.shape[1]
+		clut = clut.reshape((steps, steps, steps, clut.shape[-1]))
+		# New axis n is old axis order[n]
+		clut = clut.transpose(tuple(order) + (3, ))
+		self.clut_array = clut.reshape((steps * steps, steps, -1))
 	
 	@Property
 	def matrix():
@@ -3261,31 +3504,40 @@ BEGIN_DATA
 	@Property
 	def output():
 		def fget(self):
-			if self._output is None:
-				i, o, g, n, m = self._i, self._o,self._g,  self._n, self._m
-				tagData = self._tagData
-				self._output = [[uInt16Number(tagData[52 + n * i * 2 + m * 2 * z + y * 2 +
-													  g ** i * o * 2:
-													  54 + n * i * 2 + m * 2 * z + y * 2 +
-													  g ** i * o * 2])
-								 for y in xrange(m)]
-								for z in xrange(o)]
-			return self._output
+			return self._get_list("output")
+		
+		def fset(self, value):
+			self._set_list("output", value)
+		
+		return locals()
+
+	@Property
+	def output_array():
+		doc = """
+		Output curves as array of shape (<output channels>, <entries>)
+		"""
+
+		def fget(self):
+			return self._get_array("output")
 		
 		def fset(self, value):
-			self._output = value
+			self._set_array("output", value)
 		
 		return locals()
 	
 	@property
 	def output_channels_count(self):
 		""" Return number of output channels. """
-		return self._o or len(self.output)
+		if self._output is not None:
+			return len(self._output)
+		return self._get_array("output").shape[0]
 	
 	@property
 	def output_entries_count(self):
 		""" Return number of entries per output channel. """
-		return self._m or len(self.output[0])
+		if self._output is not None:
+			return len(self._output[0])
+		return self._get_array("output").shape[1]
 
 	def smooth(self, diagpng=2, pcs=None, filename=None, logfile=None, debug=0):
 		""" Apply extra smoothing to the cLUT """
@@ -3298,11 +3550,12 @@ BEGIN_DATA
 		if not filename and self.profile:
 			filename = self.profile.fileName
 
-		clutres = len(self.clut[0])
+		clut = numpy.array(self._get_array("clut"), dtype=numpy.float64)
+		clutres = clut.shape[1]
 
 		sig = self.tagSignature or id(self)
 
-		if diagpng and filename and len(self.output) == 3:
+		if diagpng and filename and self.output_channels_count == 3:
 			# Generate diagnostic images
 			fname, ext = os.path.splitext(filename)
 			diag_fname = fname + ".%s.post.CLUT.png" % sig
@@ -3313,90 +3566,131 @@ BEGIN_DATA
 
 		if logfile:
 			logfile.write("Smoothing %s...\n" % sig)
-		# Create a list of <clutres> number of 2D grids, each one with a
-		# size of (width x height) <clutres> x <clutres>
-		grids = []
-		for i, block in enumerate(self.clut):
-			if i % clutres == 0:
-				grids.append([])
-			grids[-1].append([])
-			for RGB in block:
-				grids[-1][-1].append(RGB)
-		for i, grid in enumerate(grids):
-			for y in xrange(clutres):
-				for x in xrange(clutres):
-					is_dark = sum(grid[y][x]) < 65535 * .03125 * 3
-					if pcs == "XYZ":
-						is_gray = x == y == i
-					elif clutres // 2 != clutres / 2.0:
-						# For CIELab cLUT, gray will only
-						# fall on a cLUT point if uneven cLUT res
-						is_gray = x == y == clutres // 2
-					else:
-						is_gray = False
-					##print i, y, x, "%i %i %i" % tuple(v / 655.35 * 2.55 for v in grid[y][x]), is_dark, raw_input(is_gray) if is_gray else ''
-					if is_dark or is_gray:
-						# Don't smooth dark colors and gray axis
-						continue
-					RGB = [[v] for v in grid[y][x]]
-					# Use either "plus"-shaped or box filter depending if one
-					# channel is fully saturated
-					if clutres - 1 in (y, x) or 0 in (x, y):
-						# Filter with a "plus" (+) shape
-						if (pcs == "Lab" and
-							i > clutres / 2.0):
-							# Smoothing factor for L*a*b* -> RGB cLUT above 50%
-							smooth = 0.25
-						else:
-							smooth = 0.5
-						for j, c in enumerate((x, y)):
-							# Omit corners and perpendicular axis
-							if c > 0 and c < clutres - 1:
-								for n in (-1, 1):
-									yi, xi = (y, y + n)[j], (x + n, x)[j]
-									if (xi > -1 and yi > -1 and
-										xi < clutres and yi < clutres):
-										RGBn = grid[yi][xi]
-										if debug == 2:
-											if (i < clutres - 1 or
-												grid[y][x] != [16384, 16384, 16384]):
-												grid[y][x] = [32768, 32768, 32768]
-											if x == y == clutres - 2:
-												RGBn[:] = [16384, 16384, 16384]
-										for k in xrange(3):
-											RGB[k].append(RGBn[k] * smooth +
-														  RGB[k][0] * (1 - smooth))
-					else:
-						# Box filter, 3x3
-						# Center pixel weight = 1.0, surround = 2/3, corners = 1/3
-						if debug == 1:
-							grid[y][x] = [32768, 32768, 32768]
-						for j in (0, 1):
+		# Process <clutres> number of 2D grids, each one with a
+		# size of (width x height) <clutres> x <clutres>.
+		# Points are processed in order because smoothed points are used as
+		# neighbors of subsequent points, but all grids at once.
+		grids = clut[:clutres * clutres].reshape((clutres, clutres, clutres,
+												  -1))
+		grid_i = numpy.arange(clutres)
+		if pcs == "Lab":
+			# Smoothing factor for L*a*b* -> RGB cLUT above 50%
+			plus_smooth = numpy.where(grid_i > clutres / 2.0, 0.25,
+									  0.5)[:, None]
+		else:
+			plus_smooth = 0.5
+		for y in xrange(clutres):
+			for x in xrange(clutres):
+				RGB = grids[:, y, x].copy()
+				is_dark = self._clut_channels_sum(RGB) < 65535 * .03125 * 3
+				if pcs == "XYZ":
+					is_gray = (grid_i == x) & (x == y)
+				elif clutres // 2 != clutres / 2.0:
+					# For CIELab cLUT, gray will only
+					# fall on a cLUT point if uneven cLUT res
+					is_gray = x == y == clutres // 2
+				else:
+					is_gray = False
+				# Don't smooth dark colors and gray axis
+				active = ~(is_dark | is_gray)
+				if not active.any():
+					continue
+				RGBsum = RGB[:, :3].copy()
+				count = 1
+				# Use either "plus"-shaped or box filter depending if one
+				# channel is fully saturated
+				if clutres - 1 in (y, x) or 0 in (x, y):
+					# Filter with a "plus" (+) shape
+					smooth = plus_smooth
+					for j, c in enumerate((x, y)):
+						# Omit corners and perpendicular axis
+						if c > 0 and c < clutres - 1:
 							for n in (-1, 1):
-								for yi, xi in [((y, y + n)[j], (x + n, x)[j]),
-											   (y - n, (x + n, x - n)[j])]:
-									if (xi > -1 and yi > -1 and
-										xi < clutres and yi < clutres):
-										RGBn = grid[yi][xi]
-										if yi != y and xi != x:
-											smooth = 1 / 3.0
-										else:
-											smooth = 2 / 3.0
-										if debug == 1 and x == y == clutres - 2:
-											RGBn[:] = (v * (1 - smooth) for v in RGBn)
-										for k in xrange(3):
-											RGB[k].append(RGBn[k] * smooth +
-														  RGB[k][0] * (1 - smooth))
-					if not debug:
-						grid[y][x] = [sum(v) / float(len(v)) for v in RGB]
-			for j, row in enumerate(grid):
-				self.clut[i * clutres + j] = [[min(v, 65535) for v in RGB]
-											   for RGB in row]
+								yi, xi = (y, y + n)[j], (x + n, x)[j]
+								if (xi > -1 and yi > -1 and
+									xi < clutres and yi < clutres):
+									if debug == 2:
+										grids[active &
+											  ((grid_i < clutres - 1) |
+											   (grids[:, y, x] !=
+												16384).any(axis=-1)),
+											  y, x] = 32768
+										if x == y == clutres - 2:
+											grids[active, yi, xi] = 16384
+									RGBsum += (grids[:, yi, xi, :3] * smooth +
+											   RGB[:, :3] * (1 - smooth))
+									count += 1
+				else:
+					# Box filter, 3x3
+					# Center pixel weight = 1.0, surround = 2/3, corners = 1/3
+					if debug == 1:
+						grids[active, y, x] = 32768
+					for j in (0, 1):
+						for n in (-1, 1):
+							for yi, xi in [((y, y + n)[j], (x + n, x)[j]),
+										   (y - n, (x + n, x - n)[j])]:
+								if (xi > -1 and yi > -1 and
+									xi < clutres and yi < clutres):
+									if yi != y and xi != x:
+										smooth = 1 / 3.0
+									else:
+										smooth = 2 / 3.0
+									if debug == 1 and x == y == clutres - 2:
+										grids[active, yi, xi] *= 1 - smooth
+									RGBsum += (grids[:, yi, xi, :3] * smooth +
+											   RGB[:, :3] * (1 - smooth))
+									count += 1
+				if not debug:
+					RGB[:, :3] = RGBsum / float(count)
+					grids[active, y, x] = RGB[active]
+		grids[:] = numpy.minimum(grids, 65535)
+		self.clut_array = clut
 
 		if diagpng and filename:
 			self.clut_writepng(fname + ".%s.post.CLUT.smooth.png" %
 							   sig)
 
+	@staticmethod
+	def _clut_channels_sum(values):
+		""" Sum of channels (last axis), added in order like sum() """
+		result = values[..., 0].copy()
+		for k in xrange(1, values.shape[-1]):
+			result += values[..., k]
+		return result
+
+	def clut_smooth_mask(self, clut, axes=(0, 1, 2), pcs=None,
+						 protect_gray_axis=True, protect_dark=False,
+						 protect_black=True, exclude=None):
+		"""
+		Return boolean mask of cLUT points protected from smoothing
+		
+		clut     cLUT array of shape (<grid steps>, <grid steps>,
+		         <grid steps>, <output channels>)
+		axes     Order of the cLUT axes the gray axis and exclusions refer to
+		         (like clut_shift_columns, i.e. axis n is clut axis axes[n])
+		exclude  Boolean mask of additional points to protect, in the order
+		         given by axes
+		
+		Same criteria as clut_row_apply_per_channel.
+		
+		"""
+		clutres = clut.shape[0]
+		a, b, c = [numpy.indices(clut.shape[:3])[axis] for axis in axes]
+		mask = numpy.zeros(clut.shape[:3], dtype=bool)
+		if protect_gray_axis:
+			if pcs == "XYZ":
+				mask |= (a == b) & (b == c)
+			else:
+				# L*a*b*
+				mask |= (b == clutres // 2) & (c == clutres // 2)
+		if exclude is not None:
+			mask |= exclude.transpose(numpy.argsort(axes))
+		if protect_dark:
+			mask |= self._clut_channels_sum(clut) < 65535 * .03125 * 3
+		if protect_black:
+			mask |= (clut == 0).all(axis=-1)
+		return mask
+
 	def smooth2(self, diagpng=2, pcs=None, filename=None, logfile=None,
 				window=(1 / 16.0, 1, 1 / 16.0)):
 		""" Apply extra smoothing to the cLUT """
@@ -3409,11 +3703,11 @@ BEGIN_DATA
 		if not filename and self.profile:
 			filename = self.profile.fileName
 
-		clutres = len(self.clut[0])
+		clutres = self.clut_grid_steps
 
 		sig = self.tagSignature or id(self)
 
-		if diagpng and filename and len(self.output) == 3:
+		if diagpng and filename and self.output_channels_count == 3:
 			# Generate diagnostic images
 			fname, ext = os.path.splitext(filename)
 			diag_fname = fname + ".%s.post.CLUT.png" % sig
@@ -3425,10 +3719,19 @@ BEGIN_DATA
 		if logfile:
 			logfile.write("Smoothing %s...\n" % sig)
 
+		if self.input_channels_count != 3:
+			raise NotImplementedError("input channels != 3")
+		clut = numpy.array(self._get_array("clut"), dtype=numpy.float64)
+		clut = clut.reshape((clutres, clutres, clutres, -1))
+
+		# Smooth along each axis in turn (in place, without reordering the
+		# cLUT). axes is the order the cLUT would have if its columns were
+		# shifted (see clut_shift_columns), smoothing is along the last axis
 		for i in xrange(3):
 			state = ("original", "pass", "final")[i]
 			if diagpng != 3 and i != 1:
 				continue
+			axes = (0, 1, 2)
 			for j, (order, channels) in enumerate([(None, "BGR"),
 												   ((1, 2, 0), "RBG"),
 												   ((0, 2, 1), "BRG"),
@@ -3439,7 +3742,7 @@ BEGIN_DATA
 				if order:
 					if debug:
 						safe_print("Shifting order to", channels)
-					self.clut_shift_columns(order)
+					axes = tuple(axes[n] for n in order)
 				if i == 1 and j != 6:
 					if debug:
 						safe_print("Smoothing")
@@ -3449,25 +3752,33 @@ BEGIN_DATA
 						if clutres // 2 != clutres / 2.0:
 							# For CIELab cLUT, gray will only
 							# fall on a cLUT point if uneven cLUT res
+							a, b, c = numpy.indices((clutres, ) * 3)
 							if channels in ("RBG", "RGB"):
-								exclude = [((clutres // 2 + 1) * (clutres - 1), col)
-										   for col in xrange(clutres)]
+								exclude = (a == clutres // 2) & (b == clutres // 2)
 								protect_gray_axis = False
 							elif channels in ("BRG", "GRB"):
-								exclude = [((clutres // 2) * clutres + y, clutres // 2)
-										   for y in xrange(clutres)]
+								exclude = (a == clutres // 2) & (c == clutres // 2)
 								protect_gray_axis = False
 						else:
 							protect_gray_axis = False
-					self.clut_row_apply_per_channel((0, 1, 2), colormath.smooth_avg,
-													(), {"window": window}, pcs,
+					protect = self.clut_smooth_mask(clut, axes, pcs,
 													protect_gray_axis,
 													exclude=exclude)
+					clut[..., :3] = colormath.smooth_avg_array(clut[..., :3],
+															   window=window,
+															   protect=protect[..., None],
+															   axis=axes[2])
 				if diagpng == 3 and filename and j != 6:
 					if debug:
 						safe_print("Writing diagnostic PNG for", state, channels)
-					self.clut_writepng(fname + ".%s.post.CLUT.%s.%s.png" %
-									   (sig, channels, state))
+					imfile.write(clut.transpose(axes + (3, )).reshape((clutres *
+																	   clutres,
+																	   clutres,
+																	   -1)),
+								 fname + ".%s.post.CLUT.%s.%s.png" %
+								 (sig, channels, state))
+
+		self.clut_array = clut.reshape((clutres * clutres, clutres, -1))
 
 		if diagpng and filename:
 			self.clut_writepng(fname + ".%s.post.CLUT.smooth.png" % sig)
@@ -3479,12 +3790,17 @@ BEGIN_DATA
 		"""
 	
 		def fget(self):
-			if (self._matrix, self._input, self._clut, self._output) == (None, ) * 4:
+			if (self._matrix is None and not self._modified and
+				not any(self._list_modified(name)
+						for name in ("input", "clut", "output"))):
 				return self._tagData
+			input = self._get_array("input", False)
+			clut = self._get_array("clut", False)
+			output = self._get_array("output", False)
 			tagData = ["mft2", "\0" * 4,
-					   uInt8Number_tohex(len(self.input)),
-					   uInt8Number_tohex(len(self.output)),
-					   uInt8Number_tohex(len(self.clut and self.clut[0])),
+					   uInt8Number_tohex(len(input)),
+					   uInt8Number_tohex(len(output)),
+					   uInt8Number_tohex(clut.size and clut.shape[1]),
 					   "\0",
 					   s15Fixed16Number_tohex(self.matrix[0][0]),
 					   s15Fixed16Number_tohex(self.matrix[0][1]),
@@ -3495,15 +3811,11 @@ BEGIN_DATA
 					   s15Fixed16Number_tohex(self.matrix[2][0]),
 					   s15Fixed16Number_tohex(self.matrix[2][1]),
 					   s15Fixed16Number_tohex(self.matrix[2][2]),
-					   uInt16Number_tohex(len(self.input and self.input[0])),
-					   uInt16Number_tohex(len(self.output and self.output[0]))]
-			for entries in self.input:
-				tagData.extend(uInt16Number_tohex(v) for v in entries)
-			for block in self.clut:
-				for entries in block:
-					tagData.extend(uInt16Number_tohex(v) for v in entries)
-			for entries in self.output:
-				tagData.extend(uInt16Number_tohex(v) for v in entries)
+					   uInt16Number_tohex(input.size and input.shape[1]),
+					   uInt16Number_tohex(output.size and output.shape[1]),
+					   uInt16Array_tohex(input),
+					   uInt16Array_tohex(clut),
+					   uInt16Array_tohex(output)]
 			return "".join(tagData)
 		
 		def fset(self, tagData):
@@ -5078,18 +5390,12 @@ class VideoCardGammaTableType(VideoCardGammaType):
 	def resize(self, length=128):
 		data = [[], [], []]
 		for i, channel in enumerate(self.data):
-			for j in xrange(0, length):
-				j *= (len(channel) - 1) / float(length - 1)
-				if int(j) != j:
-					floor = channel[int(math.floor(j))]
-					ceil = channel[min(int(math.ceil(j)), len(channel) - 1)]
-					interpolated = xrange(floor, ceil + 1)
-					fraction = j - int(j)
-					index = int(round(fraction * (ceil - floor)))
-					v = interpolated[index]
-				else:
-					v = channel[int(j)]
-				data[i].append(v)
+			interp = colormath.Interp(range(len(channel)), channel, cachesize=0)
+			x = numpy.arange(length) * ((len(channel) - 1) / float(length - 1))
+			v = interp(x)
+			# Round half away from zero (same as round)
+			v = numpy.copysign(numpy.floor(numpy.abs(v) + .5), v)
+			data[i] = v.astype(int).tolist()
 		self.data = data
 		self.entryCount = len(data[0])
 	
@@ -5724,7 +6030,140 @@ class ICCProfileInvalidError(IOError):
 	pass
 
 
-_iccprofilecache = WeakValueDictionary()
+class ICCProfileCache(object):
+
+	"""
+	LRU cache of ICCProfile instances with a byte budget
+	
+	The size of a cached profile is estimated from its tags: Raw (not yet
+	parsed) tags count with their size in bytes, parsed tags with an
+	approximation of their in-memory footprint. Sizes are re-evaluated
+	whenever a profile is added, because tags are parsed lazily.
+	
+	Entries are keyed by file path, device, inode, mtime and size (or MD5 of
+	the binary profile data) and are invalidated when the profile ID of the
+	cached instance changed (see ICCProfile.calculateID) or a method changing
+	the profile is called on it.
+	
+	"""
+
+	# Approximate factor of parsed tag size to raw tag size by tag type
+	# (parsed curves are lists of Python floats). Each parsed tag also counts
+	# with a fixed overhead for the tag object itself.
+	parsed_tag_factor = {"curv": 16}
+	parsed_tag_default_factor = 2
+	parsed_tag_overhead = 1024
+
+	def __init__(self, maxsize=64 * 1024 * 1024):
+		self.maxsize = maxsize
+		self.lock = threading.RLock()
+		# Key -> [profile, ID, {tag signature: (type signature, raw size)}]
+		self._entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+
+	def __contains__(self, key):
+		return key in self._entries
+
+	def __len__(self):
+		return len(self._entries)
+
+	def clear(self):
+		with self.lock:
+			self._entries.clear()
+
+	def get(self, key):
+		""" Return cached profile for key or None """
+		with self.lock:
+			entry = self._entries.pop(key, None)
+			if entry:
+				if entry[0].ID == entry[1]:
+					# Most recently used entries are last
+					self._entries[key] = entry
+					self.hits += 1
+					return entry[0]
+				self.invalidations += 1
+			self.misses += 1
+
+	def put(self, key, profile):
+		""" Add profile, then evict least recently used exceeding maxsize """
+		with self.lock:
+			self._entries.pop(key, None)
+			self._entries[key] = [profile, profile.ID, {}]
+			self.evict()
+
+	def remove(self, key):
+		""" Invalidate key """
+		with self.lock:
+			if self._entries.pop(key, None):
+				self.invalidations += 1
+
+	def footprint(self, entry):
+		""" Return the estimated size in bytes of a cache entry's profile """
+		profile, ID, tagsizes = entry
+		size = len(profile._data)
+		for tagSignature in profile._tags:
+			tag = AODict.__getitem__(profile._tags, tagSignature)
+			if isinstance(tag, tuple):
+				# Not yet parsed
+				tagsizes[tagSignature] = tag[0], tag[2]
+				size += tag[2]
+			else:
+				typeSignature, tagsize = tagsizes.get(tagSignature,
+													 (None, 0))
+				factor = self.parsed_tag_factor.get(typeSignature,
+													self.parsed_tag_default_factor)
+				size += self.parsed_tag_overhead + tagsize * factor
+		return size
+
+	def evict(self):
+		""" Remove least recently used entries exceeding the size limit """
+		with self.lock:
+			sizes = [(key, self.footprint(entry)) for key, entry in
+					 self._entries.iteritems()]
+			total = sum(size for key, size in sizes)
+			# Always keep the most recently used entry
+			for key, size in sizes[:-1]:
+				if total <= self.maxsize:
+					break
+				del self._entries[key]
+				self.evictions += 1
+				total -= size
+			return total
+
+	def stats(self):
+		""" Return dict with cache statistics """
+		with self.lock:
+			return {"entries": len(self._entries),
+					"size": sum(self.footprint(entry) for entry in
+								self._entries.itervalues()),
+					"maxsize": self.maxsize,
+					"hits": self.hits,
+					"misses": self.misses,
+					"evictions": self.evictions,
+					"invalidations": self.invalidations}
+
+
+def _changes_profile(method):
+	""" Decorator for ICCProfile methods which change the profile """
+	def changes_profile(self, *args, **kwargs):
+		# No longer reflects original profile
+		self._delfromcache()
+		return method(self, *args, **kwargs)
+	changes_profile.__name__ = method.__name__
+	changes_profile.__doc__ = method.__doc__
+	return changes_profile
+
+
+_iccprofilecache = ICCProfileCache()
+
+
+def set_cache_maxsize(maxsize):
+	""" Set the size limit in bytes of the in-memory profile cache """
+	_iccprofilecache.maxsize = maxsize
+	_iccprofilecache.evict()
 
 
 class ICCProfile(object):
@@ -5740,8 +6179,6 @@ class ICCProfile(object):
 	
 	"""
 
-	_recent = []
-
 	def __new__(cls, profile=None, load=True, use_cache=False):
 
 		key = None
@@ -5755,16 +6192,10 @@ class ICCProfile(object):
 					not os.path.sep in profile and
 					(not isinstance(os.path.altsep, basestring) or
 					 not os.path.altsep in profile)):
-					for path in iccprofiles_home + filter(lambda x: 
-						x not in iccprofiles_home, iccprofiles):
-						if os.path.isdir(path):
-							for path, dirs, files in os.walk(path):
-								path = os.path.join(path, profile)
-								if os.path.isfile(path):
-									profile = path
-									break
-							if profile == path:
-								break
+					import profileindex
+					path = profileindex.find(profile)
+					if path and os.path.isfile(path):
+						profile = path
 				if use_cache:
 					stat = os.stat(profile)
 					# NOTE under Python 2.x Windows, st_ino is always zero!
@@ -5790,15 +6221,7 @@ class ICCProfile(object):
 
 		self = super(ICCProfile, cls).__new__(cls)
 
-		if use_cache and key:
-			_iccprofilecache[key] = self
-
-			# Make sure most recent three are not garbage collected
-			if len(ICCProfile._recent) == 3:
-				ICCProfile._recent.pop(0)
-			ICCProfile._recent.append(self)
-
-		self._key = key
+		self._key = None
 		self.ID = "\0" * 16
 		self._data = ""
 		self._file = None
@@ -5964,6 +6387,10 @@ class ICCProfile(object):
 			
 			if load:
 				self.tags
+
+			if use_cache and key:
+				self._key = key
+				_iccprofilecache.put(key, self)
 		else:
 			self.set_defaults()
 
@@ -6202,6 +6629,7 @@ class ICCProfile(object):
 		if self._file and not self._file.closed:
 			self._file.close()
 
+	@_changes_profile
 	def convert_iccv4_tags_to_iccv2(self, version=2.4, undo_wtpt_chad=False):
 		"""
 		Convert ICCv4 parametric curve tags to ICCv2-compatible curve tags
@@ -6262,6 +6690,7 @@ class ICCProfile(object):
 				self.set_localizable_desc(tagname, unistr)
 		return True
 
+	@_changes_profile
 	def convert_iccv2_tags_to_iccv4(self):
 		"""
 		Convert ICCv2 text description tags to ICCv4 multi-localized unicode
@@ -6447,6 +6876,7 @@ class ICCProfile(object):
 		profile.calculateID()
 		return profile
 
+	@_changes_profile
 	def set_wtpt(self, wXYZ, cat="Bradford"):
 		"""
 		Set whitepoint, 'chad' tag (if >= v2.4 profile or CAT is not Bradford
@@ -6480,6 +6910,7 @@ class ICCProfile(object):
 		""" Return whether the profile has [rgb]TRC tags """
 		return not False in [channel + "TRC" in self.tags for channel in "rgb"]
 
+	@_changes_profile
 	def set_blackpoint(self, XYZbp):
 		if not "chad" in self.tags:
 			cat = self.guess_cat() or "Bradford"
@@ -6489,6 +6920,7 @@ class ICCProfile(object):
 		self.tags.bkpt = XYZType(tagSignature="bkpt", profile=self)
 		self.tags.bkpt.X, self.tags.bkpt.Y, self.tags.bkpt.Z = XYZbp
 
+	@_changes_profile
 	def apply_black_offset(self, XYZbp, power=40.0, include_A2B=True,
 						   set_blackpoint=True, logfiles=None,
 						   thread_abort=None, abortmessage="Aborted",
@@ -6538,6 +6970,7 @@ class ICCProfile(object):
 			for j in xrange(3):
 				self.tags["%sTRC" % "rgb"[j]][i] = min(max(rgb[j], 0), 1) * 65535
 	
+	@_changes_profile
 	def set_bt1886_trc(self, XYZbp, outoffset=0.0, gamma=2.4, gamma_type="B",
 					   size=None):
 		if gamma_type in ("b", "g"):
@@ -6568,6 +7001,7 @@ class ICCProfile(object):
 													0)
 		self.set_blackpoint(XYZbp)
 	
+	@_changes_profile
 	def set_dicom_trc(self, XYZbp, white_cdm2=100, size=1024):
 		"""
 		Set the response to the DICOM Grayscale Standard Display Function
@@ -6585,6 +7019,7 @@ class ICCProfile(object):
 		self.apply_black_offset([v / white_cdm2 for v in XYZbp],
 								40.0 * (white_cdm2 / 40.0))
 
+	@_changes_profile
 	def set_hlg_trc(self, XYZbp=(0, 0, 0), white_cdm2=100, system_gamma=1.2,
 					ambient_cdm2=5, maxsignal=1.0, size=1024,
 					blend_blackpoint=True):
@@ -6609,6 +7044,7 @@ class ICCProfile(object):
 			self.apply_black_offset([v / white_cdm2 for v in XYZbp],
 									40.0 * (white_cdm2 / 100.0))
 
+	@_changes_profile
 	def set_smpte2084_trc(self, XYZbp=(0, 0, 0), white_cdm2=100,
 						  master_black_cdm2=0, master_white_cdm2=10000,
 						  use_alternate_master_white_clip=True,
@@ -6638,6 +7074,7 @@ class ICCProfile(object):
 			self.apply_black_offset([v / white_cdm2 for v in XYZbp],
 									40.0 * (white_cdm2 / 100.0))
 
+	@_changes_profile
 	def set_trc_tags(self, identical=False, power=None):
 		for channel in "rgb":
 			if identical and channel != "r":
@@ -6649,6 +7086,7 @@ class ICCProfile(object):
 												 power >= 0 else 1024)
 			self.tags["%sTRC" % channel] = tag
 	
+	@_changes_profile
 	def set_localizable_desc(self, tagname, description, languagecode="en",
 							 countrycode="US"):
 		# Handle ICCv2 <> v4 differences and encoding
@@ -6665,6 +7103,7 @@ class ICCProfile(object):
 			self.set_localizable_text(tagname, description, languagecode,
 									  countrycode)
 
+	@_changes_profile
 	def set_localizable_text(self, tagname, text, languagecode="en",
 							 countrycode="US"):
 		# Handle ICCv2 <> v4 differences and encoding
@@ -6677,16 +7116,20 @@ class ICCProfile(object):
 			self.tags[tagname].add_localized_string(languagecode,
 													   countrycode, text)
 
+	@_changes_profile
 	def setCopyright(self, copyright, languagecode="en", countrycode="US"):
 		self.set_localizable_text("cprt", copyright, languagecode, countrycode)
 
+	@_changes_profile
 	def setDescription(self, description, languagecode="en", countrycode="US"):
 		self.set_localizable_desc("desc", description, languagecode, countrycode)
 
+	@_changes_profile
 	def setDeviceManufacturerDescription(self, description, languagecode="en",
 										 countrycode="US"):
 		self.set_localizable_desc("dmnd", description, languagecode, countrycode)
 
+	@_changes_profile
 	def setDeviceModelDescription(self, description, languagecode="en",
 								  countrycode="US"):
 		self.set_localizable_desc("dmdd", description, languagecode, countrycode)
@@ -7241,6 +7684,7 @@ class ICCProfile(object):
 												cat=cat)
 					return XYZbp
 
+	@_changes_profile
 	def optimize(self, return_bytes_saved=False, update_ID=True):
 		"""
 		Optimize the tag data so that shared tags are only recorded once.
@@ -7283,6 +7727,7 @@ class ICCProfile(object):
 		"""
 		self.__init__(profile)
 	
+	@_changes_profile
 	def set_edid_metadata(self, edid):
 		"""
 		Sets metadata from EDID
@@ -7332,6 +7777,7 @@ class ICCProfile(object):
 		# GCM keys
 		self.tags.meta["EDID_md5"] = edid["hash"]
 	
+	@_changes_profile
 	def set_gamut_metadata(self, gamut_volume=None, gamut_coverage=None):
 		""" Sets gamut volume and coverage metadata keys """
 		if gamut_volume or gamut_coverage:
@@ -7351,6 +7797,7 @@ class ICCProfile(object):
 				for key, factor in gamut_coverage.iteritems():
 					self.tags.meta["GAMUT_coverage(%s)" % key] = factor
 	
+	@_changes_profile
 	def write(self, stream_or_filename=None):
 		"""
 		Write profile to stream.
@@ -7374,19 +7821,7 @@ class ICCProfile(object):
 		if isinstance(stream_or_filename, basestring):
 			stream.close()
 
-	def __getattribute__(self, name):
-		if (name == "write" or
-			name.startswith("set") or
-			name.startswith("apply")):
-			# No longer reflects original profile
-			self._delfromcache()
-		return object.__getattribute__(self, name)
-
 	def _delfromcache(self):
-		# Make doubly sure to remove ourself from the cache
-		if self._key and self._key in _iccprofilecache:
-			try:
-				del _iccprofilecache[self._key]
-			except KeyError:
-				# GC was faster
-				pass
+		if self._key:
+			_iccprofilecache.remove(self._key)
+			self._key = None
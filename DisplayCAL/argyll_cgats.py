@@ -506,7 +506,8 @@ def ti3_to_ti1(ti3_data):
 	ti3_data can be a file object, a list of strings or a string holding the data.
 	
 	"""
-	ti3 = CGATS.CGATS(ti3_data)
+	# Only keywords are changed, so DATA can stay unparsed
+	ti3 = CGATS.CGATS(ti3_data, columnar=CGATS.COLUMNAR_MIN_ROWS)
 	if not ti3:
 		return ""
 	ti3[0].type = "CTI1"
@@ -8,6 +8,7 @@ In most cases, unless otherwise stated RGB is R'G'B' (gamma-compressed)
 
 """
 
+from bisect import bisect_left
 import colorsys
 import logging
 import math
@@ -299,6 +300,89 @@ class HLG(object):
 		R, G, B = [self.oetf(v) for v in (R, G, B)]
 		return R, G, B
 
+	def oetf_array(self, v, inverse=False):
+		""" Array version of oetf """
+		import numpy
+		v = numpy.asarray(v, dtype=numpy.float64)
+		a = 0.17883277
+		b = 1 - 4 * a
+		c = 0.5 - a * math.log(4 * a)
+		with numpy.errstate(invalid="ignore", divide="ignore", over="ignore"):
+			if inverse:
+				E = numpy.where((0 <= v) & (v <= 1 / 2.), numpy.power(v, 2) / 3.,
+								(numpy.exp((v - c) / a) + b) / 12.)
+			else:
+				E = numpy.where((0 <= v) & (v <= 1 / 12.), numpy.sqrt(3 * v),
+								a * numpy.log(12 * v - b) + c)
+		return numpy.where(v == 1, 1.0, E)
+
+	def eotf_array(self, v, inverse=False, apply_black_offset=True):
+		"""
+		Array version of eotf for gray values (i.e. like passing a single
+		number to eotf)
+		
+		"""
+		if inverse:
+			return self.oetf_array(self.ootf_array(v, True,
+												   apply_black_offset))
+		return self.ootf_array(self.oetf_array(v, True), False,
+							   apply_black_offset)
+
+	def ootf_array(self, v, inverse=False, apply_black_offset=True):
+		"""
+		Array version of ootf for gray values (i.e. like passing a single
+		number to ootf)
+		
+		"""
+		import numpy
+		v = numpy.asarray(v, dtype=numpy.float64)
+		if apply_black_offset:
+			black_cdm2 = float(self.black_cdm2)
+		else:
+			black_cdm2 = 0
+		alpha = (self.white_cdm2 - black_cdm2) / self.white_cdm2
+		beta = black_cdm2 / self.white_cdm2
+		gamma = self.gamma
+		Y = 0.2627 * v + 0.6780 * v + 0.0593 * v
+		with numpy.errstate(invalid="ignore", divide="ignore"):
+			if inverse:
+				return numpy.where(Y > beta,
+								   numpy.power((Y - beta) / alpha,
+											   (1 - gamma) / gamma) *
+								   ((v - beta) / alpha), 0.0)
+			Y = numpy.where(Y != 0, numpy.power(Y, gamma - 1), Y)
+		return alpha * Y * v + beta
+
+	def RGB2XYZ_array(self, RGB, apply_black_offset=True):
+		""" Array version of RGB2XYZ """
+		import numpy
+		X, Y, Z = self.rgb_space[-1] * list(_split(self.oetf_array(RGB, True)))
+		X, Y, Z = (numpy.where(v < 0, 0.0, v) for v in (X, Y, Z))
+		Yy = self.ootf_array(Y, apply_black_offset=False)
+		with numpy.errstate(invalid="ignore", divide="ignore"):
+			X, Y, Z = (numpy.where(Y, v / Y * Yy, w * Yy)
+					   for v, w in zip((X, Y, Z), self.rgb_space[1]))
+		if apply_black_offset:
+			beta = self.ootf(0)
+			bp_out = [v * beta for v in self.rgb_space[1]]
+			X, Y, Z = apply_bpc(X, Y, Z, (0, 0, 0), bp_out, self.rgb_space[1])
+		return _stack(X, Y, Z)
+
+	def XYZ2RGB_array(self, XYZ, apply_black_offset=True):
+		""" Array version of XYZ2RGB """
+		import numpy
+		X, Y, Z = _split(XYZ)
+		if apply_black_offset:
+			beta = self.ootf(0)
+			bp_in = [v * beta for v in self.rgb_space[1]]
+			X, Y, Z = apply_bpc(X, Y, Z, bp_in, (0, 0, 0), self.rgb_space[1])
+		Yy = self.ootf_array(Y, True, apply_black_offset=False)
+		with numpy.errstate(invalid="ignore", divide="ignore"):
+			X, Y, Z = (numpy.where(Y, v / Y * Yy, v) for v in (X, Y, Z))
+		R, G, B = self.rgb_space[-1].inverted() * (X, Y, Z)
+		return self.oetf_array(_stack(*(numpy.where(v < 0, 0.0, v)
+										for v in (R, G, B))))
+
 
 rgb_spaces = {
 	# http://brucelindbloom.com/WorkingSpaceInfo.html
@@ -2286,6 +2370,575 @@ def XYZ2xyY(X, Y, Z, whitepoint=None):
 	return x, y, Y
 
 
+# Array variants
+#
+# The following functions accept NumPy arrays (or nested sequences) of shape
+# (..., 3) and return arrays of the same shape. They follow the operation
+# order of their scalar counterparts, so results are bit-identical.
+# Transfer functions passed as eotf/oetf are called with arrays.
+
+
+def _split(values):
+	import numpy
+	values = numpy.asarray(values, dtype=numpy.float64)
+	return values[..., 0], values[..., 1], values[..., 2]
+
+
+def _stack(*components):
+	import numpy
+	return numpy.concatenate([numpy.asarray(v, dtype=numpy.float64)[..., None]
+							  for v in numpy.broadcast_arrays(*components)],
+							 axis=-1)
+
+
+def specialpow_array(a, b, slope_limit=0):
+	""" Array version of specialpow """
+	import numpy
+	a = numpy.asarray(a, dtype=numpy.float64)
+	with numpy.errstate(invalid="ignore", divide="ignore"):
+		if b >= 0.0:
+			# Power curve
+			v = numpy.where(a < 0.0, -numpy.power(-a, b), numpy.power(a, b))
+			if slope_limit:
+				limit = a / slope_limit
+				v = numpy.where(a < 0.0,
+								numpy.where(limit < v, limit, v),
+								numpy.where(limit > v, limit, v))
+			return v
+		negative = a < 0.0
+		signScale = numpy.where(negative, -1.0, 1.0)
+		a = numpy.where(negative, -a, a)
+		if b in (1.0 / -601, 1.0 / -709):
+			# XYZ -> RGB, Rec. 601/709 TRC
+			v = numpy.where(a < REC709_K0 / REC709_P, a * REC709_P,
+							1.099 * numpy.power(a, 0.45) - 0.099)
+		elif b == 1.0 / -240:
+			# XYZ -> RGB, SMPTE 240M TRC
+			v = numpy.where(a < SMPTE240M_K0 / SMPTE240M_P, a * SMPTE240M_P,
+							1.1115 * numpy.power(a, 0.45) - 0.1115)
+		elif b == 1.0 / -3.0:
+			# XYZ -> RGB, L* TRC
+			v = numpy.where(a <= LSTAR_E, 0.01 * a * LSTAR_K,
+							1.16 * numpy.power(a, 1.0 / 3.0) - 0.16)
+		elif b == 1.0 / -2.4:
+			# XYZ -> RGB, sRGB TRC
+			v = numpy.where(a <= SRGB_K0 / SRGB_P, a * SRGB_P,
+							1.055 * numpy.power(a, 1.0 / 2.4) - 0.055)
+		elif b == 1.0 / -2084:
+			# XYZ -> RGB, SMPTE 2084 (PQ)
+			v = numpy.power((2413.0 * numpy.power(a, SMPTE2084_M1) + 107) /
+							(2392.0 * numpy.power(a, SMPTE2084_M1) + 128),
+							SMPTE2084_M2)
+		elif b == -2.4:
+			# RGB -> XYZ, sRGB TRC
+			v = numpy.where(a <= SRGB_K0, a / SRGB_P,
+							numpy.power((a + 0.055) / 1.055, 2.4))
+		elif b == -3.0:
+			# RGB -> XYZ, L* TRC
+			v = numpy.where(a <= 0.08, 100.0 * a / LSTAR_K,
+							numpy.power((a + 0.16) / 1.16, 3.0))
+		elif b == -240:
+			# RGB -> XYZ, SMPTE 240M TRC
+			v = numpy.where(a < SMPTE240M_K0, a / SMPTE240M_P,
+							numpy.power((0.1115 + a) / 1.1115, 1.0 / 0.45))
+		elif b in (-601, -709):
+			# RGB -> XYZ, Rec. 601/709 TRC
+			v = numpy.where(a < REC709_K0, a / REC709_P,
+							numpy.power((a + .099) / 1.099, 1.0 / 0.45))
+		elif b == -2084:
+			# RGB -> XYZ, SMPTE 2084 (PQ)
+			v = numpy.power(a, 1.0 / SMPTE2084_M2) - SMPTE2084_C1
+			v = numpy.where(0 > v, 0.0, v)
+			v = numpy.power(v / (SMPTE2084_C2 - SMPTE2084_C3 *
+								 numpy.power(a, 1.0 / SMPTE2084_M2)),
+							1.0 / SMPTE2084_M1)
+		else:
+			raise ValueError("Invalid gamma %r" % b)
+	return v * signScale
+
+
+def adapt_array(XYZ, whitepoint_source=None, whitepoint_destination=None,
+				cat="Bradford"):
+	""" Array version of adapt """
+	return _stack(*wp_adaption_matrix(whitepoint_source,
+									  whitepoint_destination, cat) *
+				  _split(XYZ))
+
+
+def apply_bpc_array(XYZ, bp_in=None, bp_out=None, wp_out="D50"):
+	""" Array version of apply_bpc (without weight and pin_chromaticity) """
+	if not bp_in:
+		bp_in = (0, 0, 0)
+	if not bp_out:
+		bp_out = (0, 0, 0)
+	wp_out = get_whitepoint(wp_out)
+	XYZ = list(_split(XYZ))
+	for i, v in enumerate(XYZ):
+		XYZ[i] = ((wp_out[i] - bp_out[i]) * v - wp_out[i] * (bp_in[i] - bp_out[i])) / (wp_out[i] - bp_in[i])
+	return _stack(*XYZ)
+
+
+def blend_ab_array(XYZ, bp, wp, power=40.0, signscale=1):
+	""" Array version of blend_ab """
+	import numpy
+	L, a, b = _split(XYZ2Lab_array(XYZ, whitepoint=wp))
+	bpL, bpa, bpb = XYZ2Lab(*bp, whitepoint=wp)
+	if bpL == 100:
+		raise ValueError("Black L* is 100!")
+	vv = (L - bpL) / (100.0 - bpL)  # 0 at bp, 1 at wp
+	vv = 1.0 - vv  # 1 at bp, 0 at wp
+	vv = numpy.where(vv < 0.0, 0.0, numpy.where(vv > 1.0, 1.0, vv))
+	vv = numpy.power(vv, power) * signscale
+	a = a + vv * bpa
+	b = b + vv * bpb
+	XYZ_blended = Lab2XYZ_array(_stack(L, a, b), whitepoint=wp)
+	return numpy.where((_split(XYZ)[1] < 0)[..., None], 0.0, XYZ_blended)
+
+
+def blend_blackpoint_array(XYZ, bp_in=None, bp_out=None, wp=None, power=40.0):
+	""" Array version of blend_blackpoint (without pin_chromaticity) """
+
+	wp = get_whitepoint(wp)
+
+	for i, bp in enumerate((bp_in, bp_out)):
+		if not bp or tuple(bp) == (0, 0, 0):
+			continue
+		bp_wp = tuple(v / wp[1] * bp[1] for v in wp)
+		if i == 0:
+			XYZ = blend_ab_array(XYZ, bp, wp, power, -1)
+			XYZ = apply_bpc_array(XYZ, bp_wp, None, wp)
+		else:
+			XYZ = apply_bpc_array(XYZ, None, bp_wp, wp)
+			XYZ = blend_ab_array(XYZ, bp, wp, power, 1)
+
+	return XYZ
+
+
+def delta_array(Lab1, Lab2, method="1976", p1=None, p2=None, p3=None,
+				cie94_use_symmetric_chrominance=True):
+	"""
+	Array version of delta
+	
+	Returns a dictionary of arrays with the shape of the input minus the last
+	axis.
+	
+	"""
+	import numpy
+	L1, a1, b1 = _split(Lab1)
+	L2, a2, b2 = _split(Lab2)
+	pow, sqrt = numpy.power, numpy.sqrt
+	cos, sin = numpy.cos, numpy.sin
+	degrees, radians = numpy.degrees, numpy.radians
+	if isinstance(method, basestring):
+		method = method.lower()
+	else:
+		method = str(int(method))
+	with numpy.errstate(invalid="ignore", divide="ignore"):
+		if method in ("94", "1994", "cie94", "cie1994"):
+			textiles = p1
+			dL = L2 - L1
+			C1 = sqrt(pow(a1, 2) + pow(b1, 2))
+			C2 = sqrt(pow(a2, 2) + pow(b2, 2))
+			dC = C2 - C1
+			dH2 = pow(a1 - a2, 2) + pow(b1 - b2, 2) - pow(dC, 2)
+			dH = numpy.where(dH2 > 0, sqrt(dH2), 0.0)
+			SL = 1.0
+			K1 = 0.048 if textiles else 0.045
+			K2 = 0.014 if textiles else 0.015
+			if cie94_use_symmetric_chrominance:
+				C_ = sqrt(C1 * C2)
+			else:
+				C_ = C1
+			SC = 1.0 + K1 * C_
+			SH = 1.0 + K2 * C_
+			KL = 2.0 if textiles else 1.0
+			KC = 1.0
+			KH = 1.0
+			dLw, dCw, dHw = dL / (KL * SL), dC / (KC * SC), dH / (KH * SH)
+			dE = sqrt(pow(dLw, 2) + pow(dCw, 2) + pow(dHw, 2))
+		elif method in ("cmc(2:1)", "cmc21", "cmc(1:1)", "cmc11", "cmc"):
+			if method in ("cmc(2:1)", "cmc21"):
+				p1 = 2.0
+			l = p1 if isinstance(p1, (float, int)) else 1.0
+			c = p2 if isinstance(p2, (float, int)) else 1.0
+			dL = L2 - L1
+			C1 = sqrt(pow(a1, 2) + pow(b1, 2))
+			C2 = sqrt(pow(a2, 2) + pow(b2, 2))
+			dC = C2 - C1
+			dH2 = pow(a1 - a2, 2) + pow(b1 - b2, 2) - pow(dC, 2)
+			dH = numpy.where(dH2 > 0, sqrt(dH2), 0.0)
+			SL = numpy.where(L1 < 16, 0.511,
+							 (0.040975 * L1) / (1 + 0.01765 * L1))
+			SC = (0.0638 * C1) / (1 + 0.0131 * C1) + 0.638
+			F = sqrt(pow(C1, 4) / (pow(C1, 4) + 1900.0))
+			H1 = degrees(numpy.arctan2(b1, a1)) + numpy.where(b1 >= 0, 0,
+															  360.0)
+			T = numpy.where((164 <= H1) & (H1 <= 345),
+							0.56 + abs(0.2 * cos(radians(H1 + 168.0))),
+							0.36 + abs(0.4 * cos(radians(H1 + 35))))
+			SH = SC * (F * T + 1 - F)
+			dLw, dCw, dHw = dL / (l * SL), dC / (c * SC), dH / SH
+			dE = sqrt(pow(dLw, 2) + pow(dCw, 2) + pow(dHw, 2))
+		elif method in ("00", "2k", "2000", "cie00", "cie2k", "cie2000"):
+			pow25_7 = math.pow(25, 7)
+			k_L = p1 if isinstance(p1, (float, int)) else 1.0
+			k_C = p2 if isinstance(p2, (float, int)) else 1.0
+			k_H = p3 if isinstance(p3, (float, int)) else 1.0
+			C1 = sqrt(pow(a1, 2) + pow(b1, 2))
+			C2 = sqrt(pow(a2, 2) + pow(b2, 2))
+			C_avg = (C1 + C2) / 2
+			G = .5 * (1 - sqrt(pow(C_avg, 7) / (pow(C_avg, 7) + pow25_7)))
+			L1_ = L1
+			a1_ = (1 + G) * a1
+			b1_ = b1
+			L2_ = L2
+			a2_ = (1 + G) * a2
+			b2_ = b2
+			C1_ = sqrt(pow(a1_, 2) + pow(b1_, 2))
+			C2_ = sqrt(pow(a2_, 2) + pow(b2_, 2))
+			h1_ = numpy.where((a1_ == 0) & (b1_ == 0), 0.0,
+							  degrees(numpy.arctan2(b1_, a1_)) +
+							  numpy.where(b1_ >= 0, 0, 360.0))
+			h2_ = numpy.where((a2_ == 0) & (b2_ == 0), 0.0,
+							  degrees(numpy.arctan2(b2_, a2_)) +
+							  numpy.where(b2_ >= 0, 0, 360.0))
+			dh_ = numpy.where(h2_ - h1_ > 180, h2_ - h1_ - 360.0,
+							  numpy.where(h2_ - h1_ < -180,
+										  h2_ + 360.0 - h1_, h2_ - h1_))
+			dL_ = L2_ - L1_
+			dL = dL_
+			dC_ = C2_ - C1_
+			dC = dC_
+			dH_ = 2 * sqrt(C1_ * C2_) * sin(radians(dh_ / 2.0))
+			dH = dH_
+			L__avg = (0 + L1_ + L2_) / 2
+			C__avg = (C1_ + C2_) / 2
+			h_avg = (h1_ + h2_) / 2
+			h__avg = numpy.where(C1_ * C2_ == 0, h1_ + h2_,
+								 numpy.where(abs(h2_ - h1_) <= 180, h_avg,
+											 numpy.where(h2_ + h1_ < 360,
+														 h_avg + 180.0,
+														 h_avg - 180.0)))
+			AB = pow(L__avg - 50.0, 2)  # (L'_ave-50)^2
+			S_L = 1 + .015 * AB / sqrt(20.0 + AB)
+			S_C = 1 + .045 * C__avg
+			T = (1 - .17 * cos(radians(h__avg - 30.0)) + .24 * cos(radians(2.0 * h__avg)) + .32 * cos(radians(3.0 * h__avg + 6.0))
+				 - .2 * cos(radians(4 * h__avg - 63.0)))
+			S_H = 1 + .015 * C__avg * T
+			dTheta = 30.0 * numpy.exp(-1 * pow((h__avg - 275.0) / 25.0, 2))
+			R_C = 2.0 * sqrt(pow(C__avg, 7) / (pow(C__avg, 7) + pow25_7))
+			R_T = -sin(radians(2.0 * dTheta)) * R_C
+			AJ = dL_ / S_L / k_L  # dL' / k_L / S_L
+			AK = dC_ / S_C / k_C  # dC' / k_C / S_C
+			AL = dH_ / S_H / k_H  # dH' / k_H / S_H
+			dLw, dCw, dHw = AJ, AK, AL
+			dE = sqrt(pow(AJ, 2) + pow(AK, 2) + pow(AL, 2) + R_T * AK * AL)
+		else:
+			# dE 1976
+			dL = L2 - L1
+			C1 = sqrt(pow(a1, 2) + pow(b1, 2))
+			C2 = sqrt(pow(a2, 2) + pow(b2, 2))
+			dC = C2 - C1
+			dH2 = pow(a1 - a2, 2) + pow(b1 - b2, 2) - pow(dC, 2)
+			dH = numpy.where(dH2 > 0, sqrt(dH2), 0.0)
+			dLw, dCw, dHw = dL, dC, dH
+			dE = sqrt(pow(dL, 2) + pow(a1 - a2, 2) + pow(b1 - b2, 2))
+
+	return {"E": dE,
+			"L": dL,
+			"C": dC,
+			"H": dH,
+			"a": a1 - a2,
+			"b": b1 - b2,
+			# Weighted
+			"Lw": dLw,
+			"Cw": dCw,
+			"Hw": dHw}
+
+
+def Lab2XYZ_array(Lab, whitepoint=None, scale=1.0):
+	""" Array version of Lab2XYZ """
+	import numpy
+	L, a, b = _split(Lab)
+	fy = (L + 16) / 116.0
+	fx = a / 500.0 + fy
+	fz = fy - b / 200.0
+
+	fx3 = numpy.power(fx, 3.0)
+	xr = numpy.where(fx3 > LSTAR_E, fx3, (116.0 * fx - 16) / LSTAR_K)
+	yr = numpy.where(L > LSTAR_K * LSTAR_E, numpy.power(fy, 3.0),
+					 L / LSTAR_K)
+	fz3 = numpy.power(fz, 3.0)
+	zr = numpy.where(fz3 > LSTAR_E, fz3, (116.0 * fz - 16) / LSTAR_K)
+
+	Xr, Yr, Zr = get_whitepoint(whitepoint, scale)
+
+	return _stack(xr * Xr, yr * Yr, zr * Zr)
+
+
+def XYZ2Lab_array(XYZ, whitepoint=None, scale=100):
+	""" Array version of XYZ2Lab """
+	import numpy
+	Xr, Yr, Zr = get_whitepoint(whitepoint, scale)
+
+	X, Y, Z = _split(XYZ)
+	f = []
+	for vr in (X / Xr, Y / Yr, Z / Zr):
+		with numpy.errstate(invalid="ignore"):
+			f.append(numpy.where(vr > LSTAR_E, numpy.power(vr, 1.0 / 3.0),
+								 (LSTAR_K * vr + 16) / 116.0))
+	fx, fy, fz = f
+	L = 116 * fy - 16
+	a = 500 * (fx - fy)
+	b = 200 * (fy - fz)
+
+	return _stack(L, a, b)
+
+
+def XYZ2RGB_array(XYZ, rgb_space=None, scale=1.0, round_=False, clamp=True,
+				  oetf=None):
+	""" Array version of XYZ2RGB """
+	import numpy
+	trc, whitepoint, rxyY, gxyY, bxyY, matrix = get_rgb_space(rgb_space)
+	RGB = matrix.inverted() * _split(XYZ)
+	is_trc = isinstance(trc, (list, tuple))
+	for i, v in enumerate(RGB):
+		if is_trc:
+			gamma = trc[i]
+		else:
+			gamma = trc
+		if clamp:
+			v = numpy.where(v > 0.0, v, 0.0)
+			v = numpy.where(v < 1.0, v, 1.0)
+		if oetf:
+			RGB[i] = oetf(v)
+		elif isinstance(gamma, (list, tuple)):
+			key = id(gamma)
+			if not key in XYZ2RGB.interp:
+				ginterp = Interp(gamma, [n / float(len(gamma) - 1) for n in
+									     xrange(len(gamma))], use_numpy=True)
+				XYZ2RGB.interp[key] = ginterp
+			else:
+				ginterp = XYZ2RGB.interp[key]
+			RGB[i] = ginterp(v)
+		else:
+			RGB[i] = specialpow_array(v, 1.0 / gamma)
+		RGB[i] = RGB[i] * scale
+		if round_ is not False:
+			RGB[i] = numpy.vectorize(lambda v: round(v, round_),
+									 otypes=[numpy.float64])(RGB[i])
+	return _stack(*RGB)
+
+
+def XYZ2ICtCp_array(XYZ, clamp=False, oetf=None):
+	""" Array version of XYZ2ICtCp (oetf defaults to SMPTE 2084) """
+	import numpy
+	R, G, B = get_rgb_space("Rec. 2020")[-1].inverted() * _split(XYZ)
+	if clamp:
+		R, G, B = (numpy.where(v < 1.0, v, 1.0) for v in
+				   (numpy.where(v > 0.0, v, 0.0) for v in (R, G, B)))
+	if not oetf:
+		oetf = lambda FD: specialpow_array(FD, 1.0 / -2084)
+	LMS = LinearRGB2LMS_matrix * (R, G, B)
+	L_, M_, S_ = (oetf(FD) for FD in LMS)
+	return _stack(*L_M_S_2ICtCp_matrix * (L_, M_, S_))
+
+
+def ICtCp2XYZ_array(ICtCp, eotf=None):
+	""" Array version of ICtCp2XYZ (eotf defaults to SMPTE 2084) """
+	if not eotf:
+		eotf = lambda v: specialpow_array(v, -2084)
+	L_M_S_ = ICtCp2L_M_S__matrix * _split(ICtCp)
+	L, M, S = (eotf(v) for v in L_M_S_)
+	R, G, B = LMS2LinearRGB_matrix * (L, M, S)
+	return _stack(*get_rgb_space("Rec. 2020")[-1] * (R, G, B))
+
+
+def HSV2RGB_array(HSV, scale=1.0):
+	""" Array version of HSV2RGB """
+	import numpy
+	H, S, V = _split(HSV)
+	i = numpy.trunc(H * 6.0)
+	f = (H * 6.0) - i
+	p = V * (1.0 - S)
+	q = V * (1.0 - S * f)
+	t = V * (1.0 - S * (1.0 - f))
+	i = numpy.mod(i, 6)
+	sextant = [i == n for n in xrange(5)]
+	R = numpy.select(sextant, [V, q, p, p, t], V)
+	G = numpy.select(sextant, [t, V, V, q, p], p)
+	B = numpy.select(sextant, [p, p, t, V, V], q)
+	gray = S == 0.0
+	return _stack(*(numpy.where(gray, V, v) * scale for v in (R, G, B)))
+
+
+def LCHab2Lab_array(LCH):
+	""" Array version of LCHab2Lab """
+	import numpy
+	L, C, H = _split(LCH)
+	a = C * numpy.cos(H * math.pi / 180.0)
+	b = C * numpy.sin(H * math.pi / 180.0)
+	return _stack(L, a, b)
+
+
+def Lab2LCHab_array(Lab):
+	""" Array version of Lab2LCHab """
+	import numpy
+	L, a, b = _split(Lab)
+	C = numpy.sqrt(numpy.power(a, 2) + numpy.power(b, 2))
+	H = 180.0 * numpy.arctan2(b, a) / math.pi
+	H = numpy.where(H < 0.0, H + 360.0, H)
+	return _stack(L, C, H)
+
+
+def RGB2HSI_array(RGB, scale=1.0):
+	""" Array version of RGB2HSI """
+	import numpy
+	R, G, B = _split(RGB)
+	I = (R + G + B) / 3.0
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		S = numpy.where(I != 0, 1 - numpy.minimum(numpy.minimum(R, G), B) / I,
+						0.0)
+	H = numpy.arctan2(math.sqrt(3) * (G - B), 2 * R - G - B) / math.pi / 2
+	H = numpy.where(H < 0, H + 1.0, H)
+	H = numpy.where(H > 1, H - 1.0, H)
+	H = numpy.where((R == G) & (G == B), 0.0, H)
+	return _stack(H * scale, S * scale, I * scale)
+
+
+def RGB2HSL_array(RGB, scale=1.0):
+	""" Array version of RGB2HSL """
+	import numpy
+	R, G, B = _split(RGB)
+	maxc = numpy.maximum(numpy.maximum(R, G), B)
+	minc = numpy.minimum(numpy.minimum(R, G), B)
+	gray = minc == maxc
+	L = (minc + maxc) / 2.0
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		S = numpy.where(L <= 0.5, (maxc - minc) / (maxc + minc),
+						(maxc - minc) / (2.0 - maxc - minc))
+		rc = (maxc - R) / (maxc - minc)
+		gc = (maxc - G) / (maxc - minc)
+		bc = (maxc - B) / (maxc - minc)
+	H = numpy.where(R == maxc, bc - gc,
+					numpy.where(G == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+	H = numpy.mod(H / 6.0, 1.0)
+	return _stack(numpy.where(gray, 0.0, H) * scale,
+				  numpy.where(gray, 0.0, S) * scale, L * scale)
+
+
+def RGB2HSV_array(RGB, scale=1.0):
+	""" Array version of RGB2HSV """
+	import numpy
+	R, G, B = _split(RGB)
+	maxc = numpy.maximum(numpy.maximum(R, G), B)
+	minc = numpy.minimum(numpy.minimum(R, G), B)
+	gray = minc == maxc
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		S = (maxc - minc) / maxc
+		rc = (maxc - R) / (maxc - minc)
+		gc = (maxc - G) / (maxc - minc)
+		bc = (maxc - B) / (maxc - minc)
+	H = numpy.where(R == maxc, bc - gc,
+					numpy.where(G == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+	H = numpy.mod(H / 6.0, 1.0)
+	return _stack(numpy.where(gray, 0.0, H) * scale,
+				  numpy.where(gray, 0.0, S) * scale, maxc * scale)
+
+
+def RGB2XYZ_array(RGB, rgb_space=None, scale=1.0, eotf=None):
+	""" Array version of RGB2XYZ """
+	import numpy
+	trc, whitepoint, rxyY, gxyY, bxyY, matrix = get_rgb_space(rgb_space)
+	RGB = list(_split(RGB))
+	is_trc = isinstance(trc, (list, tuple))
+	for i, v in enumerate(RGB):
+		if is_trc:
+			gamma = trc[i]
+		else:
+			gamma = trc
+		if eotf:
+			RGB[i] = eotf(v)
+		elif isinstance(gamma, (list, tuple)):
+			RGB[i] = numpy.interp(v, [n / float(len(gamma) - 1) for n in
+									  xrange(len(gamma))], gamma)
+		else:
+			RGB[i] = specialpow_array(v, gamma)
+	XYZ = matrix * RGB
+	return _stack(*(v * scale for v in XYZ))
+
+
+def RGB2Lab_array(RGB, rgb_space=None, whitepoint=None, noadapt=False,
+				  cat="Bradford"):
+	""" Array version of RGB2Lab """
+	XYZ = RGB2XYZ_array(RGB, rgb_space, scale=100)
+	if not noadapt:
+		rgb_space = get_rgb_space(rgb_space)
+		XYZ = adapt_array(XYZ, rgb_space[1], whitepoint, cat)
+	return XYZ2Lab_array(XYZ, whitepoint=whitepoint)
+
+
+def XYZ2xyY_array(XYZ, whitepoint=None):
+	""" Array version of XYZ2xyY """
+	import numpy
+	X, Y, Z = _split(XYZ)
+	black = X + Y + Z == 0
+	wx, wy, wY = XYZ2xyY(*get_whitepoint(whitepoint))
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		x = X / (X + Y + Z)
+		y = Y / (X + Y + Z)
+	return _stack(numpy.where(black, wx, x), numpy.where(black, wy, y),
+				  numpy.where(black, 0.0, Y))
+
+
+def xyY2XYZ_array(xyY):
+	""" Array version of xyY2XYZ """
+	import numpy
+	x, y, Y = _split(xyY)
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		X = (x * Y) / y
+		Z = ((1 - x - y) * Y) / y
+	black = y == 0
+	return _stack(*(numpy.where(black, 0.0, v) for v in (X, Y, Z)))
+
+
+def smooth_avg_array(values, passes=1, window=None, protect=None, axis=-1):
+	"""
+	Array version of smooth_avg
+
+	Smooths along the given axis of an N-dimensional array. protect is
+	an optional boolean array (broadcastable to values) which is True for
+	values that should be left unchanged.
+
+	"""
+	import numpy
+	if not window or len(window) < 3 or len(window) % 2 != 1:
+		if window:
+			warnings.warn("Invalid window %r, size %i - using default (1, 1, 1)" %
+						  (window, len(window)), Warning)
+		window = (1.0, 1.0, 1.0)
+	values = numpy.array(values, dtype=numpy.float64).swapaxes(axis, -1)
+	if protect is not None:
+		protect = numpy.broadcast_arrays(values.swapaxes(axis, -1),
+										 protect)[1].swapaxes(axis, -1)
+	n = values.shape[-1]
+	tl = (len(window) - 1) // 2
+	for x in xrange(0, passes):
+		data = values.copy()
+		for j in xrange(1, n - 1):
+			# Shrink window symmetrically near the ends
+			t = min(tl, j, n - 1 - j)
+			tmpwindow = window[tl - t:tl + t + 1]
+			windowsize = 0
+			for k, weight in enumerate(tmpwindow):
+				windowsize = windowsize + float(weight) * values[..., j - t + k]
+			data[..., j] = windowsize / sum(tmpwindow)
+		if protect is not None:
+			data = numpy.where(protect, values, data)
+		values = data
+	return values.swapaxes(axis, -1)
+
+
 def xy_CCT_delta(x, y, daylight=True, method=2000):
 	""" Return CCT and delta to locus """
 	cct = xyY2CCT(x, y)
@@ -2813,7 +3466,25 @@ class gam_fits(object):
 
 class Interp(object):
 
-	def __init__(self, xp, fp, left=None, right=None, use_numpy=False):
+	"""
+	One-dimensional linear interpolation (see interp)
+	
+	If xp is monotonically increasing, the breakpoints are searched using
+	binary search instead of scanning all of xp. Results are identical to
+	interp. With use_numpy, numpy.interp is used instead.
+	
+	Passing a list or array of values returns an array (this uses NumPy).
+	
+	Scalar results are memoized. 'cachesize' bounds the number of memoized
+	values (least recently used values are discarded first), None means
+	unbounded, 0 disables the memo.
+	
+	"""
+
+	cachesize = 4096
+
+	def __init__(self, xp, fp, left=None, right=None, use_numpy=False,
+				 cachesize=None):
 		if use_numpy:
 			# Use numpy for speed
 			import numpy
@@ -2824,20 +3495,103 @@ class Interp(object):
 		self.fp = fp
 		self.left = left
 		self.right = right
-		self.lookup = {}
 		self.use_numpy = use_numpy
+		if cachesize is not None:
+			self.cachesize = cachesize
+		if use_numpy:
+			self.monotonic = bool(numpy.all(numpy.diff(xp) >= 0))
+		else:
+			self.monotonic = all(xp[i] <= xp[i + 1]
+								 for i in xrange(len(xp) - 1))
+		self._arrays = None
+		self.clear_cache()
 
 	def __call__(self, x):
-		if not x in self.lookup:
-			self.lookup[x] = self._interp(x)
-		return self.lookup[x]
+		if isinstance(x, (list, tuple)) or getattr(x, "ndim", 0):
+			return self._interp_array(x)
+		if x in self.lookup:
+			return self.lookup[x]
+		if x in self._lookup_old:
+			y = self.lookup[x] = self._lookup_old.pop(x)
+			return y
+		y = self._interp(x)
+		if self.cachesize != 0:
+			if self.cachesize and len(self.lookup) >= self.cachesize:
+				# Keep the most recently used values one more generation
+				self._lookup_old = self.lookup
+				self.lookup = {}
+			self.lookup[x] = y
+		return y
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		# Don't pickle memoized values and (re-creatable) NumPy module
+		state["lookup"] = {}
+		state["_lookup_old"] = {}
+		state["_arrays"] = None
+		state.pop("numpy", None)
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		if self.use_numpy:
+			import numpy
+			self.numpy = numpy
+
+	def clear_cache(self):
+		self.lookup = {}
+		self._lookup_old = {}
 
 	def _interp(self, x):
 		if self.use_numpy:
 			return self.numpy.interp(x, self.xp, self.fp, self.left, self.right)
+		elif (self.monotonic and isinstance(x, (int, long, float)) and
+			  x == x):
+			xp = self.xp
+			fp = self.fp
+			i = bisect_left(xp, x)
+			if i < len(xp) and xp[i] == x:
+				return fp[i]
+			elif not i:
+				return fp[0] if self.left is None else self.left
+			elif i == len(xp):
+				return fp[-1] if self.right is None else self.right
+			# Interpolate (same as interp)
+			step = float(x - xp[i - 1])
+			steps = (xp[i] - xp[i - 1]) / step
+			return fp[i - 1] + (fp[i] - fp[i - 1]) / steps
 		else:
 			return interp(x, self.xp, self.fp, self.left, self.right)
-		
+
+	def _interp_array(self, x):
+		import numpy
+		x = numpy.asarray(x, dtype=numpy.float64)
+		if not self._arrays:
+			self._arrays = (numpy.asarray(self.xp, dtype=numpy.float64),
+							numpy.asarray(self.fp, dtype=numpy.float64))
+		xp, fp = self._arrays
+		if self.use_numpy:
+			return numpy.interp(x, xp, fp, self.left, self.right)
+		elif not self.monotonic:
+			return numpy.array(interp(x.tolist(), self.xp, self.fp,
+									  self.left, self.right))
+		y = numpy.empty(x.shape)
+		i = numpy.searchsorted(xp, x)
+		inside = (i > 0) & (i < len(xp))
+		lower = numpy.where(inside, i - 1, 0)
+		higher = numpy.where(inside, i, 0)
+		with numpy.errstate(divide="ignore", invalid="ignore"):
+			# Interpolate (same as interp)
+			steps = (xp[higher] - xp[lower]) / (x - xp[lower])
+			y[:] = fp[lower] + (fp[higher] - fp[lower]) / steps
+		exact = xp[numpy.minimum(i, len(xp) - 1)] == x
+		y[exact] = fp[numpy.minimum(i, len(xp) - 1)][exact]
+		left = fp[0] if self.left is None else self.left
+		right = fp[-1] if self.right is None else self.right
+		y[(i == 0) & ~exact] = left
+		y[i == len(xp)] = right
+		y[x != x] = numpy.nan
+		return y
 
 
 class BT1886(object):
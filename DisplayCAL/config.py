@@ -4,6 +4,7 @@
 Runtime configuration and user settings parser
 """
 
+import atexit
 import ConfigParser
 ConfigParser.DEFAULTSECT = "Default"
 from decimal import Decimal
@@ -30,7 +31,7 @@ else:
 from defaultpaths import (autostart, autostart_home, home, iccprofiles,
 						  iccprofiles_home)
 from meta import name as appname, build, lastmod, version
-from options import ascii, debug, verbose
+from options import ascii, debug, debug_config, verbose
 from safe_print import enc, fs_enc, original_codepage
 from util_io import StringIOu as StringIO
 from util_os import (expanduseru, expandvarsu, getenvu, is_superuser,
@@ -702,10 +703,102 @@ def runtimeconfig(pyfile):
 
 # User settings
 
-cfg = ConfigParser.RawConfigParser()
+class CfgParser(ConfigParser.RawConfigParser):
+
+	"""
+	RawConfigParser with a snapshot of typed, validated option values
+	
+	The snapshot is filled by getcfg and discarded whenever an option is set,
+	removed or (re-)read from a file. Each time it is discarded, the snapshot
+	generation is incremented, so that getcfg can tell if a value it looked
+	up may already be outdated.
+	
+	"""
+
+	def __init__(self, *args, **kwargs):
+		ConfigParser.RawConfigParser.__init__(self, *args, **kwargs)
+		self.snapshot = {}
+		self.snapshot_generation = 0
+
+	def _read(self, fp, fpname):
+		try:
+			ConfigParser.RawConfigParser._read(self, fp, fpname)
+		finally:
+			self.discard_snapshot()
+
+	def discard_snapshot(self):
+		""" Discard the snapshot. Call after changing values """
+		self.snapshot_generation += 1
+		self.snapshot.clear()
+
+	def remove_option(self, section, option):
+		try:
+			return ConfigParser.RawConfigParser.remove_option(self, section,
+															  option)
+		finally:
+			self.discard_snapshot()
+
+	def set(self, section, option, value=None):
+		try:
+			ConfigParser.RawConfigParser.set(self, section, option, value)
+		finally:
+			self.discard_snapshot()
+
+
+class CfgDict(dict):
+
+	""" Dictionary that discards the configuration snapshot when changed """
+
+	def __delitem__(self, key):
+		dict.__delitem__(self, key)
+		cfg.discard_snapshot()
+
+	def __setitem__(self, key, value):
+		dict.__setitem__(self, key, value)
+		cfg.discard_snapshot()
+
+	def clear(self):
+		dict.clear(self)
+		cfg.discard_snapshot()
+
+	def pop(self, *args):
+		try:
+			return dict.pop(self, *args)
+		finally:
+			cfg.discard_snapshot()
+
+	def popitem(self):
+		try:
+			return dict.popitem(self)
+		finally:
+			cfg.discard_snapshot()
+
+	def setdefault(self, key, value=None):
+		try:
+			return dict.setdefault(self, key, value)
+		finally:
+			cfg.discard_snapshot()
+
+	def update(self, *args, **kwargs):
+		dict.update(self, *args, **kwargs)
+		cfg.discard_snapshot()
+
+
+cfg = CfgParser()
 cfg.optionxform = str
 
-valid_ranges = {
+# Options whose values depend on more than the configuration itself (e.g.
+# file existence) or which are returned as mutable lists are never put into
+# the snapshot
+cfg_volatile = ("displays", "instruments", "profile.name.expanded")
+
+# Number of getcfg calls per option name if debugging configuration lookups
+if debug_config:
+	cfglookups = {}
+else:
+	cfglookups = None
+
+valid_ranges = CfgDict({
 	"3dlut.hdr_peak_luminance": [100.0, 10000.0],
 	"3dlut.hdr_minmll": [0.0, 0.1],
 	"3dlut.hdr_maxmll": [100.0, 10000.0],
@@ -739,6 +832,8 @@ valid_ranges = {
 	"patterngenerator.ffp_insertion.level": [0.0, 1.0],
 	"patterngenerator.quantize_bits": [0, 32],
 	"patterngenerator.resolve.port": [1, 65535],
+	"profile.cache.maxsize": [1, 65536],
+	"profile.memcache.maxsize": [1, 65536],
 	"profile_loader.quantize_bits": [8, 16],
 	"synthprofile.trc_gamma": [0.01, 10],
 	"synthprofile.trc_output_offset": [0.0, 1.0],
@@ -751,9 +846,11 @@ valid_ranges = {
 	"whitepoint.visual_editor.b": [0, 255],
 	"whitepoint.visual_editor.g": [0, 255],
 	"whitepoint.visual_editor.r": [0, 255],
-}
+	"xicclu.pool.idle_timeout": [1, 3600],
+	"xicclu.pool.max_children": [1, 64],
+})
 
-valid_values = {
+valid_values = CfgDict({
 	"3d.format": ["HTML", "VRML", "X3D"],
 	"3dlut.bitdepth.input": [8, 10, 12, 14, 16],
 	"3dlut.bitdepth.output": [8, 10, 12, 14, 16],
@@ -821,14 +918,14 @@ valid_values = {
 	"uniformity.cols": [3, 5, 7, 9],
 	"uniformity.rows": [3, 5, 7, 9],
 	"whitepoint.colortemp.locus": ["t", "T"]
-}
+})
 
 content_rgb_space = colormath.get_rgb_space("DCI P3 D65")
 crx, cry = content_rgb_space[2:][0][:2]
 cgx, cgy = content_rgb_space[2:][1][:2]
 cbx, cby = content_rgb_space[2:][2][:2]
 cwx, cwy = colormath.XYZ2xyY(*content_rgb_space[1])[:2]
-defaults = {
+defaults = CfgDict({
 	"3d.format": "HTML",
 	"3dlut.apply_black_offset": 0,
 	"3dlut.apply_trc": 1,
@@ -1081,6 +1178,9 @@ defaults = {
 	"profile.b2a.hires.diagpng": 2,
 	"profile.b2a.hires.size": -1,
 	"profile.b2a.hires.smooth": 1,
+	"profile.cache": 1,
+	"profile.cache.maxsize": 256,
+	"profile.memcache.maxsize": 64,
 	"profile.save_path": storage, # directory
 	# Force profile type to single shaper + matrix
 	# due to OS X bugs with cLUT profiles and
@@ -1238,8 +1338,12 @@ defaults = {
 	"whitepoint.y": 0.3290,
 	"whitepoint.y.backup": 0.3290,
 	"x3dom.cache": 1,
-	"x3dom.embed": 0
-}
+	"x3dom.embed": 0,
+	"xicclu.native": 1,
+	"xicclu.pool": 1,
+	"xicclu.pool.idle_timeout": 60,
+	"xicclu.pool.max_children": 4
+})
 lcode, lenc = locale.getdefaultlocale()
 if lcode:
 	defaults["lang"] = lcode.split("_")[0].lower()
@@ -1268,6 +1372,30 @@ def getcfg(name, fallback=True, raw=False, cfg=cfg):
 	return its default value.
 	
 	"""
+	if cfglookups is not None:
+		cfglookups[name] = cfglookups.get(name, 0) + 1
+	if fallback and not raw:
+		snapshot = getattr(cfg, "snapshot", None)
+	else:
+		snapshot = None
+	if snapshot is not None:
+		value = snapshot.get(name, snapshot)
+		if value is not snapshot:
+			return value
+		generation = cfg.snapshot_generation
+	value = _getcfg(name, fallback, raw, cfg)
+	if (snapshot is not None and name not in cfg_volatile and
+		not name.endswith("file") and
+		cfg.snapshot_generation == generation):
+		snapshot[name] = value
+		if cfg.snapshot_generation != generation:
+			# The configuration was changed by another thread while storing
+			snapshot.pop(name, None)
+	return value
+
+
+def _getcfg(name, fallback, raw, cfg):
+	""" Get an option value from the configuration (uncached) """
 	if name == "profile.name.expanded" and is_ccxx_testchart():
 		name = "measurement.name.expanded"
 	value = None
@@ -1387,6 +1515,20 @@ def getcfg(name, fallback=True, raw=False, cfg=cfg):
 	return value
 
 
+def print_cfglookups(limit=25):
+	""" Print the most often looked up configuration options """
+	if not cfglookups:
+		return
+	safe_print("Configuration lookups (top %i of %i options):" %
+			   (min(limit, len(cfglookups)), len(cfglookups)))
+	for name, count in sorted(cfglookups.iteritems(),
+							  key=lambda item: (-item[1], item[0]))[:limit]:
+		safe_print("%10i %s" % (count, name))
+
+if debug_config:
+	atexit.register(print_cfglookups)
+
+
 def hascfg(name, fallback=True, cfg=cfg):
 	"""
 	Check if an option name exists in the configuration.
@@ -1438,49 +1580,60 @@ def get_display_profile(display_no=None):
 
 
 standard_profiles = []
+standard_profile_paths = []
 
 
 def get_standard_profiles(paths_only=False):
-	if not standard_profiles:
-		import ICCProfile as ICCP
+	if not standard_profile_paths:
+		import profileindex
+		index = profileindex.get_index()
 		# Reference profiles (Argyll + DisplayCAL)
 		ref_icc = get_data_path("ref", "\.ic[cm]$") or []
 		# Other profiles installed on the system
 		other_icc = []
-		rex = re.compile("\.ic[cm]$", re.IGNORECASE)
-		for icc_dir in set(iccprofiles + iccprofiles_home):
-			for dirpath, dirnames, basenames in os.walk(icc_dir):
-				for basename in filter(rex.search, basenames):
-					filename, ext = os.path.splitext(basename.lower())
-					if (filename.endswith("_bas") or
-						filename.endswith("_eci") or
-						filename.endswith("adobergb1998") or
-						filename.startswith("eci-rgb") or
-						filename.startswith("ecirgb") or
-						filename.startswith("ekta space") or
-						filename.startswith("ektaspace") or
-						filename.startswith("fogra") or
-						filename.startswith("gracol") or
-						filename.startswith("iso") or
-						filename.startswith("lstar-") or
-						filename.startswith("pso") or
-						filename.startswith("prophoto") or
-						filename.startswith("psr_") or
-						filename.startswith("psrgravure") or
-						filename.startswith("snap") or
-						filename.startswith("srgb") or
-						filename.startswith("swop") or
-						filename in ("applergb",
-									 "bestrgb",
-									 "betargb",
-									 "brucergb",
-									 "ciergb",
-									 "cie-rgb",
-									 "colormatchrgb",
-									 "donrgb",
-									 "widegamutrgb")):
-						other_icc.append(os.path.join(dirpath, basename))
-		for path in ref_icc + other_icc:
+		for path in index.paths():
+			filename, ext = os.path.splitext(os.path.basename(path).lower())
+			if (filename.endswith("_bas") or
+				filename.endswith("_eci") or
+				filename.endswith("adobergb1998") or
+				filename.startswith("eci-rgb") or
+				filename.startswith("ecirgb") or
+				filename.startswith("ekta space") or
+				filename.startswith("ektaspace") or
+				filename.startswith("fogra") or
+				filename.startswith("gracol") or
+				filename.startswith("iso") or
+				filename.startswith("lstar-") or
+				filename.startswith("pso") or
+				filename.startswith("prophoto") or
+				filename.startswith("psr_") or
+				filename.startswith("psrgravure") or
+				filename.startswith("snap") or
+				filename.startswith("srgb") or
+				filename.startswith("swop") or
+				filename in ("applergb",
+							 "bestrgb",
+							 "betargb",
+							 "brucergb",
+							 "ciergb",
+							 "cie-rgb",
+							 "colormatchrgb",
+							 "donrgb",
+							 "widegamutrgb")):
+				other_icc.append(path)
+		for path in index.select(ref_icc + other_icc,
+								 version=lambda version: version < 4,
+								 profileClass=lambda cls: cls != "nmcl",
+								 colorSpace=lambda space: space != "GRAY",
+								 connectionColorSpace=lambda pcs: pcs in ("Lab",
+																		  "XYZ")):
+			standard_profile_paths.append(path)
+		index.save()
+	if paths_only:
+		return list(standard_profile_paths)
+	if not standard_profiles:
+		import ICCProfile as ICCP
+		for path in standard_profile_paths:
 			try:
 				profile = ICCP.ICCProfile(path, load=False, use_cache=True)
 			except EnvironmentError:
@@ -1488,13 +1641,7 @@ def get_standard_profiles(paths_only=False):
 			except Exception, exception:
 				safe_print(exception)
 			else:
-				if (profile.version < 4 and
-					profile.profileClass != "nmcl" and
-					profile.colorSpace != "GRAY" and
-					profile.connectionColorSpace in ("Lab", "XYZ")):
-					standard_profiles.append(profile)
-	if paths_only:
-		return [profile.fileName for profile in standard_profiles]
+				standard_profiles.append(profile)
 	return standard_profiles
 
 
@@ -1714,6 +1861,9 @@ def initcfg(module=None, cfg=cfg, force_load=False):
 		if not module and not getcfg("calibration.ambient_viewcond_adjust"):
 			# Reset to default
 			setcfg("calibration.ambient_viewcond_adjust.lux", None, cfg=cfg)
+		# Size limit of the in-memory profile cache
+		import ICCProfile as ICCP
+		ICCP.set_cache_maxsize(getcfg("profile.memcache.maxsize") * 1024 * 1024)
 
 
 dpiset = False
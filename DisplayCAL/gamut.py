@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gamut surfaces, volume and intersection
+
+A gamut surface is a closed triangle mesh in L*a*b*, held as (N, 3) vertex
+and (M, 3) triangle index arrays. Surfaces are either read from Argyll .gam
+files or built by looking up the surface of the device RGB cube through a
+profile.
+
+Volume is computed exactly from the mesh (sum of signed tetrahedra). The
+intersection of two surfaces is estimated on a voxel grid: each surface is
+rasterized by casting rays along L* through the centers of the grid columns,
+voxels are inside where the number of crossings below them is odd.
+
+"""
+
+import os
+import re
+
+import numpy
+
+from ordereddict import OrderedDict
+
+
+# Edge length of voxels used for intersection volume (cubic L*a*b* units)
+VOXEL_SIZE = 2.0
+
+
+class LRUDict(OrderedDict):
+
+	""" Ordered dictionary keeping only the maxlen most recently used items """
+
+	def __init__(self, maxlen, *args, **kwargs):
+		self.maxlen = maxlen
+		OrderedDict.__init__(self, *args, **kwargs)
+
+	def __getitem__(self, key):
+		value = OrderedDict.__getitem__(self, key)
+		# Most recently used items are last
+		self._keys.remove(key)
+		self._keys.append(key)
+		return value
+
+	def __setitem__(self, key, value):
+		if key in self:
+			del self[key]
+		OrderedDict.__setitem__(self, key, value)
+		while len(self) > self.maxlen:
+			del self[self._keys[0]]
+
+
+# Gamut surfaces, keyed by file path for reference gamuts read from .gam
+# files and by caller supplied key and steps for device lookups, and coverage,
+# keyed by the keys of both surfaces and voxel size. A surface at the highest
+# detail takes several MiB, so only the most recently used ones are kept.
+_gam_cache = LRUDict(16)
+_coverage_cache = LRUDict(64)
+
+
+class GamutSurface(object):
+
+	""" Closed triangle mesh in L*a*b* """
+
+	def __init__(self, vertices, triangles, key=None):
+		self.vertices = numpy.asarray(vertices, dtype=numpy.float64)
+		self.triangles = numpy.asarray(triangles, dtype=numpy.intp)
+		self.key = key
+
+	@classmethod
+	def from_device_lookup(cls, lookup, steps, key=None):
+		"""
+		Create surface from device RGB cube
+
+		lookup  Function that takes a (N, 3) RGB array (0..1) and returns a
+		        (N, 3) L*a*b* array
+		steps   Number of steps along each edge of the cube
+		key     If given, the surface (and its coverage of other surfaces)
+		        is cached under this key, which has to identify the lookup
+
+		"""
+		if key is not None:
+			key = ("lookup", key, steps)
+			if key in _gam_cache:
+				return _gam_cache[key]
+		RGB, triangles = device_cube_surface(steps)
+		surface = cls(lookup(RGB), triangles, key)
+		if key is not None:
+			_gam_cache[key] = surface
+		return surface
+
+	@classmethod
+	def from_gam(cls, filename):
+		""" Read Argyll .gam file (results are cached) """
+		key = os.path.abspath(filename)
+		if not key in _gam_cache:
+			_gam_cache[key] = cls(*read_gam(filename), key=key)
+		return _gam_cache[key]
+
+	@property
+	def volume(self):
+		""" Volume enclosed by the surface (cubic L*a*b* units) """
+		v0, v1, v2 = (self.vertices[self.triangles[:, i]] for i in xrange(3))
+		return abs(numpy.einsum("ij,ij->", v0, numpy.cross(v1, v2))) / 6.0
+
+	@property
+	def bounds(self):
+		return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+	def voxelize(self, origin, shape, size=VOXEL_SIZE):
+		"""
+		Return boolean array of given shape (L, a, b) which is True for
+		voxels inside the surface
+
+		origin  L*a*b* coordinates of the lower grid corner
+
+		"""
+		nL, na, nb = shape
+		# Work in (a, b) plane grid units, with voxel centers at integers
+		v = (self.vertices - origin) / size - .5
+		tri = v[self.triangles]
+		a = tri[..., 1]
+		b = tri[..., 2]
+		# Twice the signed area of the triangles projected onto the a/b plane
+		det = ((a[:, 1] - a[:, 0]) * (b[:, 2] - b[:, 0]) -
+			   (a[:, 2] - a[:, 0]) * (b[:, 1] - b[:, 0]))
+		use = numpy.abs(det) > 1e-12
+		tri, a, b, det = tri[use], a[use], b[use], det[use]
+		# Edges opposite each vertex. Each edge is evaluated from its
+		# lexicographically smaller end point, so that triangles sharing an
+		# edge in projection get exactly the same (negated) edge function
+		# values for every column
+		edges = []
+		for k in xrange(3):
+			i, j = (k + 1) % 3, (k + 2) % 3
+			swap = (a[:, i] > a[:, j]) | ((a[:, i] == a[:, j]) &
+										  (b[:, i] > b[:, j]))
+			pa = numpy.where(swap, a[:, j], a[:, i])
+			pb = numpy.where(swap, b[:, j], b[:, i])
+			da = numpy.where(swap, a[:, i], a[:, j]) - pa
+			db = numpy.where(swap, b[:, i], b[:, j]) - pb
+			# Sign that makes the edge function positive inside
+			sign = numpy.where(swap, -1.0, 1.0) * numpy.sign(det)
+			# Half-open (top-left) rule: columns exactly on an edge belong to
+			# only one of the two triangles sharing it
+			owned = (sign * db > 0) | ((db == 0) & (sign * da < 0))
+			edges.append((pa, pb, da, db, sign, owned))
+		# Grid column ranges covered by the triangles' bounding boxes
+		a0 = numpy.clip(numpy.ceil(a.min(axis=1)), 0, na).astype(numpy.intp)
+		a1 = numpy.clip(numpy.floor(a.max(axis=1)) + 1, 0, na).astype(numpy.intp)
+		b0 = numpy.clip(numpy.ceil(b.min(axis=1)), 0, nb).astype(numpy.intp)
+		b1 = numpy.clip(numpy.floor(b.max(axis=1)) + 1, 0, nb).astype(numpy.intp)
+		ncols = numpy.maximum(b1 - b0, 0)
+		count = numpy.maximum(a1 - a0, 0) * ncols
+		# Enumerate all (triangle, column) candidate pairs
+		total = count.sum()
+		index = numpy.repeat(numpy.arange(len(count)), count)
+		local = numpy.arange(total) - numpy.repeat(numpy.cumsum(count) - count,
+												   count)
+		ncols = ncols[index]
+		ia = a0[index] + local // ncols
+		ib = b0[index] + local % ncols
+		# Edge functions of column centers (twice the areas of the
+		# sub-triangles, i.e. unnormalized barycentric coordinates)
+		inside = numpy.ones(total, dtype=bool)
+		weights = []
+		for pa, pb, da, db, sign, owned in edges:
+			e = (da[index] * (ib - pb[index]) -
+				 db[index] * (ia - pa[index])) * sign[index]
+			inside &= (e > 0) | ((e == 0) & owned[index])
+			weights.append(e)
+		index, ia, ib = (arr[inside] for arr in (index, ia, ib))
+		w0, w1, w2 = (e[inside] for e in weights)
+		L = tri[index, :, 0]
+		L = (w0 * L[:, 0] + w1 * L[:, 1] + w2 * L[:, 2]) / (w0 + w1 + w2)
+		# Surface crossing toggles inside/outside for all voxels above it
+		iL = numpy.clip(numpy.ceil(L), 0, nL).astype(numpy.intp)
+		crossings = numpy.bincount((ib * na + ia) * (nL + 1) + iL,
+								   minlength=na * nb * (nL + 1))
+		crossings = crossings.astype(numpy.uint8).reshape((nb, na, nL + 1))
+		# uint8 overflow does not affect parity
+		inside = numpy.cumsum(crossings[..., :nL], axis=2,
+							  dtype=numpy.uint8) & 1
+		return inside.astype(bool).transpose((2, 1, 0))
+
+	def intersection(self, other, size=VOXEL_SIZE):
+		"""
+		Return volumes of self, other and their intersection, estimated on
+		a common voxel grid (cubic L*a*b* units)
+
+		"""
+		mins, maxs = zip(self.bounds, other.bounds)
+		origin = numpy.minimum(*mins) - size
+		shape = tuple(numpy.ceil((numpy.maximum(*maxs) + size - origin) /
+								 size).astype(int))
+		voxels = self.voxelize(origin, shape, size)
+		other_voxels = other.voxelize(origin, shape, size)
+		unit = size ** 3
+		return (voxels.sum() * unit, other_voxels.sum() * unit,
+				(voxels & other_voxels).sum() * unit)
+
+	def coverage(self, other, size=VOXEL_SIZE):
+		"""
+		Return fraction of the other surface's volume covered by self
+
+		Results are cached if both surfaces have a key.
+
+		"""
+		if self.key is not None and other.key is not None:
+			key = (self.key, other.key, size)
+			if key in _coverage_cache:
+				return _coverage_cache[key]
+		else:
+			key = None
+		volume, other_volume, intersection = self.intersection(other, size)
+		if not other_volume:
+			coverage = 0.0
+		else:
+			coverage = intersection / float(other_volume)
+		if key:
+			_coverage_cache[key] = coverage
+		return coverage
+
+
+def device_cube_surface(steps):
+	"""
+	Return vertices (N, 3) and outward facing triangles (M, 3) of the
+	surface of the RGB cube 0..1, sampled with given steps along each edge
+
+	"""
+	last = steps - 1
+	grid = numpy.indices((steps, ) * 3).reshape((3, -1)).T
+	surface = ((grid == 0) | (grid == last)).any(axis=1)
+	vertices = grid[surface]
+	# Map grid coordinates to vertex indexes
+	index = numpy.empty((steps, ) * 3, dtype=numpy.intp)
+	index[tuple(vertices.T)] = numpy.arange(len(vertices))
+	i, j = numpy.indices((last, last)).reshape((2, -1))
+	triangles = []
+	for axis in xrange(3):
+		u, v = [n for n in xrange(3) if n != axis]
+		for level, sign in ((0, -1), (last, 1)):
+			coords = numpy.empty((4, 3, len(i)), dtype=numpy.intp)
+			coords[:, axis] = level
+			for k, (du, dv) in enumerate(((0, 0), (1, 0), (1, 1), (0, 1))):
+				coords[k, u] = i + du
+				coords[k, v] = j + dv
+			quad = [index[tuple(c)] for c in coords]
+			tris = numpy.vstack((numpy.column_stack((quad[0], quad[1],
+													 quad[2])),
+								 numpy.column_stack((quad[0], quad[2],
+													 quad[3]))))
+			# (u, v, axis) is a right-handed ordering if axis follows v
+			# cyclically, then the winding faces +axis
+			if ((axis - v) % 3 == 1) != (sign > 0):
+				tris = tris[:, ::-1]
+			triangles.append(tris)
+	return vertices / float(last), numpy.vstack(triangles)
+
+
+def read_gam(filename):
+	""" Read vertices and triangles from Argyll .gam file """
+	with open(filename, "rb") as gam:
+		data = gam.read()
+	sections = re.findall(r"BEGIN_DATA(?!_)\s*(.*?)\s*END_DATA(?!_)", data,
+						  re.S)
+	if len(sections) < 2:
+		raise ValueError("Invalid gamut file: %r" % filename)
+	vertices = numpy.array(sections[0].split(),
+						   dtype=numpy.float64).reshape((-1, 4))
+	triangles = numpy.array(sections[1].split(),
+							dtype=numpy.float64).reshape((-1, 3))
+	# First column of the vertex data is the vertex number
+	index = numpy.empty(int(vertices[:, 0].max()) + 1, dtype=numpy.intp)
+	index[vertices[:, 0].astype(numpy.intp)] = numpy.arange(len(vertices))
+	return vertices[:, 1:], index[triangles.astype(numpy.intp)]
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process ICC transforms
+
+Implements the subset of ArgyllCMS xicclu/icclu lookup functionality that is
+needed for matrix/TRC and LUT16Type (mft2) profiles and device links. Instead
+of formatting each row as text and piping it to a child process, lookups
+operate on NumPy arrays of shape (N, channels).
+
+Supported:
+- Matrix/TRC (and gray TRC) profiles, forward and inverse
+- LUT16Type A2B (forward) and B2A (backward) tables, and device links
+- Intents p, r, s and a (absolute colorimetric via ICC wtpt scaling)
+- PCS x (XYZ 0..1), X (XYZ 0..100) and l (L*a*b*)
+
+Anything else (CAM clipping, inverse cLUT lookups, video encodings...) raises
+NotImplementedError so callers can fall back to Argyll.
+
+"""
+
+import numpy
+
+import colormath
+import ICCProfile as ICCP
+
+
+D50 = numpy.array(colormath.get_whitepoint("D50"))
+
+# Number of rows processed at once. Bounds peak memory for temporary arrays.
+BLOCKSIZE = 65536
+
+INTENT_TABLENO = {"p": 0, "r": 1, "s": 2, "a": 1}
+
+
+def XYZ2Lab(XYZ, whitepoint=D50):
+	""" Convert (N, 3) XYZ (Y 0..1) array to L*a*b* """
+	xyzr = XYZ / whitepoint
+	f = numpy.where(xyzr > colormath.LSTAR_E, numpy.cbrt(xyzr),
+					(colormath.LSTAR_K * xyzr + 16) / 116.0)
+	Lab = numpy.empty_like(f)
+	Lab[:, 0] = 116 * f[:, 1] - 16
+	Lab[:, 1] = 500 * (f[:, 0] - f[:, 1])
+	Lab[:, 2] = 200 * (f[:, 1] - f[:, 2])
+	return Lab
+
+
+def Lab2XYZ(Lab, whitepoint=D50):
+	""" Convert (N, 3) L*a*b* array to XYZ (Y 0..1) """
+	L = Lab[:, 0]
+	f = numpy.empty_like(Lab)
+	f[:, 1] = (L + 16) / 116.0
+	f[:, 0] = Lab[:, 1] / 500.0 + f[:, 1]
+	f[:, 2] = f[:, 1] - Lab[:, 2] / 200.0
+	f3 = f ** 3
+	xyzr = numpy.where(f3 > colormath.LSTAR_E, f3,
+					   (116.0 * f - 16) / colormath.LSTAR_K)
+	xyzr[:, 1] = numpy.where(L > colormath.LSTAR_K * colormath.LSTAR_E,
+							 f3[:, 1], L / colormath.LSTAR_K)
+	return xyzr * whitepoint
+
+
+def curve_apply(tag, v, inverse=False):
+	"""
+	Apply CurveType or ParametricCurveType to 1D array (values 0..1)
+
+	"""
+	if isinstance(tag, ICCP.ParametricCurveType):
+		if inverse:
+			# Invert numerically from a densely sampled table
+			tag = tag.get_trc(4096)
+		else:
+			return parametric_apply(tag.params, v)
+	if len(tag) == 1:
+		# Gamma
+		gamma = tag[0]
+		if inverse:
+			gamma = 1.0 / gamma
+		return numpy.power(numpy.clip(v, 0, 1), gamma)
+	table = numpy.asarray(tag, dtype=numpy.float64) / 65535.0
+	x = numpy.linspace(0, 1, len(table))
+	if inverse:
+		# Table needs to be monotonically increasing for inversion
+		table = numpy.maximum.accumulate(table)
+		return numpy.interp(v, table, x)
+	return numpy.interp(v, x, table)
+
+
+def parametric_apply(params, v):
+	""" Vectorized ParametricCurveType.apply """
+	g = params["g"]
+	if len(params) == 1:
+		return numpy.power(numpy.clip(v, 0, 1), g)
+	a = params["a"]
+	b = params["b"]
+	c = params.get("c", 0)
+	if len(params) == 3:
+		d, e, f = -b / a, 0, 0
+		c = 0
+	elif len(params) == 4:
+		d, e, f = -b / a, c, c
+		c = 0
+	elif len(params) == 5:
+		d, e, f = params["d"], 0, 0
+	elif len(params) == 7:
+		d, e, f = params["d"], params["e"], params["f"]
+	else:
+		raise NotImplementedError("Invalid number of parameters: %i"
+								  % len(params))
+	hi = numpy.power(numpy.maximum(a * v + b, 0), g) + e
+	return numpy.where(v >= d, hi, c * v + f)
+
+
+def clut_interp(clut, v):
+	"""
+	Multilinear interpolation of cLUT grid
+
+	clut  Array of shape (grid steps, ) * input channels + (output channels, )
+	v     Array of shape (N, input channels), values 0..1
+
+	"""
+	i = v.shape[1]
+	g = clut.shape[0]
+	o = clut.shape[-1]
+	flat = clut.reshape(-1, o)
+	if g < 2:
+		return numpy.repeat(flat[:1], len(v), 0)
+	pos = numpy.clip(v, 0, 1) * (g - 1)
+	base = numpy.minimum(numpy.floor(pos).astype(numpy.intp), g - 2)
+	frac = pos - base
+	strides = g ** numpy.arange(i - 1, -1, -1)
+	base_index = numpy.dot(base, strides)
+	out = numpy.zeros((len(v), o))
+	for corner in xrange(2 ** i):
+		weight = numpy.ones(len(v))
+		index = base_index.copy()
+		for channel in xrange(i):
+			if corner >> (i - 1 - channel) & 1:
+				weight *= frac[:, channel]
+				index += strides[channel]
+			else:
+				weight *= 1 - frac[:, channel]
+		out += flat[index] * weight[:, numpy.newaxis]
+	return out
+
+
+class LUT16(object):
+
+	"""
+	Apply LUT16Type (matrix, input curves, cLUT, output curves) to arrays
+
+	Input and output values are normalized to 0..1. The tag's tables are
+	converted to arrays once on initialization.
+
+	"""
+
+	def __init__(self, tag, apply_matrix=False):
+		if apply_matrix:
+			self.matrix = numpy.array(tag.matrix).T
+		else:
+			self.matrix = None
+		self.input = tag.input_array / 65535.0
+		g = tag.clut_grid_steps
+		clut = tag.clut_array / 65535.0
+		self.clut = clut.reshape((g, ) * len(self.input) + (clut.shape[-1], ))
+		self.output = tag.output_array / 65535.0
+
+	def __call__(self, v):
+		if self.matrix is not None:
+			v = numpy.dot(v, self.matrix)
+		v = self._curves(self.input, numpy.clip(v, 0, 1))
+		return self._curves(self.output, clut_interp(self.clut, v))
+
+	def _curves(self, entries, v):
+		x = numpy.linspace(0, 1, entries.shape[1])
+		return numpy.column_stack([numpy.interp(v[:, n], x, entries[n])
+								   for n in xrange(v.shape[1])])
+
+
+def pcs_decode(v, pcs):
+	""" Decode normalized legacy 16-bit PCS encoding to XYZ or L*a*b* """
+	if pcs == "XYZ":
+		return v * (65535 / 32768.0)
+	Lab = v * (65535 / 65280.0)
+	Lab[:, 0] *= 100
+	Lab[:, 1:] = Lab[:, 1:] * 255 - 128
+	return Lab
+
+
+def pcs_encode(v, pcs):
+	""" Encode XYZ or L*a*b* to normalized legacy 16-bit PCS encoding """
+	if pcs == "XYZ":
+		return v * (32768 / 65535.0)
+	Lab = numpy.array(v, dtype=numpy.float64)
+	Lab[:, 0] /= 100.0
+	Lab[:, 1:] = (Lab[:, 1:] + 128) / 255.0
+	return Lab * (65280 / 65535.0)
+
+
+class Transform(object):
+
+	"""
+	In-process replacement for a xicclu/icclu lookup
+
+	Arguments mirror worker_base.Xicclu. Raises NotImplementedError if the
+	requested lookup can not be done natively.
+
+	"""
+
+	def __init__(self, profile, intent="r", direction="f", order="n",
+				 pcs=None, scale=1, input_encoding=None, output_encoding=None):
+		if isinstance(profile, basestring):
+			if profile.lower().endswith(".cal"):
+				raise NotImplementedError("Calibration files are not "
+										  "supported")
+			profile = ICCP.ICCProfile(profile)
+		elif not isinstance(profile, ICCP.ICCProfile):
+			raise NotImplementedError("Unsupported profile type %r" %
+									  profile.__class__.__name__)
+		for encoding in (input_encoding, output_encoding):
+			if encoding not in (None, "n"):
+				raise NotImplementedError("Unsupported encoding %r" %
+										  encoding)
+		if order != "n":
+			raise NotImplementedError("Unsupported order %r" % order)
+		if intent not in INTENT_TABLENO:
+			raise NotImplementedError("Unsupported intent %r" % intent)
+		self.profile = profile
+		self.intent = intent
+		self.direction = direction
+		self.scale = float(scale)
+		self.steps = []
+		profileClass = profile.profileClass
+		if profileClass == "abst":
+			raise NotImplementedError("Abstract profiles are not supported")
+		if profileClass == "link":
+			if direction != "f":
+				raise NotImplementedError("Unsupported direction %r for "
+										  "device link" % direction)
+			tag = profile.tags.get("A2B0")
+			self._check_lut16(tag)
+			self.steps.append((self._device_in, ()))
+			self.steps.append((LUT16(tag, profile.colorSpace == "XYZ"), ()))
+			self.steps.append((self._device_out, ()))
+			return
+		if pcs in (None, "x", "X"):
+			if pcs is None and profile.connectionColorSpace == "Lab":
+				pcs = "l"
+			elif pcs is None:
+				pcs = "x"
+		elif pcs != "l":
+			raise NotImplementedError("Unsupported PCS %r" % pcs)
+		self.pcs = pcs
+		tableno = INTENT_TABLENO[intent]
+		has_lut = ("A2B0" in profile.tags or "B2A0" in profile.tags)
+		if direction in ("f", "ib"):
+			if has_lut:
+				if direction != "f":
+					raise NotImplementedError("Inverse cLUT lookup not "
+											  "supported")
+				tag = self._get_lut16("A2B", tableno)
+				self.steps.append((self._device_in, ()))
+				self.steps.append((LUT16(tag, profile.colorSpace == "XYZ"),
+								   ()))
+				self.steps.append((pcs_decode,
+								   (profile.connectionColorSpace, )))
+				self.steps.append((self._pcs_out,
+								   (profile.connectionColorSpace, )))
+			else:
+				self._check_matrix_trc()
+				self.steps.append((self._device_in, ()))
+				self.steps.append((self._matrix_trc_fwd, ()))
+				self.steps.append((self._pcs_out, ("XYZ", )))
+		elif direction in ("b", "if"):
+			if has_lut:
+				if direction != "b":
+					raise NotImplementedError("Inverse cLUT lookup not "
+											  "supported")
+				tag = self._get_lut16("B2A", tableno)
+				pcs_in = profile.connectionColorSpace
+				self.steps.append((self._pcs_in, (pcs_in, )))
+				self.steps.append((pcs_encode, (pcs_in, )))
+				self.steps.append((LUT16(tag, pcs_in == "XYZ"), ()))
+				self.steps.append((self._device_out, ()))
+			else:
+				self._check_matrix_trc()
+				self.steps.append((self._pcs_in, ("XYZ", )))
+				self.steps.append((self._matrix_trc_bwd, ()))
+				self.steps.append((self._device_out, ()))
+		else:
+			raise NotImplementedError("Unsupported direction %r" % direction)
+
+	def __call__(self, idata):
+		""" Lookup (N, channels) array, return (N, channels) array """
+		v = numpy.array(idata, dtype=numpy.float64, ndmin=2)
+		if len(v) > BLOCKSIZE:
+			return numpy.concatenate([self(v[i:i + BLOCKSIZE]) for i in
+									  xrange(0, len(v), BLOCKSIZE)])
+		for fn, args in self.steps:
+			v = fn(v, *args)
+		return v
+
+	def _check_lut16(self, tag):
+		if not isinstance(tag, ICCP.LUT16Type):
+			raise NotImplementedError("Unsupported LUT tag type %r" %
+									  tag.__class__.__name__)
+
+	def _check_matrix_trc(self):
+		tags = self.profile.tags
+		if self.profile.colorSpace == "GRAY":
+			channels = ("k", )
+		elif self.profile.colorSpace == "RGB":
+			channels = ("r", "g", "b")
+		else:
+			raise NotImplementedError("Unsupported color space %r" %
+									  self.profile.colorSpace)
+		for channel in channels:
+			if (not isinstance(tags.get(channel + "TRC"),
+							   (ICCP.CurveType, ICCP.ParametricCurveType)) or
+				(channel != "k" and
+				 not isinstance(tags.get(channel + "XYZ"), ICCP.XYZType))):
+				raise NotImplementedError("Profile is missing %sTRC/%sXYZ "
+										  "tags" % (channel, channel))
+		if channels == ("k", ):
+			self.trc = [tags.kTRC]
+			self.matrix = None
+		else:
+			self.trc = [tags[channel + "TRC"] for channel in channels]
+			self.matrix = numpy.array([tags[channel + "XYZ"].values()
+									   for channel in channels]).T
+
+	def _get_lut16(self, direction, tableno):
+		tags = self.profile.tags
+		tag = (tags.get("%s%i" % (direction, tableno)) or
+			   tags.get("%s0" % direction))
+		self._check_lut16(tag)
+		return tag
+
+	def _device_in(self, v):
+		if self.scale != 1:
+			v = v / self.scale
+		return v
+
+	def _device_out(self, v):
+		if self.scale != 1:
+			v = v * self.scale
+		return v
+
+	def _matrix_trc_fwd(self, v):
+		linear = numpy.column_stack([curve_apply(trc, v[:, n])
+									 for n, trc in enumerate(self.trc)])
+		if self.matrix is None:
+			return linear * D50
+		return numpy.dot(linear, self.matrix.T)
+
+	def _matrix_trc_bwd(self, XYZ):
+		if self.matrix is None:
+			linear = XYZ[:, 1:2] / D50[1]
+		else:
+			linear = numpy.dot(XYZ, numpy.linalg.inv(self.matrix).T)
+		return numpy.column_stack([curve_apply(trc, linear[:, n], True)
+								   for n, trc in enumerate(self.trc)])
+
+	def _pcs_in(self, v, pcs):
+		""" Convert lookup input to relative PCS values in 'pcs' encoding """
+		if self.pcs == "X":
+			v = v / 100.0
+		if self.intent == "a":
+			if self.pcs == "l":
+				v = Lab2XYZ(v)
+			v = v * D50 / numpy.array(self.profile.tags.wtpt.values())
+			if pcs == "Lab":
+				return XYZ2Lab(v)
+		elif self.pcs == "l" and pcs == "XYZ":
+			return Lab2XYZ(v)
+		elif self.pcs != "l" and pcs == "Lab":
+			return XYZ2Lab(v)
+		return v
+
+	def _pcs_out(self, v, pcs):
+		""" Convert relative PCS values in 'pcs' encoding to lookup output """
+		if self.intent == "a":
+			if pcs == "Lab":
+				v = Lab2XYZ(v)
+			v = v * numpy.array(self.profile.tags.wtpt.values()) / D50
+			pcs = "XYZ"
+		if self.pcs == "l":
+			if pcs == "XYZ":
+				v = XYZ2Lab(v)
+		else:
+			if pcs == "Lab":
+				v = Lab2XYZ(v)
+			if self.pcs == "X":
+				v = v * 100
+		return v
@@ -7,6 +7,8 @@ import struct
 import time
 import zlib
 
+import numpy
+
 from meta import name as appname, version
 from util_str import safe_str
 
@@ -127,6 +129,17 @@ class Image(object):
 			raise ValueError("Unsupported bitdepth: %r" % self.bitdepth)
 		return data
 
+	def _pack_array(self, array):
+		""" Pack array of samples, return array of bytes """
+		if self.bitdepth == 16:
+			dtype = ">u2"
+		elif self.bitdepth == 8:
+			dtype = numpy.uint8
+		else:
+			raise ValueError("Unsupported bitdepth: %r" % self.bitdepth)
+		array = numpy.floor(numpy.asarray(array, dtype=numpy.float64) + .5)
+		return array.astype(dtype).view(numpy.uint8)
+
 	def _write_dpx(self, stream, dimensions=None):
 		# Very helpful: http://www.fileformat.info/format/dpx/egff.htm
 		# http://www.simplesystems.org/users/bfriesen/dpx/S268M_Revised.pdf
@@ -333,16 +346,24 @@ class Image(object):
 		stream.write(ihdr)
 		stream.write(struct.pack(">I", zlib.crc32(ihdr) & 0xFFFFFFFF))
 		# IDAT image data chunk type
-		imgdata = []
-		for i, scanline in enumerate(self.data):
-			# Add a scanline, filter type 0
-			imgdata.append("\0")
-			for RGB in scanline:
-				RGB = "".join(self._pack(v) for v in RGB)
-				if optimize:
-					RGB *= dimensions[0]
-				imgdata.append(RGB)
-		imgdata = "".join(imgdata)
+		if isinstance(self.data, numpy.ndarray) and not optimize:
+			imgdata = self._pack_array(self.data)
+			# Add scanlines, filter type 0
+			imgdata = imgdata.reshape((h, -1))
+			scanlines = numpy.zeros((h, imgdata.shape[1] + 1), numpy.uint8)
+			scanlines[:, 1:] = imgdata
+			imgdata = scanlines.tostring()
+		else:
+			imgdata = []
+			for i, scanline in enumerate(self.data):
+				# Add a scanline, filter type 0
+				imgdata.append("\0")
+				for RGB in scanline:
+					RGB = "".join(self._pack(v) for v in RGB)
+					if optimize:
+						RGB *= dimensions[0]
+					imgdata.append(RGB)
+			imgdata = "".join(imgdata)
 		if optimize:
 			imgdata *= dimensions[1]
 		imgdata = zlib.compress(imgdata, 9)
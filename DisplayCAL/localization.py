@@ -1,20 +1,110 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import with_statement
+from hashlib import md5
 import __builtin__
 import locale
+import marshal
 import os
 import re
 import sys
 
 from config import data_dirs, defaults, getcfg, storage
 from debughelpers import handle_error
+from defaultpaths import cache
 from lazydict import LazyDict_YAML_UltraLite
 from log import safe_print
+from meta import name as appname
 from options import debug_localization as debug
-from util_os import expanduseru
+from util_os import atomic_write, expanduseru
 from util_str import safe_unicode
 
 
+FORMAT_SPEC = re.compile(r"%\d?(?:\.\d+)?[deEfFgGiorsxX]")
+
+
+class Catalog(LazyDict_YAML_UltraLite):
+
+	"""
+	Language catalog
+	
+	Besides the strings, holds the conversion types of the format specs in
+	each string (fmt). On first load, the YAML file is compiled to a binary
+	(marshal) catalog in the cache directory which is used instead of parsing
+	the YAML file as long as the latter's mtime and size are unchanged or its
+	MD5 hash still matches.
+	
+	"""
+
+	# Increment when the compiled format changes
+	compiled_version = 1
+
+	def __init__(self, path=None, encoding="UTF-8", errors="strict",
+				 debug=False):
+		LazyDict_YAML_UltraLite.__init__(self, path, encoding, errors, debug)
+		self.fmt = {}
+
+	@property
+	def compiled_path(self):
+		return os.path.join(cache, appname, "lang",
+							"%s.%s.marshal" %
+							(os.path.splitext(os.path.basename(self.path))[0],
+							 md5(safe_unicode(self.path).encode("UTF-8")).hexdigest()))
+
+	def parse(self, fileobj):
+		stat = os.stat(self.path)
+		compiled = self._load_compiled(stat)
+		if compiled:
+			dict.update(self, compiled["strings"])
+			self.fmt = compiled["fmt"]
+			return
+		LazyDict_YAML_UltraLite.parse(self, fileobj)
+		for id_str, lstr in dict.iteritems(self):
+			conversions = "".join(spec[-1] for spec in FORMAT_SPEC.findall(lstr))
+			if conversions:
+				self.fmt[id_str] = conversions
+		self._write_compiled(stat)
+
+	def _get_hash(self):
+		with open(self.path, "rb") as yamlfile:
+			return md5(yamlfile.read()).hexdigest()
+
+	def _load_compiled(self, stat):
+		""" Return compiled catalog dict if up to date, else None """
+		try:
+			with open(self.compiled_path, "rb") as compiledfile:
+				compiled = marshal.load(compiledfile)
+		except (EOFError, IOError, OSError, TypeError, ValueError):
+			return None
+		if (not isinstance(compiled, dict) or
+			compiled.get("version") != self.compiled_version or
+			compiled.get("python") != tuple(sys.version_info[:2])):
+			return None
+		if (compiled.get("mtime") != stat.st_mtime or
+			compiled.get("size") != stat.st_size):
+			# Touched, copied or reinstalled?
+			if compiled.get("md5") != self._get_hash():
+				return None
+			self._write_compiled(stat, compiled)
+		return compiled
+
+	def _write_compiled(self, stat, compiled=None):
+		""" Atomically write compiled catalog """
+		if not compiled:
+			compiled = {"version": self.compiled_version,
+						"python": tuple(sys.version_info[:2]),
+						"md5": self._get_hash(),
+						"strings": dict(dict.iteritems(self)),
+						"fmt": self.fmt}
+		compiled["mtime"] = stat.st_mtime
+		compiled["size"] = stat.st_size
+		try:
+			atomic_write(self.compiled_path, marshal.dumps(compiled))
+		except (IOError, OSError), exception:
+			safe_print("Warning - could not write compiled language catalog:",
+					   exception)
+
+
 def init(set_wx_locale=False):
 	"""
 	Populate translation dict with found language strings and set locale.
@@ -37,7 +127,7 @@ def init(set_wx_locale=False):
 					name, ext = os.path.splitext(filename)
 					if ext.lower() == ".yaml" and name.lower() not in ldict:
 						path = os.path.join(langdir, filename)
-						ldict[name.lower()] = LazyDict_YAML_UltraLite(path)
+						ldict[name.lower()] = Catalog(path)
 	if len(ldict) == 0:
 		handle_error(UserWarning("Warning: No language files found. The "
 								 "following places have been searched:\n%s" %
@@ -82,11 +172,12 @@ def getstr(id_str, strvars=None, lcode=None, default=None):
 	""" Get a translated string from the dictionary """
 	if not lcode:
 		lcode = getcode()
-	if not lcode in ldict or not id_str in ldict[lcode]:
+	lcatalog = ldict.get(lcode)
+	if lcatalog is None or not id_str in lcatalog:
 		# fall back to english
-		lcode = "en"
-	if lcode in ldict and id_str in ldict[lcode]:
-		lstr = ldict[lcode][id_str]
+		lcatalog = ldict.get("en")
+	if lcatalog is not None and id_str in lcatalog:
+		lstr = dict.__getitem__(lcatalog, id_str)
 		if debug:
 			if not id_str in usage or not isinstance(usage[id_str], int):
 				usage[id_str] = 1
@@ -95,16 +186,16 @@ def getstr(id_str, strvars=None, lcode=None, default=None):
 		if strvars is not None:
 			if not isinstance(strvars, (list, tuple)):
 				strvars = [strvars]
-			fmt = re.findall(r"%\d?(?:\.\d+)?[deEfFgGiorsxX]", lstr)
+			fmt = lcatalog.fmt.get(id_str, "")
 			if len(fmt) == len(strvars):
 				if not isinstance(strvars, list):
 					strvars = list(strvars)
 				for i, s in enumerate(strvars):
-					if fmt[i].endswith("s"):
+					if fmt[i] == "s":
 						s = safe_unicode(s)
-					elif not fmt[i].endswith("r"):
+					elif fmt[i] != "r":
 						try:
-							if fmt[i][-1] in "dioxX":
+							if fmt[i] in "dioxX":
 								s = int(s)
 							else:
 								s = float(s)
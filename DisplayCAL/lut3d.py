@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+3D LUT file writers
+
+Input grid and output values are handled as NumPy arrays of shape (N, 3).
+Rows are formatted in chunks with a single string formatting operation per
+chunk, so peak memory stays close to the size of the output array.
+
+"""
+
+from time import strftime
+import getpass
+import math
+import os
+
+import numpy
+
+from colormath import VidRGB_to_eeColor
+from meta import name as appname, version
+import imfile
+
+
+# Number of rows formatted at once
+CHUNKSIZE = 8192
+
+
+def grid_indexes(size, columns=(2, 1, 0), skip_last=False):
+	"""
+	Return 3D LUT grid indexes as (N, 3) integer array in file order
+
+	columns    Channel order from slowest to fastest changing
+	skip_last  Omit the last grid entry of each channel (eeColor)
+
+	"""
+	if skip_last:
+		count = size - 1
+	else:
+		count = size
+	indexes = numpy.empty((count ** 3, 3), dtype=numpy.intp)
+	grid = numpy.indices((count, ) * 3).reshape((3, -1))
+	for i, column in enumerate(columns):
+		indexes[:, column] = grid[i]
+	return indexes
+
+
+def round_half_away(v):
+	""" Round like Python 2 round(), i.e. half away from zero """
+	return numpy.copysign(numpy.floor(numpy.abs(v) + .5), v)
+
+
+def VidRGB_to_cLUT65(v):
+	""" Array version of colormath.VidRGB_to_cLUT65 """
+	return numpy.where(v <= 236.0 / 255.0, v * 255.0 / 256,
+					   1 - (1 - v) * (1 - 236.0 / 256) / (1 - 236.0 / 255.0))
+
+
+def write_rows(stream, rows, fmt, valsep=" ", linesep="\n"):
+	"""
+	Write (N, columns) array as lines of text
+
+	fmt  Format for all values, e.g. '%.6f' or '%i', or list of formats (one
+	     per column)
+
+	"""
+	if isinstance(fmt, basestring):
+		fmt = [fmt] * rows.shape[1]
+	rowfmt = valsep.join(fmt) + linesep
+	if set(fmt) == set(["%i"]):
+		rows = rows.astype(numpy.int64)
+	for start in xrange(0, len(rows), CHUNKSIZE):
+		chunk = rows[start:start + CHUNKSIZE]
+		stream.write((rowfmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def write_header(stream, lines, linesep="\n"):
+	stream.write("".join(line + linesep for line in lines))
+
+
+def write_3dl(stream, RGB_out, size, input_bits, output_bits, scale=1.0):
+	""" Autodesk/Kodak 3DL """
+	maxval = math.pow(2, output_bits) - 1
+	step = 1.0 / (size - 1)
+	write_header(stream, ["# Created with %s %s" % (appname, version),
+						  "# INPUT RANGE: %i" % input_bits,
+						  "# OUTPUT RANGE: %i" % output_bits,
+						  " ".join("%i" % math.ceil(i * step *
+													(2 ** input_bits - 1))
+								   for i in xrange(size))])
+	write_rows(stream, round_half_away(RGB_out / scale * maxval), "%i")
+
+
+def write_dcl(stream, RGB_out, output_bits, scale=1.0):
+	""" DeviceControl-LG """
+	maxval = math.pow(2, output_bits) - 1
+	write_header(stream, ["# DeviceControl-LG 3D"], "\r\n")
+	write_rows(stream, round_half_away(RGB_out / scale * maxval), "%i",
+			   linesep="\r\n")
+
+
+def write_cube(stream, RGB_out, size, maxval=1.0):
+	""" IRIDAS/Resolve .cube """
+	fp_offset = str(maxval).find(".")
+	domain_max = "DOMAIN_MAX %s %s %s" % (("%%.%if" %
+										   len(str(maxval)[fp_offset + 1:]), )
+										  * 3)
+	write_header(stream, ["# Created with %s %s" % (appname, version),
+						  "LUT_3D_SIZE %i" % size,
+						  "DOMAIN_MIN 0.0 0.0 0.0",
+						  domain_max % ((maxval ,) * 3),
+						  ""])
+	write_rows(stream, RGB_out * maxval, "%.6f")
+
+
+def write_spi3d(stream, RGB_out, size, indexes, maxval=1.0):
+	""" Sony Imageworks .spi3d """
+	write_header(stream, ["SPILUT 1.0", "3 3", "%i %i %i" % ((size, ) * 3)])
+	write_rows(stream, numpy.hstack((indexes, RGB_out * maxval)),
+			   ["%i"] * 3 + ["%.6f"] * 3)
+
+
+def write_eecolor(stream, RGB_out, RGB_oin, maxval=1.0, RGBw=None):
+	"""
+	eeColor 3D LUT
+
+	If RGBw is given (full range output), the cLUT output is scaled so that
+	it maps to 1.0 (the eeColor output curves have to correct for this).
+
+	"""
+	RGB_out = RGB_out * maxval
+	if RGBw is not None:
+		RGB_out /= RGBw
+		RGB_out = numpy.minimum(RGB_out, 1)
+	write_rows(stream, numpy.hstack((RGB_oin * maxval,
+									 VidRGB_to_eeColor(RGB_out))),
+			   "%.6f", linesep="\r\n")
+
+
+def write_mga(stream, RGB_out, size, output_bits, filename):
+	""" Pandora .mga """
+	maxval = 2 ** output_bits - 1
+	write_header(stream, ["#HEADER",
+						  "#filename: %s" % os.path.basename(filename),
+						  "#type: 3D cube file",
+						  "#format: 1.00",
+						  "#created: %s" % strftime("%d %B %Y"),
+						  "#owner: %s" % getpass.getuser(),
+						  "#title: %s" %
+						  os.path.splitext(os.path.basename(filename))[0],
+						  "#END",
+						  "",
+						  "channel 3d",
+						  "in %i" % (size ** 3),
+						  "out %i" % (maxval + 1),
+						  "",
+						  "format lut",
+						  "",
+						  "values\tred\tgreen\tblue"])
+	write_rows(stream, numpy.column_stack((numpy.arange(len(RGB_out)),
+										   round_half_away(RGB_out * maxval))),
+			   "%i", "\t")
+
+
+def write_png(stream, RGB_out, size, output_bits, layout="v"):
+	"""
+	3D LUT as image (e.g. ReShade)
+
+	Vertical layout stacks the size blocks of size x size pixels on top of
+	each other, horizontal layout puts them side by side.
+
+	"""
+	if output_bits > 8:
+		# PNG only supports 8 and 16 bit
+		output_bits = 16
+	maxval = 2 ** output_bits - 1
+	data = (RGB_out * maxval).reshape((size, size, size, 3))
+	if layout == "h":
+		data = data.transpose((1, 0, 2, 3)).reshape((size, size ** 2, 3))
+	else:
+		data = data.reshape((size ** 2, size, 3))
+	im = imfile.Image(data, output_bits)
+	im.write(stream)
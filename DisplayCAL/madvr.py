@@ -11,6 +11,7 @@ from zlib import crc32
 import ctypes
 import errno
 import getpass
+import mmap
 import os
 import platform
 import socket
@@ -23,11 +24,14 @@ if sys.platform == "win32":
 if sys.platform == "win32":
 	import win32api
 
+import numpy
+
 import ICCProfile as ICCP
 import colormath
 import cubeiterator as ci
 import localization as lang
 import worker_base
+from icctransform import Transform
 from imfile import tiff_get_header
 from log import safe_print as log_safe_print
 from meta import name as appname, version
@@ -169,33 +173,35 @@ def icc_device_link_to_madvr(icc_device_link_filename, unity=False,
 	clutmax = clutres - 1.0
 	if unity:
 		logfile.write("Writing unity madVR 3D LUT...\n")
-		prevperc = -1
-		for a in xrange(clutres):
-			for b in xrange(clutres):
-				for c in xrange(clutres):
-					# Optimize for speed
-					B, G, R = chr(c), chr(b), chr(a)
-					raw.write(B + B + G + G + R + R)
-			perc = round(a / clutmax * 100)
-			if perc > prevperc:
-				logfile.write("\r%i%%" % perc)
-				prevperc = perc
+		h3dlut_write_clut(raw, raw.tell(), None, clutres, logfile)
 	else:
 		link = ICCP.ICCProfile(icc_device_link_filename)
-		# Need a worker for abort event handling
-		worker = worker_base.WorkerBase()
-		# icclu verbose=0 gives a speed increase
-		xicclu = worker_base.MP_Xicclu(link, scale=clutmax, use_icclu=True,
-									   logfile=logfile,
-									   output_format=("<H", 65535),
-									   reverse=True, output_stream=raw,
-									   convert_video_rgb_to_clut65=convert_video_rgb_to_clut65,
-									   verbose=0, worker=worker)
-		xicclu._in = ci.Cube3D(clutres)
-		logfile.write("Looking up 256^3 input values through device link and "
-					  "writing madVR 3D LUT...\n")
-		xicclu.exit()
-		xicclu.get()
+		try:
+			transform = Transform(link)
+		except NotImplementedError, exception:
+			safe_print("Info: Can't interpolate device link in-process, "
+					   "using icclu:", exception)
+			transform = None
+		if transform:
+			logfile.write("Interpolating 256^3 input values through device "
+						  "link and writing madVR 3D LUT...\n")
+			h3dlut_write_clut(raw, raw.tell(), transform, clutres, logfile,
+							  convert_video_rgb_to_clut65)
+		else:
+			# Need a worker for abort event handling
+			worker = worker_base.WorkerBase()
+			# icclu verbose=0 gives a speed increase
+			xicclu = worker_base.MP_Xicclu(link, scale=clutmax, use_icclu=True,
+										   logfile=logfile,
+										   output_format=("<H", 65535),
+										   reverse=True, output_stream=raw,
+										   convert_video_rgb_to_clut65=convert_video_rgb_to_clut65,
+										   verbose=0, worker=worker)
+			xicclu._in = ci.Cube3D(clutres)
+			logfile.write("Looking up 256^3 input values through device link "
+						  "and writing madVR 3D LUT...\n")
+			xicclu.exit()
+			xicclu.get()
 
 	if append_linear_cal:
 		# Append a MadVR cal1 table to the 3dlut.
@@ -235,6 +241,63 @@ def icc_device_link_to_madvr(icc_device_link_filename, unity=False,
 	return True
 
 
+def h3dlut_write_clut(stream, offset, transform=None, clutres=256,
+					  logfile=None, convert_video_rgb_to_clut65=False):
+	"""
+	Write madVR 3D LUT data (little endian BGR uint16) to file at offset
+	
+	Input values are looked up through 'transform' (unity if None) in slabs
+	of clutres ** 2 entries, which are written to the memory-mapped file
+	directly, so memory use does not depend on the 3D LUT size.
+	
+	The stream is positioned after the 3D LUT data afterwards.
+	
+	"""
+	clutmax = clutres - 1.0
+	slabsize = clutres ** 2 * 6
+	size = clutres * slabsize
+	stream.flush()
+	stream.truncate(offset + size)
+	grid = numpy.arange(clutres) / clutmax
+	G = numpy.repeat(grid, clutres)
+	B = numpy.tile(grid, clutres)
+	if convert_video_rgb_to_clut65:
+		# See worker_base.Xicclu.devi_devip
+		threshold = 236 / 256.0
+		G, B = [numpy.where(v > threshold,
+							colormath.convert_range(v, threshold, 1,
+													threshold, 255 / 256.0),
+							v) * (256 / 255.0) for v in (G, B)]
+		G, B = [numpy.where(v <= 236 / 255.0, v * (255 / 256.0),
+							1 - (1 - v) * (1 - 236 / 256.0) / (1 - 236 / 255.0))
+				for v in (G, B)]
+	clut = mmap.mmap(stream.fileno(), 0)
+	try:
+		prevperc = -1
+		for a in xrange(clutres):
+			if transform:
+				RGB = numpy.column_stack((numpy.repeat(G[a * clutres],
+													   clutres ** 2), G, B))
+				RGB = transform(RGB)
+				if convert_video_rgb_to_clut65:
+					# See colormath.VidRGB_to_eeColor
+					RGB *= 255 / 256.0
+			else:
+				RGB = numpy.column_stack((numpy.repeat(grid[a], clutres ** 2),
+										  G, B))
+			BGR = numpy.floor(numpy.clip(RGB[:, ::-1], 0, 1) * 65535 + .5)
+			start = offset + a * slabsize
+			clut[start:start + slabsize] = BGR.astype("<u2").tostring()
+			perc = round(a / clutmax * 100)
+			if perc > prevperc and logfile:
+				logfile.write("\r%i%%" % perc)
+				prevperc = perc
+		clut.flush()
+	finally:
+		clut.close()
+	stream.seek(offset + size)
+
+
 def inet_pton(ip_string):
 	"""
 	inet_pton(string) -> packed IP representation
@@ -11,6 +11,12 @@ import multiprocessing.pool
 import sys
 import threading
 
+import numpy
+
+
+# Shared memory array of the current pool worker process (see pool_slice)
+_shared_array = None
+
 
 def cpu_count(limit_by_total_vmem=True):
 	"""
@@ -60,6 +66,13 @@ def pool_slice(func, data_in, args=(), kwds={}, num_workers=None,
 	which is passed as the first argument to 'func', and put its progress
 	percentage into the queue which is passed as the second argument to 'func'.
 	
+	If data_in is a NumPy array, it is copied once into shared memory (as
+	float64) instead of pickling each slice to the workers. 'func' then gets
+	a view of its slice of the shared array, and is expected to write its
+	results in-place (or return an array of the same shape). The returned
+	slices are views of the shared result array, so they can be merged with
+	numpy.concatenate.
+	
 	"""
 	from config import getcfg
 
@@ -80,8 +93,18 @@ def pool_slice(func, data_in, args=(), kwds={}, num_workers=None,
 		num_batches = 1
 		chunksize = float(len(data_in)) / num_workers
 
+	shared = isinstance(data_in, numpy.ndarray)
+	initializer = None
+	initargs = ()
+
 	if num_workers > 1:
 		Pool = NonDaemonicPool
+		if shared:
+			raw_array = mp.RawArray("d", data_in.size)
+			data_out = numpy.frombuffer(raw_array).reshape(data_in.shape)
+			data_out[:] = data_in
+			initializer = _init_shared_array
+			initargs = (raw_array, data_in.shape)
 		manager = mp.Manager()
 		if thread_abort is not None and not isinstance(thread_abort.event,
 													   mp.managers.EventProxy):
@@ -99,6 +122,8 @@ def pool_slice(func, data_in, args=(), kwds={}, num_workers=None,
 		Pool = FakePool
 		manager = None
 		Queue = FakeQueue
+		if shared:
+			data_out = numpy.array(data_in, dtype=numpy.float64)
 
 	if thread_abort is not None:
 		thread_abort_event = thread_abort.event
@@ -135,28 +160,41 @@ def pool_slice(func, data_in, args=(), kwds={}, num_workers=None,
 							   progress * num_workers * num_batches),
 						 name="ProcessProgressLogger").start()
 
-	pool = Pool(num_workers)
+	pool = Pool(num_workers, initializer, initargs)
 	results = []
+	slices = []
 	start = 0
 	for batch in xrange(num_batches):
 		for i in xrange(batch * num_workers, (batch + 1) * num_workers):
 			end = int(math.ceil(chunksize * (i + 1)))
+			if not shared:
+				data = data_in[start:end]
+			elif num_workers > 1:
+				data = SharedSlice(start, end)
+			else:
+				data = data_out[start:end]
 			results.append(pool.apply_async(WorkerFunc(func,
 													   batch == num_batches - 1),
-											(data_in[start:end],
+											(data,
 											 thread_abort_event,
 											 progress_queue) + args, kwds))
+			slices.append((start, end))
 			start = end
 
 	# Get results
 	exception = None
-	data_out = []
-	for result in results:
+	results_out = []
+	for (start, end), result in zip(slices, results):
 		result = result.get()
 		if isinstance(result, Exception):
 			exception = result
 			continue
-		data_out.append(result)
+		if shared:
+			if result is not None and not numpy.may_share_memory(result,
+																  data_out):
+				data_out[start:end] = result
+			result = data_out[start:end]
+		results_out.append(result)
 
 	pool.close()
 	pool.join()
@@ -173,7 +211,25 @@ def pool_slice(func, data_in, args=(), kwds={}, num_workers=None,
 	if exception:
 		raise exception
 
-	return data_out
+	return results_out
+
+
+def _init_shared_array(raw_array, shape):
+	""" Pool worker initializer for shared memory array """
+	global _shared_array
+	_shared_array = numpy.frombuffer(raw_array).reshape(shape)
+
+
+class SharedSlice(object):
+
+	""" Reference to a slice of the worker process' shared memory array """
+
+	def __init__(self, start, end):
+		self.start = start
+		self.end = end
+
+	def get(self):
+		return _shared_array[self.start:self.end]
 
 
 class WorkerFunc(object):
@@ -185,6 +241,19 @@ class WorkerFunc(object):
 	def __call__(self, data, thread_abort_event, progress_queue, *args, **kwds):
 		from log import safe_log, safe_print
 		try:
+			if isinstance(data, SharedSlice):
+				data = data.get()
+				result = self.func(data, thread_abort_event, progress_queue,
+								   *args, **kwds)
+				if (isinstance(result, numpy.ndarray) and
+					not numpy.may_share_memory(result, data)):
+					# Write results to shared memory
+					data[:] = result
+				elif not isinstance(result, numpy.ndarray):
+					# Exception or Info instance
+					return result
+				# Don't send the data back, the parent can access it directly
+				return None
 			return self.func(data, thread_abort_event, progress_queue, *args,
 							 **kwds)
 		except Exception, exception:
@@ -22,6 +22,10 @@ elif ("-d1" in sys.argv[1:] or "--debug=1" in sys.argv[1:] or
 else:
 	debug = 0
 
+# Debug configuration lookups (count getcfg calls per option)
+debug_config = ("-dc" in sys.argv[1:] or
+				"--debug-config" in sys.argv[1:])
+
 # Debug localization
 debug_localization = ("-dl" in sys.argv[1:] or
 					  "--debug-localization" in sys.argv[1:])
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed on-disk cache for synthesized profiles
+
+Entries are binary ICC profiles named after the MD5 hex digest of a canonical
+representation of all parameters that went into creating them (input
+profiles are represented by their ID). The least recently used entries are
+evicted once the total size of the cache exceeds its limit.
+
+"""
+
+from binascii import hexlify
+from hashlib import md5
+import os
+
+import numpy
+
+from defaultpaths import cache
+from log import safe_print
+from meta import name as appname, version
+from util_os import atomic_write
+import ICCProfile as ICCP
+
+
+def canonical_repr(obj):
+	""" Return a canonical bytestring representation of (nested) obj """
+	if isinstance(obj, ICCP.ICCProfile):
+		return "ICC(%s)" % hexlify(obj.calculateID(False))
+	elif isinstance(obj, dict):
+		return "{%s}" % ",".join("%s:%s" % (canonical_repr(key),
+											canonical_repr(obj[key]))
+								 for key in sorted(obj))
+	elif isinstance(obj, numpy.ndarray):
+		return canonical_repr(obj.tolist())
+	elif isinstance(obj, (list, tuple)):
+		return "[%s]" % ",".join(canonical_repr(item) for item in obj)
+	elif obj is None or isinstance(obj, bool):
+		return repr(obj)
+	elif isinstance(obj, (int, long, float, numpy.number)):
+		return repr(float(obj))
+	elif isinstance(obj, unicode):
+		return repr(obj.encode("UTF-8"))
+	return repr(obj)
+
+
+class ProfileCache(object):
+
+	""" On-disk profile cache with size-based LRU eviction """
+
+	def __init__(self, path=None, maxsize=256 * 1024 * 1024, logfn=safe_print):
+		if not path:
+			path = os.path.join(cache, appname, "profiles")
+		self.path = path
+		self.maxsize = maxsize
+		self.logfn = logfn
+
+	def key(self, *args, **kwargs):
+		""" Return cache key for the given creation parameters """
+		return md5(canonical_repr([version, args, kwargs])).hexdigest()
+
+	def get_filename(self, key):
+		return os.path.join(self.path, key + ".icc")
+
+	def get(self, key):
+		""" Return cached profile for key or None """
+		filename = self.get_filename(key)
+		try:
+			with open(filename, "rb") as cachefile:
+				data = cachefile.read()
+			profile = ICCP.ICCProfile(data, use_cache=False)
+		except (IOError, OSError, ICCP.ICCProfileInvalidError):
+			if self.logfn:
+				self.logfn("Profile cache miss:", key)
+			return None
+		try:
+			# Update access time for LRU eviction
+			os.utime(filename, None)
+		except OSError:
+			pass
+		if self.logfn:
+			self.logfn("Profile cache hit:", key)
+		return profile
+
+	def set(self, key, profile):
+		""" Atomically write profile to the cache, then evict old entries """
+		try:
+			atomic_write(self.get_filename(key), profile.data)
+		except (IOError, OSError), exception:
+			if self.logfn:
+				self.logfn("Warning - could not write to profile cache:",
+						   exception)
+			return False
+		if self.logfn:
+			self.logfn("Stored in profile cache:", key)
+		self.evict()
+		return True
+
+	def evict(self):
+		""" Remove least recently used entries exceeding the size limit """
+		entries = []
+		total = 0
+		for name in os.listdir(self.path):
+			if not name.endswith(".icc"):
+				continue
+			filename = os.path.join(self.path, name)
+			try:
+				stat = os.stat(filename)
+			except OSError:
+				continue
+			entries.append((stat.st_mtime, stat.st_size, filename))
+			total += stat.st_size
+		entries.sort()
+		for mtime, size, filename in entries:
+			if total <= self.maxsize:
+				break
+			try:
+				os.remove(filename)
+			except OSError, exception:
+				if self.logfn:
+					self.logfn("Warning - could not remove %s:" % filename,
+							   exception)
+			else:
+				total -= size
+				if self.logfn:
+					self.logfn("Evicted from profile cache:",
+							   os.path.basename(filename))
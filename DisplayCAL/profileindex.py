@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent index of installed ICC profiles
+
+The index remembers the listing of every directory below the ICC profile
+directories (keyed by directory path and mtime) and the header fields of
+every profile in them (keyed by file path, mtime and size). Only directories
+whose mtime changed are listed again on update, and only new or changed
+profiles are opened. The index is stored as a binary (marshal) file in the
+cache directory.
+
+Updates are throttled to one per update_interval seconds, because looking up
+a profile by name would otherwise stat every directory each time.
+
+"""
+
+from __future__ import with_statement
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+
+from defaultpaths import cache, iccprofiles, iccprofiles_home
+from log import safe_print
+from meta import name as appname
+from util_os import atomic_write
+from util_str import safe_unicode
+import ICCProfile as ICCP
+
+
+# Header fields stored per profile. Names are ICCProfile attribute names,
+# except description (getDescription())
+FIELDS = ("profileClass", "colorSpace", "connectionColorSpace", "version",
+		  "description", "ID")
+
+ICC_EXT = re.compile("\.ic[cm]$", re.IGNORECASE)
+
+
+def get_profile_header(path):
+	""" Return dict of indexed header fields for profile path """
+	profile = ICCP.ICCProfile(path, load=False)
+	try:
+		header = {"description": profile.getDescription()}
+	finally:
+		profile.close()
+	for field in FIELDS:
+		if field != "description":
+			header[field] = getattr(profile, field)
+	return header
+
+
+class ProfileIndex(object):
+
+	""" Persistent index of the profiles in a list of directories """
+
+	# Increment when the stored format changes
+	index_version = 1
+
+	# Minimum number of seconds between updates unless forced
+	update_interval = 5
+
+	def __init__(self, roots=None, path=None):
+		if roots is None:
+			# Same order as used for finding profiles by name
+			roots = iccprofiles_home + filter(lambda x: x not in
+											  iccprofiles_home, iccprofiles)
+		if not path:
+			path = os.path.join(cache, appname, "profileindex.marshal")
+		self.roots = list(roots)
+		self.path = path
+		# Directory path -> [mtime, subdirectory names, file names]
+		self.dirs = {}
+		# Profile path -> {"mtime": mtime, "size": size, <header fields>}
+		# Header fields are None for files that are not valid profiles
+		self.entries = {}
+		self.dirty = False
+		self.loaded = False
+		self.lock = threading.RLock()
+		# Time of the last update
+		self.updated = None
+
+	def load(self):
+		""" Load the stored index (if any and compatible) """
+		with self.lock:
+			self.loaded = True
+			try:
+				with open(self.path, "rb") as indexfile:
+					index = marshal.load(indexfile)
+			except (EOFError, IOError, OSError, TypeError, ValueError):
+				return False
+			if (not isinstance(index, dict) or
+				index.get("version") != self.index_version or
+				index.get("python") != tuple(sys.version_info[:2])):
+				return False
+			self.dirs = index["dirs"]
+			self.entries = index["entries"]
+			return True
+
+	def save(self):
+		""" Atomically write the index if it changed """
+		with self.lock:
+			if not self.dirty:
+				return True
+			index = {"version": self.index_version,
+					 "python": tuple(sys.version_info[:2]),
+					 "dirs": self.dirs,
+					 "entries": self.entries}
+			try:
+				atomic_write(self.path, marshal.dumps(index))
+			except (IOError, OSError, ValueError), exception:
+				safe_print("Warning - could not write profile index:",
+						   exception)
+				return False
+			self.dirty = False
+			return True
+
+	def update(self, force=True):
+		"""
+		Bring the index up to date with the directories on disk
+
+		Only directories whose mtime changed are listed again. Profiles are
+		re-read if they are new or their mtime or size changed. Entries for
+		profiles outside the directories (see select) are removed if the
+		file no longer exists.
+
+		If force evaluates to False, nothing is done if the last update was
+		less than update_interval seconds ago.
+
+		Return True if the index was updated.
+
+		"""
+		with self.lock:
+			if (not force and self.updated is not None and
+				0 <= time.time() - self.updated < self.update_interval):
+				return False
+			if not self.loaded:
+				self.load()
+			seen = set()
+			for root in self.roots:
+				if root not in seen and os.path.isdir(root):
+					self._update_dir(root, seen)
+			for dirpath in self.dirs.keys():
+				if dirpath not in seen:
+					self._remove_dir(dirpath)
+					self.dirty = True
+			for path in self.entries.keys():
+				if (os.path.dirname(path) not in self.dirs and
+					not os.path.isfile(path)):
+					del self.entries[path]
+					self.dirty = True
+			self.save()
+			self.updated = time.time()
+			return True
+
+	def _update_dir(self, dirpath, seen):
+		seen.add(dirpath)
+		try:
+			mtime = os.stat(dirpath).st_mtime
+		except OSError:
+			return
+		listing = self.dirs.get(dirpath)
+		if not listing or listing[0] != mtime:
+			try:
+				names = os.listdir(dirpath)
+			except OSError, exception:
+				safe_print(u"Warning - could not list %s: %s" %
+						   (safe_unicode(dirpath), safe_unicode(exception)))
+				return
+			subdirs = []
+			basenames = []
+			for name in sorted(names):
+				path = os.path.join(dirpath, name)
+				if os.path.isdir(path):
+					# Like os.walk, don't follow symlinks to directories
+					if not os.path.islink(path):
+						subdirs.append(name)
+				else:
+					basenames.append(name)
+			if listing:
+				# Forget profiles which are gone
+				for name in set(listing[2]).difference(basenames):
+					self.entries.pop(os.path.join(dirpath, name), None)
+			listing = [mtime, subdirs, basenames]
+			self.dirs[dirpath] = listing
+			for name in filter(ICC_EXT.search, basenames):
+				self.get(os.path.join(dirpath, name))
+			self.dirty = True
+		for name in listing[1]:
+			subdir = os.path.join(dirpath, name)
+			if subdir not in seen:
+				self._update_dir(subdir, seen)
+
+	def _remove_dir(self, dirpath):
+		listing = self.dirs.pop(dirpath)
+		for name in listing[2]:
+			self.entries.pop(os.path.join(dirpath, name), None)
+
+	def _walk(self):
+		""" Yield (dirpath, file names) in the order lookups should use """
+		seen = set()
+		for root in self.roots:
+			stack = [root]
+			while stack:
+				dirpath = stack.pop()
+				if dirpath in seen or dirpath not in self.dirs:
+					continue
+				seen.add(dirpath)
+				subdirs, basenames = self.dirs[dirpath][1:]
+				yield dirpath, basenames
+				stack.extend(os.path.join(dirpath, name)
+							 for name in reversed(subdirs))
+
+	def find(self, basename):
+		""" Return the path of the first file named basename or None """
+		with self.lock:
+			for dirpath, basenames in self._walk():
+				if basename in basenames:
+					return os.path.join(dirpath, basename)
+
+	def paths(self):
+		""" Return paths of all indexed profiles (by file extension) """
+		with self.lock:
+			return [os.path.join(dirpath, name)
+					for dirpath, basenames in self._walk()
+					for name in filter(ICC_EXT.search, basenames)]
+
+	def get(self, path):
+		"""
+		Return the index entry for profile path
+
+		The entry is (re-)read if path isn't indexed yet or its mtime or size
+		changed. Returns None if path does not exist.
+
+		"""
+		try:
+			stat = os.stat(path)
+		except OSError:
+			with self.lock:
+				if self.entries.pop(path, None):
+					self.dirty = True
+			return None
+		with self.lock:
+			entry = self.entries.get(path)
+			if (entry and entry["mtime"] == stat.st_mtime and
+				entry["size"] == stat.st_size):
+				return entry
+			try:
+				entry = get_profile_header(path)
+			except (IOError, ICCP.ICCProfileInvalidError):
+				entry = dict.fromkeys(FIELDS)
+			except Exception, exception:
+				safe_print(u"Warning - could not read %s: %s" %
+						   (safe_unicode(path), safe_unicode(exception)))
+				entry = dict.fromkeys(FIELDS)
+			entry["mtime"] = stat.st_mtime
+			entry["size"] = stat.st_size
+			self.entries[path] = entry
+			self.dirty = True
+			return entry
+
+	def select(self, paths=None, **criteria):
+		"""
+		Return the paths of valid profiles matching all criteria
+
+		Criteria are header field names with either a value to compare to or a
+		callable taking the field value and returning a boolean. If paths is
+		not given, all indexed profiles are considered.
+
+		"""
+		if paths is None:
+			paths = self.paths()
+		selected = []
+		for path in paths:
+			entry = self.get(path)
+			if not entry or entry["profileClass"] is None:
+				continue
+			for field, criterion in criteria.iteritems():
+				value = entry[field]
+				if callable(criterion):
+					if not criterion(value):
+						break
+				elif value != criterion:
+					break
+			else:
+				selected.append(path)
+		return selected
+
+
+_index = None
+
+
+def get_index(update=True, force=False):
+	"""
+	Return the shared profile index, optionally updating it first
+
+	Unless force evaluates to True, the update is skipped if the last one
+	was less than ProfileIndex.update_interval seconds ago.
+
+	"""
+	global _index
+	if not _index:
+		_index = ProfileIndex()
+	if update:
+		_index.update(force)
+	return _index
+
+
+def find(basename):
+	"""
+	Return the path of the first profile file named basename or None
+
+	If the profile isn't found (or no longer exists) and the index wasn't
+	just updated, the update is forced, so profiles added since the last
+	update can always be found.
+
+	"""
+	index = get_index(False)
+	updated = index.update(False)
+	path = index.find(basename)
+	if (not path or not os.path.isfile(path)) and not updated:
+		index.update()
+		path = index.find(basename)
+	return path
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import with_statement
+
+from hashlib import md5
 from time import strftime
 import codecs
 import os
@@ -8,13 +11,78 @@ import shutil
 import sys
 
 from config import get_data_path, initcfg
-from meta import version_short
+from defaultpaths import cache
+from meta import name as appname, version_short
 from safe_print import safe_print
+from util_os import atomic_write
 from util_str import safe_unicode
 import jspacker
 import localization as lang
 
 
+INCLUDES = ("base.css", "compare.css", "print.css", "jsapi-packages.js",
+			"jsapi-patches.js", "compare.constants.js", "compare.variables.js",
+			"compare.functions.js", "compare.init.js", "uniformity.functions.js")
+
+# Part of the packed JavaScript cache key. Change when changing jspacker or
+# the packer options.
+PACKER_VERSION = "jspacker 2.0 62 fast_decode"
+
+# Packed JavaScript cache directory
+PACKED_JS_CACHE = os.path.join(cache, appname, "report")
+
+# Include file contents by path, with modification time, size and pack flag
+_includes = {}
+
+
+def pack_js(js):
+	"""
+	Return packed JavaScript
+	
+	Packing is slow, so results are cached on disk keyed by the MD5 of the
+	packer version and unpacked JavaScript.
+	
+	"""
+	key = md5(PACKER_VERSION + "\0" + js.encode("UTF-8")).hexdigest()
+	cachefilename = os.path.join(PACKED_JS_CACHE, key + ".js")
+	try:
+		with codecs.open(cachefilename, "r", "UTF-8") as cachefile:
+			return cachefile.read()
+	except (IOError, OSError):
+		pass
+	packer = jspacker.JavaScriptPacker()
+	js = packer.pack(js, 62, True).strip()
+	try:
+		atomic_write(cachefilename, js.encode("UTF-8"))
+	except (IOError, OSError), exception:
+		safe_print("Warning - could not cache packed JavaScript:", exception)
+	return js
+
+
+def get_include(include, pack=True):
+	""" Return contents of report include file (JavaScript optionally packed) """
+	path = get_data_path(os.path.join("report", include))
+	if not path:
+		raise IOError(lang.getstr("file.missing", include))
+	try:
+		stat = os.stat(path)
+		key = (stat.st_mtime, stat.st_size, pack)
+		if _includes.get(path, (None, ))[0] == key:
+			return _includes[path][1]
+		f = codecs.open(path, "r", "UTF-8")
+	except (IOError, OSError), exception:
+		raise exception.__class__(lang.getstr("error.file.open", path))
+	contents = f.read()
+	f.close()
+	if include.endswith(".js"):
+		if pack:
+			contents = pack_js(contents)
+	else:
+		contents = contents.strip()
+	_includes[path] = (key, contents)
+	return contents
+
+
 def create(report_path, placeholders2data, pack=True, templatename="report"):
 	""" Create a report with all placeholders substituted by data. """
 	# read report template
@@ -33,34 +101,20 @@ def create(report_path, placeholders2data, pack=True, templatename="report"):
 	report_html_template.close()
 	
 	# create report
-	for placeholder, data in placeholders2data.iteritems():
-		report_html = report_html.replace(placeholder, data)
-	
-	for include in ("base.css", "compare.css", "print.css", 
-					"jsapi-packages.js", "jsapi-patches.js", 
-					"compare.constants.js", "compare.variables.js", 
-					"compare.functions.js", "compare.init.js",
-					"uniformity.functions.js"):
-		path = get_data_path(os.path.join("report", include))
-		if not path:
-			raise IOError(lang.getstr("file.missing", include))
-		try:
-			f = codecs.open(path, "r", "UTF-8")
-		except (IOError, OSError), exception:
-			raise exception.__class__(lang.getstr("error.file.open", path))
+	substitutions = dict(placeholders2data)
+	for include in INCLUDES:
+		contents = get_include(include, pack)
 		if include.endswith(".js"):
-			js = f.read()
-			if pack:
-				packer = jspacker.JavaScriptPacker()
-				js = packer.pack(js, 62, True).strip()
-			report_html = report_html.replace('src="%s">' % include, 
-											  ">/*<![CDATA[*/\n" + 
-											  js + 
-											  "\n/*]]>*/")
+			substitutions['src="%s">' % include] = (">/*<![CDATA[*/\n" +
+													 contents + "\n/*]]>*/")
 		else:
-			report_html = report_html.replace('@import "%s";' % include, 
-											  f.read().strip())
-		f.close()
+			substitutions['@import "%s";' % include] = contents
+	# Substitute placeholders and includes in a single pass over the template
+	report_html = re.sub("|".join(re.escape(key) for key in
+								  sorted(substitutions, key=len,
+										 reverse=True)),
+						 lambda match: substitutions[match.group()],
+						 report_html)
 	
 	# write report
 	try:
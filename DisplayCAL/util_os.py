@@ -502,6 +502,33 @@ def make_win32_compatible_long_path(path, maxpath=259):
 	return path
 
 
+def atomic_write(path, data):
+	"""
+	Write data (bytestring) to path atomically
+	
+	Data is written to a temporary file in the same directory, which then
+	replaces the file at path (missing directories are created). On error,
+	the temporary file is removed and the exception re-raised.
+	
+	"""
+	dirname = os.path.dirname(path)
+	if dirname and not os.path.isdir(dirname):
+		os.makedirs(dirname)
+	fd, tmpfilename = tempfile.mkstemp(".tmp", os.path.basename(path) + "-",
+									   dirname or None)
+	try:
+		with os.fdopen(fd, "wb") as tmpfile:
+			tmpfile.write(data)
+		if sys.platform == "win32" and os.path.isfile(path):
+			# Windows can't rename over an existing file
+			os.remove(path)
+		os.rename(tmpfilename, path)
+	except:
+		if os.path.isfile(tmpfilename):
+			os.remove(tmpfilename)
+		raise
+
+
 def mkstemp_bypath(path, dir=None, text=False):
 	"""
 	Wrapper around mkstemp that uses filename and extension from path as prefix 
@@ -45,6 +45,7 @@ else:
 	import grp
 
 # 3rd party
+import numpy
 if sys.platform == "win32":
 	from win32com.shell import shell as win32com_shell
 	import pythoncom
@@ -86,7 +87,9 @@ from debughelpers import (Error, DownloadError, Info, UnloggedError,
 from defaultpaths import (cache, get_known_folder_path, iccprofiles_home,
 						  iccprofiles_display_home, appdata)
 from edid import WMIError, get_edid
+from gamut import GamutSurface
 from log import DummyLogger, LogFile, get_file_logger, log, safe_print
+import lut3d
 import madvr
 from meta import VERSION, VERSION_BASE, domain, name as appname, version
 from multiprocess import cpu_count, pool_slice
@@ -98,6 +101,7 @@ from patterngenerators import (PrismaPatternGeneratorClient,
 							   ResolveLSPatternGeneratorServer,
 							   ResolveCMPatternGeneratorServer,
 							   WebWinHTTPPatternGeneratorServer)
+from profilecache import ProfileCache
 from trash import trash
 from util_decimal import stripzeros
 from util_http import encode_multipart_formdata
@@ -371,6 +375,109 @@ def check_ti3_criteria1(RGB, XYZ, black_XYZ, white_XYZ,
 	return sRGBLab, Lab, delta_to_sRGB, criteria1, debuginfo
 
 
+def check_ti3_criteria1_array(RGB, XYZ, black_XYZ, white_XYZ,
+							  delta_to_sRGB_threshold_E=10,
+							  delta_to_sRGB_threshold_L=10,
+							  delta_to_sRGB_threshold_C=75,
+							  delta_to_sRGB_threshold_H=75):
+	"""
+	Array version of check_ti3_criteria1
+	
+	RGB and XYZ are (N, 3) arrays. Return sRGBLab and Lab arrays, a dict of
+	delta arrays and a boolean array of criteria1.
+	
+	"""
+	RGB = numpy.asarray(RGB, dtype=numpy.float64)
+	XYZ = numpy.asarray(XYZ, dtype=numpy.float64)
+	sRGBLab = colormath.RGB2Lab_array(RGB / 100.0, noadapt=not white_XYZ)
+	if white_XYZ:
+		if black_XYZ:
+			black_Lab = colormath.XYZ2Lab(*colormath.adapt(black_XYZ[0],
+														   black_XYZ[1],
+														   black_XYZ[2],
+														   white_XYZ))
+			black_C = math.sqrt(math.pow(black_Lab[1], 2) +
+								math.pow(black_Lab[2], 2))
+			if black_Lab[0] < 3 and black_C < 3:
+				# Sanity check: Is this color reasonably dark and achromatic?
+				# Then do BPC so we can compare better to perfect black sRGB
+				XYZ = colormath.blend_blackpoint_array(XYZ, black_XYZ, None,
+													   white_XYZ)
+		XYZ = colormath.adapt_array(XYZ, white_XYZ)
+	Lab = colormath.XYZ2Lab_array(XYZ)
+
+	delta_to_sRGB = colormath.delta_array(sRGBLab, Lab, 2000)
+
+	# Depending on how (a)chromatic the sRGB color is, scale the thresholds
+	# (see check_ti3_criteria1)
+	L, a, b = sRGBLab[:, 0], sRGBLab[:, 1], sRGBLab[:, 2]
+	b_pow = numpy.power(b, 2)
+	C = numpy.sqrt(numpy.power(a, 2) + b_pow)
+	C_pow = numpy.power(C, 7)
+	G = .5 * (1 - numpy.sqrt(C_pow / (C_pow + math.pow(25, 7))))
+	a = (1 + G) * a
+	C = numpy.sqrt(numpy.power(a, 2) + b_pow)
+	h = numpy.where((a == 0) & (b == 0), 0.0,
+					numpy.degrees(numpy.arctan2(b, a)) +
+					numpy.where(b >= 0, 0, 360.0))
+	C_scale = C / 100.0
+	h_scale = h / 360.0
+	HSV = colormath.RGB2HSV_array(RGB / 100.0)
+	H = HSV[:, 0]
+	SV_scale = HSV[:, 1] * HSV[:, 2]
+	CSV_scale = numpy.maximum(C_scale, SV_scale)
+	delta_to_sRGB_threshold_E += delta_to_sRGB_threshold_E * CSV_scale
+	delta_to_sRGB_threshold_L += delta_to_sRGB_threshold_L * CSV_scale
+	L_scale = numpy.maximum(1 - (1 * C_scale) + (100.0 - L) / 100.0, 1)
+	delta_to_sRGB_threshold_C = ((delta_to_sRGB_threshold_C * CSV_scale + 2) *
+								 L_scale)
+	delta_to_sRGB_threshold_H = ((delta_to_sRGB_threshold_H *
+								  numpy.maximum(numpy.maximum(CSV_scale,
+															  h_scale), H) +
+								  2) * L_scale)
+
+	delta_to_sRGB["E_ok"] = delta_to_sRGB["E"] <= delta_to_sRGB_threshold_E
+	delta_to_sRGB["L_ok"] = (numpy.abs(delta_to_sRGB["L"]) <=
+							 delta_to_sRGB_threshold_L)
+	delta_to_sRGB["C_ok"] = (numpy.abs(delta_to_sRGB["C"]) <=
+							 delta_to_sRGB_threshold_C)
+	delta_to_sRGB["H_ok"] = (numpy.abs(delta_to_sRGB["H"]) <=
+							 delta_to_sRGB_threshold_H)
+	delta_to_sRGB["ok"] = (delta_to_sRGB["E_ok"] & delta_to_sRGB["L_ok"] &
+						   delta_to_sRGB["C_ok"] & delta_to_sRGB["H_ok"])
+
+	criteria1 = ((delta_to_sRGB["E"] > delta_to_sRGB_threshold_E) &
+				 ((numpy.abs(delta_to_sRGB["L"]) > delta_to_sRGB_threshold_L) |
+				  (numpy.abs(delta_to_sRGB["C"]) > delta_to_sRGB_threshold_C) |
+				  (numpy.abs(delta_to_sRGB["H"]) > delta_to_sRGB_threshold_H)))
+
+	return sRGBLab, Lab, delta_to_sRGB, criteria1
+
+
+def check_ti3_criteria2_array(Lab, sRGBLab, RGB, sRGB_delta_E_scale_factor=.5,
+							  L_tolerance=0):
+	"""
+	Array version of check_ti3_criteria2 for all pairs of subsequent patches
+	
+	L_tolerance widens the comparison of L for RGB gray patches.
+	
+	Return boolean array of criteria2 (one less than the number of patches).
+	
+	"""
+	delta = colormath.delta_array(Lab[:-1], Lab[1:], 2000)
+	sRGB_delta = colormath.delta_array(sRGBLab[:-1], sRGBLab[1:], 2000)
+
+	criteria2 = delta["E"] < sRGB_delta["E"] * sRGB_delta_E_scale_factor
+
+	# If RGB gray, check if the Y difference makes sense
+	gray = (RGB[:, 0] == RGB[:, 1]) & (RGB[:, 1] == RGB[:, 2])
+	R, L = RGB[:, 0], Lab[:, 0]
+	gray_criteria2 = (((R[1:] > R[:-1]) & (L[1:] <= L[:-1] + L_tolerance)) |
+					  ((R[1:] < R[:-1]) & (L[1:] >= L[:-1] - L_tolerance)))
+	return numpy.where(gray[:-1] & gray[1:], criteria2 & gray_criteria2,
+					   criteria2)
+
+
 def check_ti3_criteria2(prev_Lab, Lab, prev_sRGBLab, sRGBLab,
 						prev_RGB, RGB, sRGB_delta_E_scale_factor=.5):
 	delta = colormath.delta(*prev_Lab + Lab + (2000, ))
@@ -407,23 +514,49 @@ def check_ti3(ti3, print_debuginfo=True):
 	
 	"""
 	if not isinstance(ti3, CGATS.CGATS):
-		ti3 = CGATS.CGATS(ti3)
+		ti3 = CGATS.CGATS(ti3, columnar=CGATS.COLUMNAR_MIN_ROWS)
 	data = ti3.queryv1("DATA")
 	datalen = len(data)
-	black = data.queryi1({"RGB_R": 0, "RGB_G": 0, "RGB_B": 0})
+	black = data.find_device_values((0, 0, 0))
 	if black:
 		black = black["XYZ_X"], black["XYZ_Y"], black["XYZ_Z"]
 	elif print_debuginfo:
 		safe_print("Warning - no black patch found in CGATS")
-	white = data.queryi1({"RGB_R": 100, "RGB_G": 100, "RGB_B": 100})
+	white = data.find_device_values((100, 100, 100))
 	if white:
 		white = white["XYZ_X"], white["XYZ_Y"], white["XYZ_Z"]
 	elif print_debuginfo:
 		safe_print("Warning - no white patch found in CGATS")
 	suspicious = []
-	prev = {}
-	delta = {}
-	for index, item in data.iteritems():
+	if not datalen:
+		return suspicious
+	labels = ("RGB_R", "RGB_G", "RGB_B", "XYZ_X", "XYZ_Y", "XYZ_Z")
+	keys = data.keys()
+	columns = data._get_columns(labels)
+	if columns:
+		values = numpy.column_stack(columns)
+	else:
+		values = numpy.array([[data[key][label] for label in labels]
+							  for key in keys], dtype=numpy.float64)
+	RGB, XYZ = values[:, :3], values[:, 3:]
+	# Find candidates for all patches at once. The thresholds are widened by
+	# 1% so that patches close to them are decided by the scalar functions
+	# below, not by rounding differences of the array functions
+	sRGBLab, Lab, delta_to_sRGB, c1 = check_ti3_criteria1_array(RGB, XYZ,
+																black, white,
+																10 * .99,
+																10 * .99,
+																75 * .99,
+																75 * .99)
+	step = numpy.zeros(datalen, dtype=bool)
+	step[1:] = (numpy.abs(RGB[1:] - RGB[:-1]) > 1.0 / 2.55).any(axis=1)
+	c2 = numpy.zeros(datalen, dtype=bool)
+	c2[1:] = check_ti3_criteria2_array(Lab, sRGBLab, RGB, .5 * 1.01, .01)
+	candidates = numpy.flatnonzero(c1 | ((c1 | step) & c2))
+	# Use the scalar functions for the candidates so the results (and debug
+	# info) are exactly the same as when checking patches one by one
+	for index in candidates.tolist():
+		item = data[keys[index]]
 		(sRGBLab,
 		 Lab,
 		 delta_to_sRGB,
@@ -435,48 +568,48 @@ def check_ti3(ti3, print_debuginfo=True):
 										   item["XYZ_Y"],
 										   item["XYZ_Z"]),
 										  black, white, print_debuginfo=False)
-		if (criteria1 or (prev and (max(prev["item"]["RGB_R"], item["RGB_R"]) -
-									min(prev["item"]["RGB_R"], item["RGB_R"]) >
-									1.0 / 2.55 or
-									max(prev["item"]["RGB_G"], item["RGB_G"]) -
-									min(prev["item"]["RGB_G"], item["RGB_G"]) >
-									1.0 / 2.55 or
-									max(prev["item"]["RGB_B"], item["RGB_B"]) -
-									min(prev["item"]["RGB_B"], item["RGB_B"]) >
-									1.0 / 2.55))):
-			if prev:
-				(delta,
-				 sRGB_delta,
-				 criteria2) = check_ti3_criteria2(prev["Lab"], Lab,
-												  prev["sRGBLab"], sRGBLab,
-												  (prev["item"]["RGB_R"],
-												   prev["item"]["RGB_G"],
-												   prev["item"]["RGB_B"]),
-												  (item["RGB_R"],
-												   item["RGB_G"],
-												   item["RGB_B"]))
-			else:
-				criteria2 = False
-			if criteria1 or criteria2:
-				if print_debuginfo:
-					if criteria2:
-						debuginfo = (("%s  dE to previous XYZ->Lab(D50): "
-									  "%5.3f  dE_OK: %s  L_OK: %s  "
-									  "0.5 dE RGB(sRGB)->Lab(D50) to previous "
-									  "RGB(sRGB)->Lab(D50): %5.3f") % 
-									 (debuginfo, delta["E"], delta["E_ok"],
-									  delta["L_ok"], sRGB_delta["E"]))
-					sample_id = "Patch #%%.0%id" % len(str(datalen))
-					safe_print(sample_id % item.SAMPLE_ID, debuginfo)
-				suspicious.append((prev["item"] if criteria2 else None,
-								   item, delta if criteria2 else None,
-								   sRGB_delta if criteria2 else None,
-								   prev["delta_to_sRGB"] if criteria2 else None,
-								   delta_to_sRGB))
-		prev["item"] = item
-		prev["sRGBLab"] = sRGBLab
-		prev["Lab"] = Lab
-		prev["delta_to_sRGB"] = delta_to_sRGB
+		if index and (criteria1 or step[index]):
+			prev_item = data[keys[index - 1]]
+			(prev_sRGBLab,
+			 prev_Lab,
+			 prev_delta_to_sRGB,
+			 prev_criteria1,
+			 prev_debuginfo) = check_ti3_criteria1((prev_item["RGB_R"],
+													prev_item["RGB_G"],
+													prev_item["RGB_B"]),
+												   (prev_item["XYZ_X"],
+													prev_item["XYZ_Y"],
+													prev_item["XYZ_Z"]),
+												   black, white,
+												   print_debuginfo=False)
+			(delta,
+			 sRGB_delta,
+			 criteria2) = check_ti3_criteria2(prev_Lab, Lab,
+											  prev_sRGBLab, sRGBLab,
+											  (prev_item["RGB_R"],
+											   prev_item["RGB_G"],
+											   prev_item["RGB_B"]),
+											  (item["RGB_R"],
+											   item["RGB_G"],
+											   item["RGB_B"]))
+		else:
+			criteria2 = False
+		if criteria1 or criteria2:
+			if print_debuginfo:
+				if criteria2:
+					debuginfo = (("%s  dE to previous XYZ->Lab(D50): "
+								  "%5.3f  dE_OK: %s  L_OK: %s  "
+								  "0.5 dE RGB(sRGB)->Lab(D50) to previous "
+								  "RGB(sRGB)->Lab(D50): %5.3f") % 
+								 (debuginfo, delta["E"], delta["E_ok"],
+								  delta["L_ok"], sRGB_delta["E"]))
+				sample_id = "Patch #%%.0%id" % len(str(datalen))
+				safe_print(sample_id % item.SAMPLE_ID, debuginfo)
+			suspicious.append((prev_item if criteria2 else None,
+							   item, delta if criteria2 else None,
+							   sRGB_delta if criteria2 else None,
+							   prev_delta_to_sRGB if criteria2 else None,
+							   delta_to_sRGB))
 	return suspicious
 
 
@@ -1240,24 +1373,11 @@ def insert_ti_patches_omitting_RGB_duplicates(cgats1, cgats2_path,
 	cgats2 = CGATS.CGATS(cgats2_path)
 	cgats1_data = cgats1.queryv1("DATA")
 	data = cgats2.queryv1("DATA")
-	data_format = cgats2.queryv1("DATA_FORMAT")
-	# Get only RGB data
-	data.parent.DATA_FORMAT = CGATS.CGATS()
-	data.parent.DATA_FORMAT.key = "DATA_FORMAT"
-	data.parent.DATA_FORMAT.parent = data
-	data.parent.DATA_FORMAT.root = data.root
-	data.parent.DATA_FORMAT.type = "DATA_FORMAT"
-	for i, label in enumerate(("RGB_R", "RGB_G", "RGB_B")):
-		data.parent.DATA_FORMAT[i] = label
-	cgats1_data.parent.DATA_FORMAT = data.parent.DATA_FORMAT
-	rgbdata = str(data)
-	# Restore DATA_FORMAT
-	data.parent.DATA_FORMAT = data_format
 	# Collect all preconditioning point datasets not in data
-	cgats1_data.vmaxlen = data.vmaxlen
 	cgats1_datasets = []
 	for i, dataset in cgats1_data.iteritems():
-		if not str(dataset) in rgbdata:
+		if not data.find_device_values((dataset["RGB_R"], dataset["RGB_G"],
+										dataset["RGB_B"])):
 			# Not a duplicate
 			cgats1_datasets.append(dataset)
 	if cgats1_datasets:
@@ -1450,9 +1570,66 @@ class DummyDialog(object):
 		pass
 
 
+def compile_substitutions(substitutions):
+	"""
+	Combine substitutions into as few compiled patterns as possible
+	
+	substitutions is a dict mapping patterns (strings or compiled) to
+	replacements. Patterns with the same flags are joined into a single
+	alternation. Patterns containing groups or whose replacement is not a
+	plain string (e.g. has backreferences) are kept on their own.
+	
+	Return a list of (compiled pattern, replacement) tuples, where
+	replacement is a string or function suitable for pattern.sub().
+	
+	"""
+	compiled = []
+	combined = {}
+	for search, sub in substitutions.iteritems():
+		if isinstance(search, basestring):
+			pattern, flags = search, 0
+		else:
+			pattern, flags = search.pattern, search.flags
+		regex = re.compile(pattern, flags)
+		if (regex.groups or regex.flags != flags or
+			not isinstance(sub, basestring) or "\\" in sub):
+			compiled.append((regex, sub))
+		else:
+			combined.setdefault(flags, []).append((pattern, sub))
+	for flags, items in combined.iteritems():
+		if len(items) == 1:
+			compiled.append((re.compile(items[0][0], flags), items[0][1]))
+			continue
+		subs = [sub for pattern, sub in items]
+		regex = re.compile("|".join("(%s)" % pattern for pattern, sub in items),
+						   flags)
+		compiled.append((regex, lambda match, subs=subs:
+								subs[match.lastindex - 1]))
+	return compiled
+
+
+def compile_triggers(triggers):
+	"""
+	Compile triggers (substrings) into one pattern to search lowercase text
+	
+	Return None if there are no triggers.
+	
+	"""
+	if triggers:
+		return re.compile("|".join(re.escape(trigger.lower())
+								   for trigger in triggers))
+
+
 class FilteredStream():
 	
-	""" Wrap a stream and filter all lines written to it. """
+	"""
+	Wrap a stream and filter all lines written to it.
+	
+	discard, prestrip, substitutions and triggers are compiled when first
+	writing to the stream, and again after assigning a new value to them.
+	Call invalidate() after changing substitutions or triggers in-place.
+	
+	"""
 	
 	# Discard the whole line if it is empty after replacing patterns
 	discard = ""
@@ -1500,9 +1677,19 @@ class FilteredStream():
 		if prestrip is not None:
 			self.prestrip = prestrip
 		self._buffer = ""
+		self._filters = None
 	
 	def __getattr__(self, name):
 		return getattr(self.stream, name)
+
+	def __setattr__(self, name, value):
+		self.__dict__[name] = value
+		if name in ("discard", "prestrip", "substitutions", "triggers"):
+			self.__dict__["_filters"] = None
+
+	def invalidate(self):
+		""" Recompile the filters on the next write """
+		self._filters = None
 	
 	def write(self, data):
 		""" Write data to stream, stripping all unwanted output.
@@ -1512,7 +1699,8 @@ class FilteredStream():
 		"""
 		if not data:
 			return
-		if self.prestrip and (re.search(self.prestrip, data) or self._buffer):
+		discard, prestrip, substitutions, triggers = self._compile_filters()
+		if prestrip and (prestrip.search(data) or self._buffer):
 			if not data.endswith(self.linesep_in):
 				# Buffer all data until we see a line ending
 				self._buffer += data
@@ -1521,27 +1709,90 @@ class FilteredStream():
 				# Assemble the full line from the buffer
 				data = self._buffer + data
 				self._buffer = ""
-			data = re.sub(self.prestrip, "", data)
+			data = prestrip.sub("", data)
 		lines = []
 		for line in data.split(self.linesep_in):
-			if line and not re.sub(self.discard, "", line):
+			if line and discard and not discard.sub("", line):
 				line = ""
-			write = True
-			for trigger in self.triggers:
-				if trigger.lower() in line.lower():
-					write = False
-					break
-			if write:
-				if self.data_encoding and not isinstance(line, unicode):
-					line = line.decode(self.data_encoding, self.errors)
-				for search, sub in self.substitutions.iteritems():
-					line = re.sub(search, sub, line)
-				if self.file_encoding:
-					line = line.encode(self.file_encoding, self.errors)
-				lines.append(line)
+			if triggers and triggers.search(line.lower()):
+				continue
+			if self.data_encoding and not isinstance(line, unicode):
+				line = line.decode(self.data_encoding, self.errors)
+			for search, sub in substitutions:
+				line = search.sub(sub, line)
+			if self.file_encoding:
+				line = line.encode(self.file_encoding, self.errors)
+			lines.append(line)
 		if lines:
 			self.stream.write(self.linesep_out.join(lines))
 
+	def _compile_filters(self):
+		""" Return compiled discard, prestrip, substitutions and triggers """
+		if not self._filters:
+			self._filters = (self.discard and re.compile(self.discard) or None,
+							 self.prestrip and re.compile(self.prestrip) or None,
+							 compile_substitutions(self.substitutions),
+							 compile_triggers(self.triggers))
+		return self._filters
+
+
+# Scanner for instrument and measurement information in Argyll tool output.
+# Instrument, serial and "current" are matched by lookahead so they can't
+# hide following matches in the same line.
+OUTPUT_SCANNER = re.compile(r"(?:Instrument Type|Product Name|Model|"
+							r"Identificaton):(?=\s+(?P<instrument>[^\r\n]+))|"
+							r"Serial Number:(?=\s+(?P<serial>[^\r\n]+))|"
+							r"(?P<current>[/\\])(?= current)|"
+							r"patch (?P<patch>\d+) of (?P<patches>\d+)?|"
+							r"Number of patches = (?P<numpatches>\d+)|"
+							r"(?P<start>press 1|space when done)|"
+							r"(?P<removed>the instrument can be removed from "
+							r"the screen)", re.I)
+
+# Pattern generator RGB values (case-sensitive unlike OUTPUT_SCANNER)
+CURRENT_RGB_SCANNER = re.compile(r"Current RGB(?:\s+\d+){3}"
+								 r"((?:\s+\d+(?:\.\d+)){3})")
+
+
+def scan_output(txt):
+	"""
+	Scan Argyll tool output for instrument and measurement information
+	
+	Return a dict with the first match of each of the following keys (if
+	any):
+	instrument, serial - Instrument name and serial number
+	rgb - String of current (pattern generator) RGB values
+	progress - Tuple of current patch number (0 if unknown) and patch count
+	start - True if this is the start of a measurement sequence
+	patch_sequence - True if the first patch of a sequence is measured
+	update - True if a patch or reading was updated
+	removed - True if the instrument can be removed from the screen
+	
+	"""
+	found = {}
+	rgb = CURRENT_RGB_SCANNER.search(txt)
+	if rgb:
+		found["rgb"] = rgb.group(1)
+	for match in OUTPUT_SCANNER.finditer(txt):
+		group = match.lastgroup
+		if group in ("instrument", "serial"):
+			found.setdefault(group, match.group(group))
+		elif group in ("patch", "patches"):
+			patch = match.group("patch")
+			if patch == "1":
+				found["start"] = found["patch_sequence"] = True
+			found["update"] = True
+			if match.group("patches") and not "progress" in found:
+				found["progress"] = (int(patch), int(match.group("patches")))
+		elif group == "numpatches":
+			if not "progress" in found:
+				found["progress"] = (0, int(match.group(group)))
+		else:
+			found[group] = True
+			if group != "start":
+				found["update"] = True
+	return found
+
 
 class Producer(object):
 
@@ -2304,11 +2555,6 @@ class Worker(WorkerBase):
 												   triggers=[])), self.recent,
 									self.lastmsg])
 				if hdr_chroma_compression:
-					xf = Xicclu(hdr_target_profile, "r", direction="f", pcs="x",
-								worker=self)
-					xb = MP_Xicclu(hdr_target_profile, "r", direction="if", pcs="x",
-								   use_cam_clipping=True, worker=self,
-								   logfile=logfiles)
 					if content_rgb_space:
 						content_rgb_space = colormath.get_rgb_space(content_rgb_space)
 						for i, color in enumerate(("white", "red", "green",
@@ -2322,28 +2568,52 @@ class Worker(WorkerBase):
 								self.log(lang.getstr("3dlut.content.colorspace") + 
 										 " " + lang.getstr(color) + " " +
 										 coord + " %6.4f" % v)
-				else:
-					xf=None
-					xb=None
 				if smpte2084:
 					hdr_format = "PQ"
 				elif hlg:
 					hdr_format = "HLG"
 				cat = profile1.guess_cat() or "Bradford"
 				self.log("Using chromatic adaptation transform matrix:", cat)
-				profile = ICCP.create_synthetic_hdr_clut_profile(hdr_format,
-					rgb_space, desc,
-					black_cdm2, white_cdm2,
-					minmll,  # Not used for HLG
-					maxmll,  # Not used for HLG
-					use_alternate_master_white_clip,  # Not used for HLG
-					system_gamma=1.2,  # Not used for PQ
-					ambient_cdm2=ambient_cdm2,  # Not used for PQ
-					maxsignal=1.0,  # Not used for PQ
-					content_rgb_space=content_rgb_space, sat=hdr_sat,
-					hue=hdr_hue,
-					forward_xicclu=xf, backward_xicclu=xb,
-					worker=self, logfile=logfiles, cat=cat)
+				args = (hdr_format, rgb_space, desc, black_cdm2, white_cdm2,
+						minmll,  # Not used for HLG
+						maxmll,  # Not used for HLG
+						use_alternate_master_white_clip)  # Not used for HLG
+				kwargs = dict(system_gamma=1.2,  # Not used for PQ
+							  ambient_cdm2=ambient_cdm2,  # Not used for PQ
+							  maxsignal=1.0,  # Not used for PQ
+							  content_rgb_space=content_rgb_space,
+							  sat=hdr_sat, hue=hdr_hue, cat=cat)
+				if hdr_chroma_compression:
+					# The lookups are represented by their profile in the
+					# cache key
+					lookups = dict(forward_xicclu=hdr_target_profile,
+								   backward_xicclu=hdr_target_profile)
+				else:
+					lookups = dict(forward_xicclu=None, backward_xicclu=None)
+				profile = None
+				profile_cache = self.get_profile_cache()
+				if profile_cache:
+					lookups.update(kwargs)
+					cachekey = ICCP.create_synthetic_hdr_clut_profile.cachekey(
+						profile_cache, *args, **lookups)
+					profile = profile_cache.get(cachekey)
+				if not profile:
+					# Only start the lookup processes if the profile actually
+					# needs to be created
+					if hdr_chroma_compression:
+						xf = Xicclu(hdr_target_profile, "r", direction="f",
+									pcs="x", worker=self)
+						xb = MP_Xicclu(hdr_target_profile, "r", direction="if",
+									   pcs="x", use_cam_clipping=True,
+									   worker=self, logfile=logfiles)
+					else:
+						xf = None
+						xb = None
+					profile = ICCP.create_synthetic_hdr_clut_profile(*args,
+						forward_xicclu=xf, backward_xicclu=xb,
+						worker=self, logfile=logfiles, **kwargs)
+					if profile_cache:
+						profile_cache.set(cachekey, profile)
 				profile1.tags.A2B0 = profile.tags.A2B0
 				profile1.tags.DBG0 = profile.tags.DBG0
 				profile1.tags.DBG1 = profile.tags.DBG1
@@ -4323,10 +4593,6 @@ END_DATA
 		logfiles.write("Generating %s 3D LUT...\n" % format)
 
 		# Create input RGB values
-		RGB_oin = []
-		RGB_in = []
-		RGB_indexes = []
-		seen = {}
 		if format == "eeColor":
 			# Fixed size
 			size = 65
@@ -4341,14 +4607,10 @@ END_DATA
 				input_bits = output_bits
 			# Note: We only round up for the input values, output values
 			# are rounded to nearest integer
-			quantizer = lambda v: int(math.ceil(v * (2 ** input_bits - 1)))
-			scale = quantizer(1.0)
+			scale = int(math.ceil(1.0 * (2 ** input_bits - 1)))
 		else:
-			quantizer = lambda v: v
 			scale = 1.0
 		step = 1.0 / (size - 1)
-		RGB_triplet = [0.0, 0.0, 0.0]
-		RGB_index = [0, 0, 0]
 		# Set the fastest and slowest changing columns, from right to left
 		if (format in ("3dl", "mga", "spi3d") or
 			(format == "png" and getcfg("3dlut.image.order") == "bgr")):
@@ -4357,44 +4619,28 @@ END_DATA
 			columns = (2, 0, 1)
 		else:
 			columns = (2, 1, 0)
-		for i in xrange(0, size):
-			# Red
-			if format == "eeColor" and not eecolor65 and i == size - 1:
-				# Last cLUT entry is fixed to 1.0 for eeColor and unchangeable
-				continue
-			RGB_triplet[columns[0]] = quantizer(step * i)
-			RGB_index[columns[0]] = i
-			for j in xrange(0, size):
-				# Green
-				if format == "eeColor" and not eecolor65 and j == size - 1:
-					# Last cLUT entry is fixed to 1.0 for eeColor and unchangeable
-					continue
-				RGB_triplet[columns[1]] = quantizer(step * j)
-				RGB_index[columns[1]] = j
-				for k in xrange(0, size):
-					# Blue
-					if self.thread_abort:
-						raise Info(lang.getstr("aborted"))
-					if format == "eeColor" and not eecolor65 and k == size - 1:
-						# Last cLUT entry is fixed to 1.0 for eeColor and unchangeable
-						continue
-					RGB_triplet[columns[2]] = quantizer(step * k)
-					RGB_oin.append(list(RGB_triplet))
-					RGB_copy = list(RGB_triplet)
-					if format == "eeColor":
-						for l in xrange(3):
-							RGB_copy[l] = eeColor_to_VidRGB(RGB_copy[l])
-							if input_encoding in ("t", "T"):
-								RGB_copy[l] = VidRGB_to_cLUT65(RGB_copy[l])
-					RGB_index[columns[2]] = k
-					RGB_in.append(RGB_copy)
-					RGB_indexes.append(list(RGB_index))
+		# Last cLUT entry is fixed to 1.0 for eeColor and unchangeable
+		RGB_indexes = lut3d.grid_indexes(size, columns,
+										 format == "eeColor" and
+										 not eecolor65)
+		RGB_oin = RGB_indexes * step
+		if format == "3dl":
+			RGB_oin = numpy.ceil(RGB_oin * (2 ** input_bits - 1))
+		RGB_in = RGB_oin
+		if format == "eeColor":
+			RGB_in = eeColor_to_VidRGB(RGB_in)
+			if input_encoding in ("t", "T"):
+				RGB_in = lut3d.VidRGB_to_cLUT65(RGB_in)
+
+		if self.thread_abort:
+			raise Info(lang.getstr("aborted"))
 
 		# Lookup RGB -> RGB values through devicelink profile using icclu
 		# (Using icclu instead of xicclu because xicclu in versions
 		# prior to Argyll CMS 1.6.0 could not deal with devicelink profiles)
-		RGB_out = self.xicclu(link_filename, RGB_in, scale=scale, use_icclu=True,
-							  logfile=logfiles)
+		RGB_out = numpy.asarray(self.xicclu(link_filename, RGB_in, scale=scale,
+											use_icclu=True, logfile=logfiles),
+								dtype=numpy.float64)
 		
 		if format == "eeColor" and output_encoding == "n":
 			RGBw = self.xicclu(link_filename, [[1, 1, 1]], use_icclu=True)[0]
@@ -4405,125 +4651,33 @@ END_DATA
 		if isinstance(result, Exception):
 			raise result
 
-		valsep = " "
-		if format not in ("dcl", "png"):
-			lut = [["# Created with %s %s" % (appname, version)]]
-			linesep = "\n"
-		if format in ("3dl", "dcl"):
-			maxval = math.pow(2, output_bits) - 1
-			if format == "3dl":
-				lut.append(["# INPUT RANGE: %i" % input_bits])
-				lut.append(["# OUTPUT RANGE: %i" % output_bits])
-				lut.append([])
-				for i in xrange(0, size):
-					lut[-1].append("%i" % quantizer(i * step))
-			else:
-				# dcl
-				lut = [["# DeviceControl-LG 3D"]]
-				linesep = "\r\n"
-			for RGB_triplet in RGB_out:
-				lut.append([])
-				for component in (0, 1, 2):
-					lut[-1].append("%i" % int(round(RGB_triplet[component] / scale * maxval)))
+		# Write 3DLUT
+		lut_file = open(path, "wb")
+		if format == "3dl":
+			lut3d.write_3dl(lut_file, RGB_out, size, input_bits, output_bits,
+							scale)
+		elif format == "dcl":
+			lut3d.write_dcl(lut_file, RGB_out, output_bits, scale)
 		elif format == "cube":
 			if maxval is None:
 				maxval = 1.0
-			lut.append(["LUT_3D_SIZE %i" % size])
-			lut.append(["DOMAIN_MIN 0.0 0.0 0.0"])
-			fp_offset = str(maxval).find(".")
-			domain_max = "DOMAIN_MAX %s %s %s" % (("%%.%if" % len(str(maxval)[fp_offset + 1:]), ) * 3)
-			lut.append([domain_max % ((maxval ,) * 3)])
-			lut.append([])
-			for RGB_triplet in RGB_out:
-				lut.append([])
-				for component in (0, 1, 2):
-					lut[-1].append("%.6f" % (RGB_triplet[component] * maxval))
+			lut3d.write_cube(lut_file, RGB_out, size, maxval)
 		elif format == "spi3d":
 			if maxval is None:
 				maxval = 1.0
-			lut = [["SPILUT 1.0"]]
-			lut.append(["3 3"])
-			lut.append(["%i %i %i" % ((size, ) * 3)])
-			for i, RGB_triplet in enumerate(RGB_out):
-				lut.append([str(index) for index in RGB_indexes[i]])
-				for component in (0, 1, 2):
-					lut[-1].append("%.6f" % (RGB_triplet[component] * maxval))
+			lut3d.write_spi3d(lut_file, RGB_out, size, RGB_indexes, maxval)
 		elif format == "eeColor":
 			if maxval is None:
 				maxval = 1.0
-			lut = []
-			for i, RGB_triplet in enumerate(RGB_out):
-				lut.append(["%.6f" % (component * maxval) for component in RGB_oin[i]])
-				for component in (0, 1, 2):
-					v = RGB_triplet[component] * maxval
-					if output_encoding == "n":
-						# For eeColor and full range RGB, make sure that the cLUT
-						# output maps to 1.0
-						# The output curve will correct this
-						v /= RGBw[component]
-						v = min(v, 1)
-					v = VidRGB_to_eeColor(v)
-					lut[-1].append("%.6f" % v)
-			linesep = "\r\n"
+			# For eeColor and full range RGB, make sure that the cLUT
+			# output maps to 1.0. The output curve will correct this
+			lut3d.write_eecolor(lut_file, RGB_out, RGB_oin, maxval,
+								RGBw if output_encoding == "n" else None)
 		elif format == "mga":
-			lut = [["#HEADER"],
-				   ["#filename: %s" % os.path.basename(path)],
-				   ["#type: 3D cube file"],
-				   ["#format: 1.00"],
-				   ["#created: %s" % strftime("%d %B %Y")],
-				   ["#owner: %s" % getpass.getuser()],
-				   ["#title: %s" % os.path.splitext(os.path.basename(path))[0]],
-				   ["#END"]]
-			lut.append([])
-			lut.append(["channel 3d"])
-			lut.append(["in %i" % (size ** 3)])
-			maxval = 2 ** output_bits - 1
-			lut.append(["out %i" % (maxval + 1)])
-			lut.append([""])
-			lut.append(["format lut"])
-			lut.append([""])
-			lut.append(["values\tred\tgreen\tblue"])
-			for i, RGB_triplet in enumerate(RGB_out):
-				lut.append(["%i" % i])
-				for component in (0, 1, 2):
-					lut[-1].append(("%i" % int(round(RGB_triplet[component] * maxval))))
-			valsep = "\t"
+			lut3d.write_mga(lut_file, RGB_out, size, output_bits, path)
 		elif format == "png":
-			lut = [[]]
-			if output_bits > 8:
-				# PNG only supports 8 and 16 bit
-				output_bits = 16
-			maxval = 2 ** output_bits - 1
-			for RGB_triplet in RGB_out:
-				if len(lut[-1]) == size:
-					# Append new scanline
-					lut.append([])
-				lut[-1].append([int(round(v * maxval)) for v in RGB_triplet])
-			# Current layout is vertical
-			if getcfg("3dlut.image.layout") == "h":
-				# Change layout to horizontal
-				lutv = lut
-				lut = [[]]
-				for i in xrange(size):
-					if len(lut[-1]) == size ** 2:
-						# Append new scanline
-						lut.append([])
-					for j in xrange(size):
-						lut[-1].extend(lutv[i + size * j])
-
-		if format != "png":
-			lut.append([])
-			for i, line in enumerate(lut):
-				lut[i] = valsep.join(line)
-			result = linesep.join(lut)
-
-		# Write 3DLUT
-		lut_file = open(path, "wb")
-		if format != "png":
-			lut_file.write(result)
-		else:
-			im = imfile.Image(lut, output_bits)
-			im.write(lut_file)
+			lut3d.write_png(lut_file, RGB_out, size, output_bits,
+							getcfg("3dlut.image.layout"))
 		lut_file.close()
 
 		if format == "eeColor":
@@ -9000,7 +9154,13 @@ usage: spotread [-options] [logfile]
 			sleep(.75)  # Allow time for progress window to update
 			return self.calculate_gamut(profile_path)
 		else:
-			return None, None
+			# Gamut volume and coverage are cheap to calculate in-process
+			try:
+				return self.calculate_gamut_native([profile_path])
+			except Exception, exception:
+				if not isinstance(exception, NotImplementedError):
+					self.log(exception)
+				return None, None
 
 	def create_profile(self, dst_path=None, 
 				skip_scripts=False, display_name=None, 
@@ -9656,20 +9816,20 @@ usage: spotread [-options] [logfile]
 							for i in xrange(3):
 								interp.append(colormath.Interp(orange, table.output[i]))
 								rinterp.append(colormath.Interp(table.output[i], orange))
-							if len(table.clut[0]) < 33:
+							if table.clut_grid_steps < 33:
 								num_workers = 1
 							else:
 								num_workers = None
-							table.clut = sum(pool_slice(ICCP._mp_apply,
-														table.clut,
-														(profile.connectionColorSpace,
-														 colormath.matmul,
-														 (m4, m2), D50, interp,
-														rinterp,
-														lang.getstr("aborted")),
-														{},
-														num_workers,
-														self.thread_abort), [])
+							table.clut_array = numpy.concatenate(pool_slice(ICCP._mp_apply,
+																			table.clut_array,
+																			(profile.connectionColorSpace,
+																			 colormath.matmul,
+																			 (m4, m2), D50, interp,
+																			 rinterp,
+																			 lang.getstr("aborted")),
+																			{},
+																			num_workers,
+																			self.thread_abort))
 
 				# A2B processing
 				process_A2B = ("A2B0" in profile.tags and
@@ -10516,6 +10676,13 @@ usage: spotread [-options] [logfile]
 		if include_progress_buffers:
 			logfiles = Files([logfiles, self.recent, self.lastmsg])
 		return logfiles
+
+	def get_profile_cache(self):
+		""" Return the on-disk profile cache, or None if it is disabled """
+		if getcfg("profile.cache"):
+			return ProfileCache(maxsize=getcfg("profile.cache.maxsize") *
+										1024 * 1024,
+								logfn=self.log)
 	
 	def update_profile_B2A(self, profile, generate_perceptual_table=True,
 						   clutres=None, smooth=None, rgb_space=None):
@@ -10604,6 +10771,17 @@ usage: spotread [-options] [logfile]
 					# BPC not needed, copy existing B2A
 					profile.tags["B2A%i" % tableno] = rtables[0]
 					return rtables
+				profile_cache = self.get_profile_cache()
+				if profile_cache:
+					cachekey = profile_cache.key("B2A_from_inverse_table",
+						profile, clutres, tableno, bpc, smooth, rgb_space,
+						self.argyll_version)
+					cached = profile_cache.get(cachekey)
+					if cached and "B2A%i" % tableno in cached.tags:
+						profile.tags["B2A%i" % tableno] = cached.tags["B2A%i" %
+																	  tableno]
+						rtables.append(profile.tags["B2A%i" % tableno])
+						continue
 				if not filename or not os.path.isfile(filename) or bpc:
 					# Write profile to temp dir
 					tempdir = self.create_tempdir()
@@ -10637,6 +10815,12 @@ usage: spotread [-options] [logfile]
 				else:
 					if result:
 						rtables.append(profile.tags["B2A%i" % tableno])
+						if profile_cache:
+							# Only the table is needed
+							cached = ICCP.ICCProfile()
+							cached.tags["B2A%i" % tableno] = profile.tags["B2A%i" %
+																		  tableno]
+							profile_cache.set(cachekey, cached)
 					else:
 						return False
 				finally:
@@ -12756,8 +12940,20 @@ usage: spotread [-options] [logfile]
 		if mods:
 			outname += " " + "".join(["[%s]" % mod.upper()
 									  for mod in mods])
+		native = False
 		gamut_volume = None
 		gamut_coverage = {}
+		if compare_standard_gamuts:
+			# Without standard gamut comparison, callers only use the
+			# gamut views
+			try:
+				gamut_volume, gamut_coverage = self.calculate_gamut_native(
+					profile_paths, intent, direction, order)
+			except Exception, exception:
+				if not isinstance(exception, NotImplementedError):
+					self.log(exception)
+			else:
+				native = True
 		# Create profile gamut and vrml
 		det = getcfg("iccgamut.surface_detail")
 		for i, profile_path in enumerate(profile_paths):
@@ -12769,7 +12965,9 @@ usage: spotread [-options] [logfile]
 									"-o" + order, "-d%.2f" % det, profile_path],
 								   capture_output=True,
 								   skip_scripts=True)
-			if not isinstance(result, Exception) and result:
+			if isinstance(result, Exception) or not result:
+				break
+			elif not native:
 				# iccgamut output looks like this:
 				# Header:
 				#  <...>
@@ -12781,8 +12979,6 @@ usage: spotread [-options] [logfile]
 					if match:
 						gamut_volume = float(match.groups()[0]) / ICCP.GAMUT_VOLUME_SRGB
 						break
-			else:
-				break
 		name = os.path.splitext(profile_paths[0])[0]
 		gamfilename = name + ".gam"
 		wrlfilename = name + ".wrl"
@@ -12822,10 +13018,15 @@ usage: spotread [-options] [logfile]
 				worker = Worker()
 				args = ["-cw", "-t0", "-w", src_path, "-cn",
 						"-t.3", "-s", gamfilename, "-i", outfilename]
+				if native:
+					# Coverage has already been calculated
+					coverage = {}
+				else:
+					coverage = gamut_coverage
 				thread = threading.Thread(target=self.create_gamut_view_worker,
 										  name="CreateGamutViewWorker",
 										  args=(worker, viewgam, args, key,
-												src, gamut_coverage))
+												src, coverage))
 				threads.append((thread, worker, args))
 				thread.start()
 		# Wait for threads to finish
@@ -12906,6 +13107,60 @@ usage: spotread [-options] [logfile]
 			self.log(result)
 		return gamut_volume, gamut_coverage
 
+	def calculate_gamut_native(self, profile_paths, intent="r", direction="f",
+							   order="n", compare_standard_gamuts=True):
+		"""
+		Calculate gamut volume and coverage without iccgamut/viewgam.
+		
+		The profile gamut surface is looked up from the surface of the device
+		RGB cube and compared against the reference gamut surfaces. Surfaces
+		and coverage are cached by profile ID and surface detail.
+		
+		Return gamut volume (scaled to sRGB = 1.0) and coverage (dict) as
+		tuple like calculate_gamut. Raise NotImplementedError for non-RGB
+		profiles and other than forward lookups.
+		
+		"""
+		if direction != "f":
+			raise NotImplementedError("Unsupported direction %r" % direction)
+		det = getcfg("iccgamut.surface_detail")
+		steps = max(int(math.ceil(200.0 / det)), 4) + 1
+		surfaces = []
+		for i, profile_path in enumerate(profile_paths):
+			if not profile_path:
+				raise ValueError("calculate_gamut_native(): No profile path "
+								 "%i" % i)
+			profile = ICCP.ICCProfile(profile_path)
+			if profile.colorSpace != "RGB":
+				raise NotImplementedError("Unsupported color space %r" %
+										  profile.colorSpace)
+			lookup = lambda RGB: numpy.asarray(self.xicclu(profile, RGB,
+														   intent, direction,
+														   order, pcs="l"))
+			key = (profile.calculateID(False), intent, direction, order)
+			surfaces.append(GamutSurface.from_device_lookup(lookup, steps,
+															key))
+		surface = surfaces[0]
+		gamut_volume = surface.volume / ICCP.GAMUT_VOLUME_SRGB
+		comparisons = []
+		if compare_standard_gamuts and intent == "r" and order == "n":
+			# Reference gamuts are only available for relative colorimetric
+			for cmpkey, src in (("srgb", "sRGB"),
+								("adobe-rgb", "ClayRGB1998"),
+								("dci-p3", "SMPTE431_P3")):
+				src_path = get_data_path("ref/%s.gam" % src)
+				if src_path:
+					comparisons.append((cmpkey,
+										GamutSurface.from_gam(src_path)))
+		for profile_path, cmpsurface in zip(profile_paths[1:], surfaces[1:]):
+			filename, ext = os.path.splitext(profile_path)
+			comparisons.append((filename.lower().replace(" ", "-"),
+								cmpsurface))
+		gamut_coverage = {}
+		for cmpkey, src_surface in comparisons:
+			gamut_coverage[cmpkey] = surface.coverage(src_surface)
+		return gamut_volume, gamut_coverage
+
 	@staticmethod
 	def create_gamut_view_worker(worker, viewgam, args, key, src,
 								 gamut_coverage):
@@ -14587,38 +14842,32 @@ BEGIN_DATA
 
 	def _write(self, txt):
 		wx.CallAfter(self.audio_visual_feedback, txt)
+		found = scan_output(txt)
 		if getattr(self, "measure_cmd", None):
 			# i1 Pro, Spyders: Instrument Type
 			# i1D3: Product Name
 			# K10: Model
 			# specbos: Identification
-			instrument = re.search(r"(?:Instrument Type|Product Name|Model|"
-								   r"Identificaton):\s+([^\r\n]+)",
-								   txt, re.I)
-			if instrument:
-				self._detected_instrument = instrument.group(1)
-			serial = re.search(r"(?:Serial Number):\s+([^\r\n]+)",
-								   txt, re.I)
-			if serial:
-				self._detected_instrument_serial = serial.group(1)
-		if re.search("press 1|space when done|patch 1 of ", txt, re.I):
+			if "instrument" in found:
+				self._detected_instrument = found["instrument"]
+			if "serial" in found:
+				self._detected_instrument_serial = found["serial"]
+		if found.get("start"):
 			# There are some intial measurements which we can't check for
 			# unless -D (debug) is used for Argyll tools
-			if not "patch 1 of " in txt.lower() or not self.patch_sequence:
-				if "patch 1 of " in txt.lower():
+			if not found.get("patch_sequence") or not self.patch_sequence:
+				if found.get("patch_sequence"):
 					self.patch_sequence = True
 				self.patch_count = 0
 				self.patterngenerator_sent_count = 0
-		update = re.search(r"[/\\] current|patch \d+ of |the instrument "
-						   "can be removed from the screen", txt, re.I)
+		update = found.get("update")
 		# Send colors to pattern generator
 		use_patterngenerator = (self.use_patterngenerator and
 								self.patterngenerator and
 								hasattr(self.patterngenerator, "conn"))
 		if (use_patterngenerator or self.use_madnet_tpg or
 			self._use_patternwindow):
-			rgb = re.search(r"Current RGB(?:\s+\d+){3}((?:\s+\d+(?:\.\d+)){3})",
-							txt)
+			rgb = found.get("rgb")
 			if rgb:
 				update_ffp_insertion_ts = False
 				if getcfg("patterngenerator.ffp_insertion") and self.patterngenerator_sent_count > 1:
@@ -14648,7 +14897,7 @@ BEGIN_DATA
 					if (not hasattr(self, "_ffp_insertion_ts") or
 						update_ffp_insertion_ts):
 						self._ffp_insertion_ts = time()
-				rgb = [float(v) for v in rgb.groups()[0].strip().split()]
+				rgb = [float(v) for v in rgb.strip().split()]
 				if self.use_madnet_tpg:
 					if self.madtpg.show_rgb(*rgb):
 						self.patterngenerator_sent_count += 1
@@ -14685,24 +14934,16 @@ BEGIN_DATA
 					##self.exec_cmd_returnvalue = Error(lang.getstr("patterngenerator.sync_lost"))
 					##self.abort_subprocess()
 		if update and not (self.subprocess_abort or self.thread_abort or
-						   "the instrument can be removed from the screen"
-						   in txt.lower()):
+						   found.get("removed")):
 			self.patch_count += 1
 			if use_patterngenerator or self.use_madnet_tpg:
 				self.log("%s: Patch update count: %i" %
 						 (appname, self.patch_count))
 		if self.use_madnet_tpg:
-			progress = re.search("(?:Patch (\\d+) of|Number of patches =) (\\d+)",
-								 txt, re.I)
+			progress = found.get("progress")
 			if progress:
 				# Set madTPG progress bar
-				try:
-					start = int(progress.group(1) or 0)
-					end = int(progress.group(2))
-				except ValueError:
-					pass
-				else:
-					self.madtpg.set_progress_bar_pos(start, end)
+				self.madtpg.set_progress_bar_pos(*progress)
 		# Parse
 		wx.CallAfter(self.parse, txt)
 
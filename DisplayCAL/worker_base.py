@@ -2,6 +2,8 @@
 
 from __future__ import with_statement
 from binascii import hexlify
+from Queue import Empty, Queue
+from time import time
 import atexit
 import math
 import os
@@ -13,8 +15,11 @@ import subprocess as sp
 import sys
 import tempfile
 import textwrap
+import threading
 import traceback
 
+import numpy
+
 if sys.platform == "win32":
 	import win32api
 
@@ -25,10 +30,12 @@ from colormath import (VidRGB_to_eeColor, VidRGB_to_cLUT65, cLUT65_to_VidRGB,
 from config import exe_ext, fs_enc, get_data_path, getcfg, profile_ext
 from debughelpers import (Error, Info, UnloggedError, UnloggedInfo,
 						  UnloggedWarning, Warn)
+from icctransform import BLOCKSIZE, Transform
 from log import LogFile, safe_print
 from meta import name as appname
 from multiprocess import mp, pool_slice
 from options import debug, verbose
+from ordereddict import OrderedDict
 from util_os import getenvu, quote_args, which
 from util_str import make_filename_safe, safe_basestring, safe_str, safe_unicode
 import CGATS
@@ -52,10 +59,10 @@ def _mp_xicclu(chunk, thread_abort_event, progress_queue, profile_filename,
 	if not config.cfg.items(config.ConfigParser.DEFAULTSECT):
 		config.initcfg()
 	profile = ICCP.ICCProfile(profile_filename)
-	xicclu = Xicclu(profile, intent, direction, order, pcs, scale, cwd,
-					startupinfo, use_icclu, use_cam_clipping, logfile,
-					None, show_actual_if_clipped, input_encoding,
-					output_encoding, convert_video_rgb_to_clut65, verbose)
+	xicclu = get_xicclu(profile, intent, direction, order, pcs, scale, cwd,
+						startupinfo, use_icclu, use_cam_clipping, logfile,
+						None, show_actual_if_clipped, input_encoding,
+						output_encoding, convert_video_rgb_to_clut65, verbose)
 	prevperc = 0
 	start = 0
 	num_subchunks = 50
@@ -100,12 +107,12 @@ def _mp_generate_B2A_clut(chunk, thread_abort_event, progress_queue,
 	idata = []
 	abmaxval = 255 + (255 / 256.0)
 	profile = ICCP.ICCProfile(profile_filename)
-	xicclu1 = Xicclu(profile, intent, direction, "n", pcs, 100)
+	xicclu1 = get_xicclu(profile, intent, direction, "n", pcs, 100)
 	if use_cam_clipping:
 		# Use CAM Jab for clipping for cLUT grid points after a given
 		# threshold
-		xicclu2 = Xicclu(profile, intent, direction, "n", pcs, 100,
-						 use_cam_clipping=True)
+		xicclu2 = get_xicclu(profile, intent, direction, "n", pcs, 100,
+							 use_cam_clipping=True)
 	prevperc = 0
 	count = 0
 	chunksize = len(chunk)
@@ -306,6 +313,30 @@ def get_argyll_version_string(name, paths=None):
 	return argyll_version_string
 
 
+def get_xicclu(profile, intent="r", direction="f", order="n", pcs=None,
+			   scale=1, cwd=None, startupinfo=None, use_icclu=False,
+			   use_cam_clipping=False, logfile=None, worker=None,
+			   show_actual_if_clipped=False, input_encoding=None,
+			   output_encoding=None, convert_video_rgb_to_clut65=False,
+			   verbose=1):
+	"""
+	Return a Xicclu instance for the given lookup parameters.
+	
+	If possible, the lookup is done through a resident xicclu process from
+	the pool (see XiccluPool), otherwise a new xicclu process is spawned.
+	
+	"""
+	args = (profile, intent, direction, order, pcs, scale, cwd, startupinfo,
+			use_icclu, use_cam_clipping, logfile, worker,
+			show_actual_if_clipped, input_encoding, output_encoding,
+			convert_video_rgb_to_clut65, verbose)
+	if getcfg("xicclu.pool") and not (use_icclu or debug) and verbose == 1:
+		child = xicclu_pool.acquire(*args)
+		if child:
+			return PooledXicclu(child, logfile, worker)
+	return Xicclu(*args)
+
+
 def parse_argyll_version_string(argyll_version_string):
 	argyll_version = re.findall("(\d+|[^.\d]+)", argyll_version_string)
 	for i, v in enumerate(argyll_version):
@@ -438,15 +469,67 @@ class WorkerBase(object):
 		output data will be returned in same format, or as list of strings
 		if 'raw' is true.
 		
+		If the lookup can be done in-process (see icctransform), xicclu is
+		not invoked. In that case, input data can also be a NumPy array of
+		shape (N, channels), and output data will then also be an array.
+		
 		"""
-		with Xicclu(profile, intent, direction, order, pcs, scale, cwd,
-					startupinfo, use_icclu, use_cam_clipping, logfile,
-					self, show_actual_if_clipped, input_encoding,
-					output_encoding) as xicclu:
+		if getcfg("xicclu.native") and not (raw or get_clip or
+											use_cam_clipping):
+			try:
+				transform = Transform(profile, intent, direction, order, pcs,
+									  scale, input_encoding, output_encoding)
+			except NotImplementedError, exception:
+				if verbose > 1:
+					safe_print("Info: In-process lookup not available, using "
+							   "%s:" % ("icclu" if use_icclu else "xicclu"),
+							   exception)
+			else:
+				return self._native_xicclu(transform, idata, logfile)
+		with get_xicclu(profile, intent, direction, order, pcs, scale, cwd,
+						startupinfo, use_icclu, use_cam_clipping, logfile,
+						self, show_actual_if_clipped, input_encoding,
+						output_encoding) as xicclu:
 			xicclu(idata)
 		return xicclu.get(raw, get_clip)
 
 
+	def _native_xicclu(self, transform, idata, logfile=None):
+		""" Lookup input data through in-process ICC transform """
+		is_array = isinstance(idata, numpy.ndarray)
+		if isinstance(idata, basestring):
+			idata = [line.split() for line in idata.splitlines()
+					 if line.strip()]
+		elif not is_array:
+			idata = list(idata)
+			if idata and isinstance(idata[0], (float, int, long)):
+				idata = [idata]
+		if not len(idata):
+			return []
+		idata = numpy.array(idata, dtype=numpy.float64, ndmin=2)
+		numrows = len(idata)
+		odata = []
+		prevperc = -1
+		for start in xrange(0, numrows, BLOCKSIZE):
+			if getattr(sys, "_sigbreak", False) and not self.subprocess_abort:
+				self.subprocess_abort = True
+				safe_print("Got SIGBREAK, aborting lookup...")
+			if self.subprocess_abort or self.thread_abort:
+				raise Info(lang.getstr("aborted"))
+			odata.append(transform(idata[start:start + BLOCKSIZE]))
+			perc = round(min(start + BLOCKSIZE, numrows) /
+						 float(numrows) * 100)
+			if perc > prevperc and logfile:
+				logfile.write("\r%i%%" % perc)
+				prevperc = perc
+		if logfile:
+			logfile.write("\n")
+		odata = numpy.concatenate(odata)
+		if is_array:
+			return odata
+		return odata.tolist()
+
+
 class Xicclu(WorkerBase):
 	def __init__(self, profile, intent="r", direction="f", order="n",
 				 pcs=None, scale=1, cwd=None, startupinfo=None, use_icclu=False,
@@ -837,3 +920,354 @@ class MP_Xicclu(Xicclu):
 			else:
 				self._out.extend(slices)
 		return self._out
+
+
+class ResidentXicclu(Xicclu):
+
+	"""
+	Long-running xicclu process (see XiccluPool)
+	
+	Output is read continuously by a background thread. Requests are framed
+	by a comment line after the input rows, which xicclu echoes after the
+	output for those rows.
+	
+	"""
+
+	def spawn(self):
+		self.closed = False
+		self.output = []
+		self.errors = []
+		self.frames = 0
+		self.key = None
+		self.last_used = time()
+		self.lines = Queue()
+		self.stderr = tempfile.SpooledTemporaryFile()
+		self.subprocess = sp.Popen(self.args, stdin=sp.PIPE, stdout=sp.PIPE,
+								   stderr=self.stderr, cwd=self.cwd,
+								   startupinfo=self.startupinfo)
+		self.reader = threading.Thread(target=self._read,
+									   name="ResidentXicclu-%i" %
+											self.subprocess.pid)
+		self.reader.daemon = True
+		self.reader.start()
+
+	def _read(self):
+		for line in iter(self.subprocess.stdout.readline, ""):
+			self.lines.put(line)
+		# End of output
+		self.lines.put(None)
+
+	def receive(self, timeout=None):
+		"""
+		Return the output lines for all rows written since the last call.
+		
+		Returns None if the output is not complete after 'timeout' seconds.
+		
+		"""
+		p = self.subprocess
+		marker = None
+		if p.poll() is None and not p.stdin.closed:
+			self.frames += 1
+			marker = "#%s-%i" % (appname, self.frames)
+			try:
+				p.stdin.write(marker + "\n")
+				p.stdin.flush()
+			except IOError:
+				marker = None
+		output = []
+		start = time()
+		while True:
+			try:
+				line = self.lines.get(timeout=1)
+			except Empty:
+				if timeout and time() - start > timeout:
+					return None
+				continue
+			if line is None:
+				# Process has ended. Keep end marker for subsequent calls
+				self.lines.put(None)
+				break
+			if marker and marker in line:
+				break
+			output.append(line)
+		return output
+
+	def probe(self, timeout=5):
+		""" Check that xicclu echoes the request frame marker """
+		return self.receive(timeout) is not None
+
+	def terminate(self):
+		p = self.subprocess
+		if p.poll() is None:
+			try:
+				p.stdin.write("\n")
+				p.stdin.close()
+			except IOError:
+				pass
+			p.wait()
+		self.reader.join(5)
+		self.stderr.seek(0)
+		self.errors = self.stderr.readlines()
+		self.stderr.close()
+		self.closed = True
+
+
+class PooledXicclu(Xicclu):
+
+	"""
+	Lookup through a resident xicclu process
+	
+	Behaves like Xicclu, but closing returns the process to the pool instead
+	of ending it.
+	
+	"""
+
+	def __init__(self, child, logfile=None, worker=None):
+		WorkerBase.__init__(self)
+		self.child = child
+		self.logfile = logfile
+		self.worker = worker
+		self.temp = False
+		for name in ("args", "convert_video_rgb_to_clut65", "output_scale",
+					 "profile_path", "scale", "show_actual_if_clipped",
+					 "verbose"):
+			setattr(self, name, getattr(child, name))
+		self.closed = False
+		self.output = []
+		self.errors = []
+		self.subprocess = child.subprocess
+
+	def close(self, raise_exception=True):
+		if self.closed:
+			return
+		self.closed = True
+		try:
+			self.output = self.child.receive()
+		finally:
+			xicclu_pool.release(self.child)
+		if self.logfile:
+			self.logfile.write("\n")
+		if not self.isalive():
+			self.errors = self.child.errors
+			if self.subprocess.returncode and raise_exception:
+				# Error
+				raise IOError("\n".join(self.errors))
+
+	def spawn(self):
+		pass
+
+
+class XiccluPool(object):
+
+	"""
+	Pool of resident xicclu processes
+	
+	One process is kept per profile (identified by path, modification time
+	and size), intent, direction, PCS and the other lookup parameters, so
+	repeated lookups don't need to spawn xicclu and load the profile again.
+	Idle processes are ended after 'xicclu.pool.idle_timeout' seconds, and at
+	most 'xicclu.pool.max_children' idle processes are kept (least recently
+	used ones are ended first).
+	
+	Whether xicclu echoes the request frame markers is checked once in the
+	background. Until then, and if it doesn't, acquire returns None so
+	callers fall back to a one-shot xicclu process without waiting.
+	
+	"""
+
+	def __init__(self):
+		self.children = OrderedDict()
+		self.finalizer = None
+		self.lock = threading.RLock()
+		self.pid = os.getpid()
+		self.probing = False
+		self.streaming = None
+		self.timer = None
+
+	def _check_process(self):
+		""" Reset the pool in a new (forked) process """
+		if self.pid != os.getpid():
+			# Idle processes, lock and timer belong to the parent process
+			self.children = OrderedDict()
+			self.finalizer = None
+			self.lock = threading.RLock()
+			self.pid = os.getpid()
+			self.probing = False
+			self.timer = None
+		if not self.finalizer and mp.current_process().name != "MainProcess":
+			# Exit handlers registered with atexit don't run when a
+			# multiprocessing worker exits, but finalizers do
+			self.finalizer = mp.util.Finalize(None, self.shutdown,
+											  exitpriority=10)
+
+	def acquire(self, profile, intent="r", direction="f", order="n", pcs=None,
+				scale=1, cwd=None, startupinfo=None, use_icclu=False,
+				use_cam_clipping=False, logfile=None, worker=None,
+				show_actual_if_clipped=False, input_encoding=None,
+				output_encoding=None, convert_video_rgb_to_clut65=False,
+				verbose=1):
+		"""
+		Return a resident xicclu process for exclusive use.
+		
+		Returns None if the profile is not a file on disk, or if xicclu
+		doesn't support (or is not yet known to support) framed requests.
+		
+		"""
+		if self.streaming is False:
+			return
+		if isinstance(profile, basestring):
+			filename = profile
+		else:
+			filename = profile.fileName
+		if not filename:
+			return
+		try:
+			st = os.stat(filename)
+		except OSError:
+			return
+		key = (os.path.realpath(filename), st.st_mtime, st.st_size, intent,
+			   direction, order, pcs, scale, cwd, use_icclu, use_cam_clipping,
+			   show_actual_if_clipped, input_encoding, output_encoding,
+			   convert_video_rgb_to_clut65, verbose)
+		with self.lock:
+			self._check_process()
+			self.evict()
+			idle = self.children.pop(key, None)
+			if idle:
+				child = idle.pop()
+				if idle:
+					self.children[key] = idle
+				return child
+			streaming = self.streaming
+			probe = streaming is None and not self.probing
+			if probe:
+				self.probing = True
+		if not streaming:
+			if probe:
+				thread = threading.Thread(target=self._probe,
+										  name="XiccluPoolProbe",
+										  args=(key, profile, intent,
+												direction, order, pcs, scale,
+												cwd, startupinfo, use_icclu,
+												use_cam_clipping,
+												show_actual_if_clipped,
+												input_encoding,
+												output_encoding,
+												convert_video_rgb_to_clut65,
+												verbose))
+				thread.daemon = True
+				thread.start()
+			return
+		# Spawn outside the lock so other callers don't have to wait
+		child = self._spawn(profile, intent, direction, order, pcs, scale, cwd,
+							startupinfo, use_icclu, use_cam_clipping,
+							show_actual_if_clipped, input_encoding,
+							output_encoding, convert_video_rgb_to_clut65,
+							verbose)
+		child.key = key
+		return child
+
+	def _spawn(self, profile, intent, direction, order, pcs, scale, cwd,
+			   startupinfo, use_icclu, use_cam_clipping, show_actual_if_clipped,
+			   input_encoding, output_encoding, convert_video_rgb_to_clut65,
+			   verbose):
+		return ResidentXicclu(profile, intent, direction, order, pcs, scale,
+							  cwd, startupinfo, use_icclu, use_cam_clipping,
+							  None, None, show_actual_if_clipped,
+							  input_encoding, output_encoding,
+							  convert_video_rgb_to_clut65, verbose)
+
+	def _probe(self, key, *args):
+		""" Check whether xicclu echoes request frame markers """
+		verbose = args[-1]
+		try:
+			child = self._spawn(*args)
+			streaming = child.probe()
+		except Exception, exception:
+			safe_print("Warning: xicclu pool:", exception)
+			child = None
+			streaming = False
+		with self.lock:
+			self.streaming = streaming
+			self.probing = False
+		if streaming:
+			# Keep the probed process for subsequent lookups
+			child.key = key
+			self.release(child)
+		else:
+			if verbose > 1:
+				safe_print("Info: xicclu doesn't echo request markers, "
+						   "not using xicclu pool")
+			if child:
+				child.terminate()
+
+	def release(self, child):
+		""" Return a process to the pool """
+		if not child.isalive():
+			child.terminate()
+			return
+		child.last_used = time()
+		with self.lock:
+			idle = self.children.pop(child.key, [])
+			idle.append(child)
+			self.children[child.key] = idle
+			self.evict()
+			if self.children and not self.timer:
+				self.timer = threading.Timer(getcfg("xicclu.pool.idle_timeout"),
+											 self._expire)
+				self.timer.daemon = True
+				self.timer.start()
+
+	def _expire(self):
+		with self.lock:
+			self.timer = None
+			self.evict()
+			if self.children:
+				self.timer = threading.Timer(getcfg("xicclu.pool.idle_timeout"),
+											 self._expire)
+				self.timer.daemon = True
+				self.timer.start()
+
+	def evict(self):
+		""" End idle processes exceeding the timeout or count limit """
+		idle_timeout = getcfg("xicclu.pool.idle_timeout")
+		max_children = getcfg("xicclu.pool.max_children")
+		now = time()
+		expired = []
+		with self.lock:
+			count = 0
+			for key, idle in self.children.items():
+				for child in idle[:]:
+					if (now - child.last_used > idle_timeout or
+						not child.isalive()):
+						idle.remove(child)
+						expired.append(child)
+				if idle:
+					count += len(idle)
+				else:
+					del self.children[key]
+			while count > max_children:
+				# Least recently used first
+				key, idle = self.children.items()[0]
+				expired.append(idle.pop(0))
+				if not idle:
+					del self.children[key]
+				count -= 1
+		for child in expired:
+			child.terminate()
+
+	def shutdown(self):
+		""" End all idle processes """
+		with self.lock:
+			if self.timer:
+				self.timer.cancel()
+				self.timer = None
+			children = self.children.values()
+			self.children.clear()
+		for idle in children:
+			for child in idle:
+				child.terminate()
+
+
+xicclu_pool = XiccluPool()
+atexit.register(xicclu_pool.shutdown)
@@ -465,8 +465,8 @@ class SynthICCFrame(BaseFrame):
 			ti3[0].normalize_to_y_100()
 			rgb = [(100, 100, 100), (0, 0, 0), (100, 0, 0), (0, 100, 0), (0, 0, 100)]
 			colors = []
-			for R, G, B in rgb:
-				result = ti3.queryi1({"RGB_R": R, "RGB_G": G, "RGB_B": B})
+			for RGB in rgb:
+				result = ti3.find_device_values(RGB)
 				if result:
 					color = []
 					for component in "XYZ":
@@ -919,7 +919,8 @@ class SynthICCFrame(BaseFrame):
 						hue=self.getcfg("3dlut.hdr_hue"),
 						generate_B2A=trc == -2, worker=self.worker,
 						logfile=logfiles,
-						cat=self.cat)
+						cat=self.cat,
+						cache=self.worker.get_profile_cache())
 					profile.tags.A2B0 = hdr_clut_profile.tags.A2B0
 					if trc == -2:
 						# HLG
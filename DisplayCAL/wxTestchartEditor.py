@@ -2571,15 +2571,17 @@ END_DATA""")
 			filename, ext = os.path.splitext(path)
 			if ext.lower() not in (".icc", ".icm"):
 				if ext.lower() == ".ti3":
-					ti1 = CGATS.CGATS(ti3_to_ti1(open(path, "rU")))
+					ti1 = CGATS.CGATS(ti3_to_ti1(open(path, "rU")),
+									  columnar=CGATS.COLUMNAR_MIN_ROWS)
 					ti1.filename = filename + ".ti1"
 				else:
-					ti1 = CGATS.CGATS(path)
+					ti1 = CGATS.CGATS(path, columnar=CGATS.COLUMNAR_MIN_ROWS)
 					ti1.filename = path
 			else: # icc or icm profile
 				profile = ICCP.ICCProfile(path)
 				ti1 = CGATS.CGATS(ti3_to_ti1(profile.tags.get("CIED", "") or 
-											 profile.tags.get("targ", "")))
+											 profile.tags.get("targ", "")),
+								  columnar=CGATS.COLUMNAR_MIN_ROWS)
 				ti1.filename = filename + ".ti1"
 			ti1.fix_device_values_scaling()
 			try:
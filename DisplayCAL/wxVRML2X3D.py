@@ -247,7 +247,7 @@ def vrmlfile2x3dfile(vrmlpath=None, x3dpath=None, html=True, embed=False,
 							worker.progress_wnd.IsShownOnScreen(), fancy=False)
 	else:
 		result = x3dom.vrmlfile2x3dfile(vrmlpath, x3dpath, html, embed, force,
-										cache, None)
+										cache, None, safe_print)
 		if not isinstance(result, Exception) and result:
 			if view:
 				launch_file(finalpath)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import with_statement
+from cStringIO import StringIO
+from itertools import chain
 import httplib
 import os
 import re
@@ -19,6 +21,10 @@ import colormath
 import localization as lang
 
 
+# Number of markup lines written at once
+CHUNKSIZE = 1024
+
+
 class VRMLParseError(Exception):
 	pass
 
@@ -37,6 +43,14 @@ class Tag(object):
 		return self.markup()
 
 	def markup(self, allow_empty_element_tag=False, x3dom=False):
+		lines = list(self.markup_lines(allow_empty_element_tag, x3dom))
+		if self._markup_ends_with_newline(allow_empty_element_tag, x3dom):
+			lines.append("")
+		return "\n".join(lines)
+
+	def markup_lines(self, allow_empty_element_tag=False, x3dom=False,
+					 indent=""):
+		""" Generate lines of markup (without line endings) """
 		markup = ["<%s" % self.tagname]
 		attrs = []
 		for key, value in self.attributes.iteritems():
@@ -50,35 +64,56 @@ class Tag(object):
 			attrs.append("%s='%s'" % (key, value))
 		if attrs:
 			markup.append(" " + " ".join(attrs))
-		if not allow_empty_element_tag:
-			markup.append(">")
+		if (self.tagname == "Material" and
+			float(self.attributes.get("transparency",
+									  "0").strip()) not in (0.0, 1.0) and x3dom):
+			# Fix z-fighting in X3DOM renderer
+			depthmode = "<DepthMode readOnly='true'></DepthMode>"
+		else:
+			depthmode = None
 		if self.children:
-			if allow_empty_element_tag:
-				markup.append(">")
-			markup.append("\n")
+			markup.append(">")
+			yield indent + "".join(markup)
 			for child in self.children:
-				for line in child.markup(allow_empty_element_tag,
-										 x3dom).splitlines():
-					markup.append("\t" + line + "\n")
-		if not allow_empty_element_tag or self.children:
-			# Not XML, or XML with children
-			markup.append("</%s>\n" % self.tagname)
+				for line in child.markup_lines(allow_empty_element_tag, x3dom,
+											   indent + "\t"):
+					yield line
+			yield indent + "</%s>" % self.tagname
+		elif not allow_empty_element_tag:
+			# Not XML
+			markup.append("></%s>" % self.tagname)
+			yield indent + "".join(markup)
 		else:
 			# XML, no children
 			markup.append("/>")
+			if depthmode:
+				markup.append(depthmode)
+				depthmode = None
+			yield indent + "".join(markup)
+		if depthmode:
+			yield indent + depthmode
+
+	def _markup_ends_with_newline(self, allow_empty_element_tag=False,
+								  x3dom=False):
 		if (self.tagname == "Material" and
 			float(self.attributes.get("transparency",
 									  "0").strip()) not in (0.0, 1.0) and x3dom):
-			# Fix z-fighting in X3DOM renderer
-			markup.append("<DepthMode readOnly='true'></DepthMode>")
-		return "".join(markup)
+			return False
+		return bool(self.children or not allow_empty_element_tag)
+
+	def write(self, stream, allow_empty_element_tag=False, x3dom=False):
+		""" Write markup to stream (e.g. file or gzip file) """
+		lines = self.markup_lines(allow_empty_element_tag, x3dom)
+		_writelines(stream, lines,
+					self._markup_ends_with_newline(allow_empty_element_tag,
+												   x3dom))
 
 	def append_child(self, child):
 		child.parent = self
 		self.children.append(child)
 
 	def html(self, title="Untitled", xhtml=False, embed=False, force=False,
-			 cache=True):
+			 cache=True, stream=None):
 		"""
 		Convert X3D to HTML
 		
@@ -87,17 +122,14 @@ class Tag(object):
 		If embed is True, the X3DOM runtime and X3D viewer will be embedded in
 		the HTML (increases filesize considerably)
 		
+		If stream is given, the HTML is written to it instead of being
+		returned as string.
+		
 		"""
-		# Get children of X3D document
-		x3d_html = re.sub("\s*</?X3D(?:\s+[^>]*)?>\s*", "",
-						  self.markup(xhtml, True))
-		if not xhtml:
-			# Convert uppercase letters at start of tag name to lowercase
-			x3d_html = re.sub("(</?[0-9A-Z]+)",
-							  lambda match: match.groups()[0].lower(), x3d_html)
-		# Indent
-		x3d_html = "\n".join(["\t" * 2 + line
-							  for line in x3d_html.splitlines()]).lstrip()
+		if stream is None:
+			stream = StringIO()
+			self.html(title, xhtml, embed, force, cache, stream)
+			return stream.getvalue()
 
 		# Collect resources
 		def get_resource(url, source=True):
@@ -188,25 +220,73 @@ class Tag(object):
 		# Update title
 		html = re.sub("(<title>)[^<]*(</title>)",
 					  create_replace_function(r"\1%s\2", safe_unicode(title).encode("UTF-8")), html)
-		# Insert X3D
-		html = html.replace("</x3d>", "\t" + x3d_html + "\n\t\t</x3d>")
 		# Finish
 		if xhtml:
 			html = "<?xml version='1.0' encoding='UTF-8'?>\n" + html
 			html = re.sub("\s*/>", " />", html)
 		else:
 			html = re.sub("\s*/>", ">", html)
-		return html
+		# Insert X3D
+		parts = html.split("</x3d>")
+		stream.write(parts[0])
+		for part in parts[1:]:
+			stream.write("\t")
+			_writelines(stream, self._html_x3d_lines(xhtml), False)
+			stream.write("\n\t\t</x3d>" + part)
+
+	def _html_x3d_lines(self, xhtml=False):
+		""" Generate indented markup lines of the children of X3D document """
+		if self.tagname == "X3D" and self.children:
+			lines = chain.from_iterable(child.markup_lines(xhtml, True, "\t")
+										for child in self.children)
+		else:
+			lines = re.sub("\s*</?X3D(?:\s+[^>]*)?>\s*", "",
+						   self.markup(xhtml, True)).splitlines()
+		for i, line in enumerate(lines):
+			if xhtml:
+				line = re.sub("\s*/>", " />", line)
+			else:
+				# Convert uppercase letters at start of tag name to lowercase
+				line = re.sub("(</?[0-9A-Z]+)",
+							  lambda match: match.groups()[0].lower(), line)
+				line = re.sub("\s*/>", ">", line)
+			if i:
+				# Indent
+				yield "\t" * 2 + line
+			else:
+				yield line.lstrip()
 
 	def xhtml(self, *args, **kwargs):
 		kwargs["xhtml"] = True
 		return self.html(*args, **kwargs)
 	
-	def x3d(self):
-		x3d = "\n".join(["<?xml version='1.0' encoding='UTF-8'?>",
-						 '<!DOCTYPE X3D PUBLIC "ISO//Web3D//DTD X3D 3.0//EN" "http://www.web3d.org/specifications/x3d-3.0.dtd">',
-						 self.markup(allow_empty_element_tag=True)])
-		return x3d
+	def x3d(self, stream=None):
+		""" Return X3D document as string or write it to stream if given """
+		if stream is None:
+			stream = StringIO()
+			self.x3d(stream)
+			return stream.getvalue()
+		stream.write("\n".join(["<?xml version='1.0' encoding='UTF-8'?>",
+								'<!DOCTYPE X3D PUBLIC "ISO//Web3D//DTD X3D 3.0//EN" "http://www.web3d.org/specifications/x3d-3.0.dtd">',
+								""]))
+		self.write(stream, allow_empty_element_tag=True)
+
+
+def _writelines(stream, lines, newline=True):
+	""" Write lines joined by newlines to stream, in chunks """
+	sep = ""
+	chunk = []
+	for line in lines:
+		chunk.append(line)
+		if len(chunk) == CHUNKSIZE:
+			stream.write(sep + "\n".join(chunk))
+			sep = "\n"
+			chunk = []
+	if chunk:
+		stream.write(sep + "\n".join(chunk))
+	if newline:
+		stream.write("\n")
+
 
 def _attrchk(attribute, token, tag, indent):
 	if attribute:
@@ -510,8 +590,23 @@ Transform {
 	return vrml
 
 
-def vrml2x3dom(vrml, worker=None):
-	""" Convert VRML to X3D """
+# VRML tokens: Braces, brackets and quotes, line breaks, runs of spaces/tabs,
+# invalid control characters and runs of anything else
+_vrml_tokens = re.compile(r'[{}\[\]"]|[\n\r]|[ \t]+|[\x00-\x08\x0b\x0c\x0e-\x1f]|'
+						  r'[^{}\[\]"\n\r \t\x00-\x08\x0b\x0c\x0e-\x1f]+')
+_vrml_invalid_token_char = re.compile("[^0-9A-Za-z_]")
+_vrml_list_values = re.compile(r'[^{}\[\]\x00-\x08\x0b\x0c\x0e-\x1f]+')
+_vrml_spaces = re.compile(" {2,}")
+
+
+def vrml2x3dom(vrml, worker=None, logfn=None):
+	"""
+	Convert VRML to X3D
+	
+	worker  Optional worker for progress and abort handling
+	logfn   Optional function for progress output, e.g. log.safe_print
+	
+	"""
 	x3d = Tag("X3D",  **{"xmlns:xsd": "http://www.w3.org/2001/XMLSchema-instance",
 						 "profile": "Immersive",
 						 "version": "3.0",
@@ -519,7 +614,6 @@ def vrml2x3dom(vrml, worker=None):
 	tag = Tag("Scene")
 	x3d.append_child(tag)
 	token = ""
-	valid_token_chars = string.ascii_letters + string.digits + "_"
 	attribute = False
 	quote = 0
 	listing = False
@@ -530,27 +624,65 @@ def vrml2x3dom(vrml, worker=None):
 	# Remove commas
 	vrml = re.sub(",\s*", " ", vrml)
 	indent = ""
-	maxi = len(vrml) - 1.0
+	length = len(vrml)
+	maxi = length - 1.0
 	lastprogress = 0
-	for i, c in enumerate(vrml):
-		curprogress = int(i / maxi * 100)
-		if worker:
+	nextprogress = 0
+	pos = 0
+	while pos < length:
+		start = pos
+		if (attribute and listing and
+			(tag.tagname != "FontStyle" or token != "style")):
+			# Consume list values up to the next brace or bracket at once
+			match = _vrml_list_values.match(vrml, pos)
+		else:
+			match = None
+		if match:
+			values = match.group()
+		else:
+			values = None
+			match = _vrml_tokens.match(vrml, pos)
+			c = match.group()
+		pos = match.end()
+		if start >= nextprogress:
+			curprogress = int(start / maxi * 100)
+			if worker:
+				if curprogress > lastprogress:
+					worker.lastmsg.write("%i%%\n" % curprogress)
+				if getattr(worker, "thread_abort", False):
+					return False
 			if curprogress > lastprogress:
-				worker.lastmsg.write("%i%%\n" % curprogress)
-			if getattr(worker, "thread_abort", False):
-				return False
-		if curprogress > lastprogress:
-			lastprogress = curprogress
-			if curprogress < 100:
-				end = None
-			else:
-				end = "\n"
-			_safe_print.write("\r%i%%" % curprogress, end=end)
-		if ord(c) < 32 and c not in "\n\r\t":
+				lastprogress = curprogress
+				if logfn:
+					if curprogress < 100:
+						end = None
+					else:
+						end = "\n"
+					logfn("\r%i%%" % curprogress, end=end)
+			nextprogress = (curprogress + 1) / 100.0 * maxi
+		if values:
+			# Line breaks and spaces collapse to single spaces, leading
+			# whitespace is skipped (like the per-token handling below)
+			value = tag.attributes.get(token)
+			if value is None:
+				if not values.strip("\n\r"):
+					continue
+				value = tag.attributes[token] = StrList()
+			values = _vrml_spaces.sub(" ", values.replace("\n", " ").replace("\r",
+																			 " "))
+			if not value:
+				values = values.lstrip(" \t")
+			elif values[:1] == " " and value[-1][-1] == " ":
+				values = values[1:]
+			quote = (quote + values.count('"')) % 2
+			if values:
+				value += values
+		elif c[0] < " " and c[0] not in "\n\r\t":
 			raise VRMLParseError("Parse error: Got invalid character %r" % c)
 		elif c == "{":
-			safe_print(indent, "start tag %r" % token)
-			indent += "  "
+			if debug:
+				safe_print(indent, "start tag %r" % token)
+				indent += "  "
 			attribute = False
 			if token:
 				if token[0] not in string.ascii_letters:
@@ -563,8 +695,9 @@ def vrml2x3dom(vrml, worker=None):
 			token = ""
 		elif c == "}":
 			attribute = _attrchk(attribute, token, tag, indent)
-			indent = indent[:-2]
-			safe_print(indent, "end tag %r" % tag.tagname)
+			if debug:
+				indent = indent[:-2]
+				safe_print(indent, "end tag %r" % tag.tagname)
 			if tag.parent:
 				tag = tag.parent
 			else:
@@ -572,7 +705,8 @@ def vrml2x3dom(vrml, worker=None):
 			token = ""
 		elif c == "[":
 			if token:
-				safe_print(indent, "listing %r" % token)
+				if debug:
+					safe_print(indent, "listing %r" % token)
 				listing = True
 		elif c == "]":
 			attribute = _attrchk(attribute, token, tag, indent)
@@ -581,52 +715,59 @@ def vrml2x3dom(vrml, worker=None):
 		elif attribute:
 			if c in ("\n", "\r"):
 				if listing:
-					if (tag.attributes.get(token) and
-						tag.attributes[token][-1] != " "):
-						tag.attributes[token] += " "
+					value = tag.attributes.get(token)
+					if value and value[-1][-1] != " ":
+						value += " "
 				else:
 					attribute = _attrchk(attribute, token, tag, indent)
 					token = ""
 			else:
 				if not token in tag.attributes:
 					tag.attributes[token] = StrList()
-				if not (c.strip() or tag.attributes[token]):
-					continue
-				if c == '"':
+				value = tag.attributes[token]
+				if c[0] in " \t":
+					# Skip leading whitespace, collapse spaces
+					for c in c:
+						if value and (c != " " or value[-1][-1] != " "):
+							value += c
+				elif c == '"':
 					quote += 1
-				if c != '"' or tag.tagname != "FontStyle" or token != "style":
-					if c != " " or (tag.attributes[token] and
-									tag.attributes[token][-1] != " "):
-						tag.attributes[token] += c
-				if quote == 2:
-					if not listing:
-						attribute = _attrchk(attribute, token, tag, indent)
-						token = ""
-					quote = 0
-		elif c not in (" ", "\n", "\r", "\t"):
-			if c in valid_token_chars:
-				token += c
-			else:
-				raise VRMLParseError("Parse error: Got invalid character %r" % c)
+					if tag.tagname != "FontStyle" or token != "style":
+						value += c
+					if quote == 2:
+						if not listing:
+							attribute = _attrchk(attribute, token, tag, indent)
+							token = ""
+						quote = 0
+				else:
+					value += c
+		elif c[0] not in " \n\r\t":
+			invalid = _vrml_invalid_token_char.search(c)
+			if invalid:
+				raise VRMLParseError("Parse error: Got invalid character %r" %
+									 invalid.group())
+			token += c
 		elif token:
 			if token[0] not in string.ascii_letters:
 				raise VRMLParseError("Parse error: Invalid token", token)
 			if token == "children":
 				token = ""
-			elif c in (" ", "\t"):
-				if not attribute:
-					attribute = True
-					if token in tag.attributes:
-						# Overwrite existing attribute
-						tag.attributes[token] = StrList()
+			elif c[0] in " \t":
+				attribute = True
+				if token in tag.attributes or len(c) > 1:
+					# Overwrite existing attribute. Remaining whitespace is
+					# processed as (leading) attribute value
+					tag.attributes[token] = StrList()
 	return x3d
 
 
 def vrmlfile2x3dfile(vrmlpath, x3dpath, html=True, embed=False, force=False,
-					 cache=True, worker=None):
+					 cache=True, worker=None, logfn=None):
 	"""
 	Convert VRML file located at vrmlpath to HTML and write to x3dpath
 	
+	logfn is passed on to vrml2x3dom for progress output.
+	
 	"""
 	filename, ext = os.path.splitext(vrmlpath)
 	if ext.lower() in (".gz", ".wrz"):
@@ -641,20 +782,26 @@ def vrmlfile2x3dfile(vrmlpath, x3dpath, html=True, embed=False, force=False,
 	_safe_print(lang.getstr("converting"), vrmlpath)
 	filename, ext = os.path.splitext(x3dpath)
 	try:
-		x3d = vrml2x3dom(vrml, worker)
+		x3d = vrml2x3dom(vrml, worker, logfn)
 		if not x3d:
 			_safe_print(lang.getstr("aborted"))
 			return False
-		if not html:
-			_safe_print("Writing", x3dpath)
-			with open(x3dpath, "wb") as x3dfile:
-				x3dfile.write(x3d.x3d())
-		else:
-			html = x3d.html(title=os.path.basename(filename),
-							embed=embed, force=force, cache=cache)
-			_safe_print("Writing", x3dpath + ".html")
-			with open(x3dpath + ".html", "wb") as htmlfile:
-				htmlfile.write(html)
+		if html:
+			x3dpath += ".html"
+		_safe_print("Writing", x3dpath)
+		try:
+			with open(x3dpath, "wb") as outfile:
+				if html:
+					x3d.html(title=os.path.basename(filename),
+							 embed=embed, force=force, cache=cache,
+							 stream=outfile)
+				else:
+					x3d.x3d(outfile)
+		except:
+			# Don't leave an incomplete file behind
+			if os.path.isfile(x3dpath):
+				os.remove(x3dpath)
+			raise
 	except KeyboardInterrupt:
 		x3d = False
 	except VRMLParseError, exception:
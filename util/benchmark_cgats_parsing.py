@@ -0,0 +1,95 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Time CGATS parsing with row and columnar DATA storage
+
+Usage: benchmark_cgats_parsing.py [REPEAT] [FILE...]
+
+Pass CGATS files (e.g. .ti3 measurement files) as arguments. Without files,
+a TI3 with the patches of verify_xxxl.ti1 (repeated REPEAT times) is used,
+the size of a large display measurement.
+
+For each file, the best of 5 runs is shown for parsing alone, for parsing
+and reading the device and XYZ values of all patches (like check_ti3 does)
+and for parsing and converting to a TI1 (like loading a TI3 as testchart).
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DisplayCAL import CGATS
+from DisplayCAL.argyll_cgats import ti3_to_ti1
+
+
+FIELDS = ("RGB_R", "RGB_G", "RGB_B", "XYZ_X", "XYZ_Y", "XYZ_Z")
+
+
+def create_ti3(repeat=1):
+	ti1 = CGATS.CGATS(os.path.join(os.path.dirname(CGATS.__file__), "ref",
+								   "verify_xxxl.ti1"))
+	ti3 = ti1[0]
+	ti3.type = "CTI3"
+	ti3.add_keyword("DEVICE_CLASS", "DISPLAY")
+	ti3.add_keyword("COLOR_REP", "RGB_XYZ")
+	ti3.add_keyword("LUMINANCE_XYZ_CDM2", "114.830000 120.000000 130.080000")
+	data = ti3.DATA
+	numsets = len(data)
+	for i in xrange(1, repeat):
+		for key in xrange(numsets):
+			data.add_data(dict(data[key]))
+	return str(ti1)
+
+
+def read_values(cgats):
+	data = cgats.queryv1("DATA")
+	columns = data._get_columns(FIELDS)
+	if columns:
+		return columns
+	return [[item[field] for field in FIELDS] for item in data.itervalues()]
+
+
+def best_of(fn, runs=5):
+	best = None
+	for i in xrange(runs):
+		ts = time.time()
+		fn()
+		elapsed = time.time() - ts
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+
+def main(*args):
+	if args and args[0].isdigit():
+		repeat = int(args[0])
+		args = args[1:]
+	else:
+		repeat = 1
+	if args:
+		sources = []
+		for filename in args:
+			with open(filename, "rb") as cgatsfile:
+				sources.append((os.path.basename(filename), cgatsfile.read()))
+	else:
+		sources = [("verify_xxxl.ti3 x %i" % repeat, create_ti3(repeat))]
+	for name, text in sources:
+		lines = text.splitlines()
+		numsets = len(CGATS.CGATS(lines, columnar=True).queryv1("DATA"))
+		print "%s: %i patches, %.1f KiB" % (name, numsets, len(text) / 1024.0)
+		for columnar in (False, True):
+			mode = ("rows", "columnar")[columnar]
+			parse = lambda: CGATS.CGATS(lines, columnar=columnar)
+			values = lambda: read_values(parse())
+			print "  %-9s parse          %8.3f seconds" % (mode, best_of(parse))
+			print "  %-9s parse + values %8.3f seconds" % (mode, best_of(values))
+		print "  ti3_to_ti1               %8.3f seconds" % best_of(lambda:
+																   ti3_to_ti1(lines))
+
+
+if __name__ == "__main__":
+	main(*sys.argv[1:])
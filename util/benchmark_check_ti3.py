@@ -0,0 +1,47 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Time worker.check_ti3 on verify_xxxl.ti1 sized (or larger) measurement data
+
+The XYZ values of the chart are randomly perturbed so that a realistic
+number of patches ends up being reported as suspicious.
+
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DisplayCAL import CGATS
+from DisplayCAL.worker import check_ti3
+
+
+def main(repeat=1, columnar=False):
+	ti1 = CGATS.CGATS(os.path.join(os.path.dirname(CGATS.__file__), "ref",
+								   "verify_xxxl.ti1"))
+	data = ti1[0].DATA
+	numsets = len(data)
+	for i in xrange(1, repeat):
+		for key in xrange(numsets):
+			data.add_data(dict(data[key]))
+	random.seed(0)
+	for item in data.itervalues():
+		for component in "XYZ":
+			item["XYZ_" + component] *= random.uniform(.95, 1.05)
+	ti3 = CGATS.CGATS(str(ti1), columnar=columnar)
+	ts = time.time()
+	suspicious = check_ti3(ti3, False)
+	print "%i patches, %i suspicious, %.3f seconds" % (len(ti3[0].DATA),
+													   len(suspicious),
+													   time.time() - ts)
+
+
+if __name__ == "__main__":
+	if len(sys.argv[1:]) < 3:
+		main(*[int(arg) for arg in sys.argv[1:]])
+	else:
+		print "Usage: %s [REPEAT [COLUMNAR]]" % os.path.basename(__file__)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Time LUT16Type.smooth and LUT16Type.smooth2 on random 33^3 and 65^3 cLUTs
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from DisplayCAL import ICCProfile as ICCP
+
+
+def create_lut16(clutres, seed=0):
+	clut = numpy.random.RandomState(seed).uniform(0, 65535, (clutres * clutres,
+															 clutres, 3))
+	lut16 = ICCP.LUT16Type()
+	lut16._i = lut16._o = 3
+	lut16._g = clutres
+	lut16.clut_array = clut
+	return lut16
+
+
+def main(*clutres):
+	for res in [int(v) for v in clutres] or (33, 65):
+		for pcs in ("Lab", "XYZ"):
+			for method in ("smooth", "smooth2"):
+				lut16 = create_lut16(res)
+				ts = time.time()
+				getattr(lut16, method)(diagpng=0, pcs=pcs)
+				print "%i^3 %s %s: %.3f seconds" % (res, pcs, method,
+													time.time() - ts)
+
+
+if __name__ == "__main__":
+	main(*sys.argv[1:])
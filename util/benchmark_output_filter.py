@@ -0,0 +1,69 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Time worker.FilteredStream and worker.scan_output on Argyll tool output
+
+Pass captured Argyll output (e.g. DisplayCAL session logs) as arguments.
+Without arguments, dispread-like output for 5000 patches is used.
+
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DisplayCAL.util_io import LineCache, StringIOu as StringIO
+from DisplayCAL.worker import FilteredStream, scan_output
+
+
+def dispread_output(numpatches=5000):
+	lines = ["Instrument Type:   i1 DisplayPro, ColorMunki Display",
+			 "Serial Number:     A01234567",
+			 "Place instrument on test window.",
+			 "Hit Esc or Q to give up, any other key to continue:",
+			 "Number of patches = %i" % numpatches]
+	for i in xrange(1, numpatches + 1):
+		lines.append("Current RGB %i %i %i %.6f %.6f %.6f" %
+					 ((i % 256, ) * 3 + (i % 256 / 255.0, ) * 3))
+		lines.append("\r%2i%% patch %i of %i" %
+					 (i * 100 // numpatches, i, numpatches))
+	lines.append("The instrument can be removed from the screen.")
+	return [line + "\r\n" for line in lines]
+
+
+def main(*logfilenames):
+	if logfilenames:
+		chunks = []
+		for logfilename in logfilenames:
+			with open(logfilename, "rb") as logfile:
+				chunks.extend(line.rstrip("\r\n") + "\r\n" for line in logfile)
+	else:
+		chunks = dispread_output()
+	prestrip = re.compile(r"\D+\s+\d+\s+\d+:\d+:\d+\s+\w+\[\d+\]\s+<Warning>:[\S\s]*")
+	streams = {"log": FilteredStream(StringIO(), "UTF-8", triggers=[]),
+			   "terminal": FilteredStream(StringIO(), "UTF-8"),
+			   "recent": FilteredStream(LineCache(maxlines=3), "UTF-8",
+										discard=re.compile(r"[\*\.]+|\s*\d*%?"),
+										triggers=["Password:",
+												  "stopped at user request"],
+										prestrip=prestrip)}
+	for name, stream in sorted(streams.iteritems()):
+		ts = time.time()
+		for chunk in chunks:
+			stream.write(chunk)
+		print "FilteredStream (%s): %i chunks, %.3f seconds" % (name,
+																 len(chunks),
+																 time.time() - ts)
+	ts = time.time()
+	for chunk in chunks:
+		scan_output(chunk)
+	print "scan_output: %i chunks, %.3f seconds" % (len(chunks),
+												   time.time() - ts)
+
+
+if __name__ == "__main__":
+	main(*sys.argv[1:])
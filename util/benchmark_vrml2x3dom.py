@@ -0,0 +1,132 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Time x3dom.vrml2x3dom and X3D output on gamut and measurement VRML
+
+Usage: benchmark_vrml2x3dom.py [STEPS] [FILE...]
+
+Pass VRML files (.wrl, .wrz or .wrl.gz) as arguments. Without files, a gamut
+VRML like the ones written by Argyll's iccgamut/viewgam for the surface of a
+STEPS^3 sRGB device cube (default 65), and a measurement VRML of
+verify_xxxl.ti1 (CGATS.export_3d) are used.
+
+For each file, the best of 5 runs is shown for the VRML to X3D conversion, for
+writing X3D to a stream and for creating the X3DOM markup.
+
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from DisplayCAL import CGATS, colormath, x3dom
+from DisplayCAL.util_io import StringIOu as StringIO
+
+
+def gamut_vrml(steps=65):
+	""" Return VRML of the Lab surface of a steps^3 sRGB device cube """
+	ramp = numpy.linspace(0, 1, steps)
+	u, v = [a.ravel() for a in numpy.meshgrid(ramp, ramp)]
+	zero = numpy.zeros(len(u))
+	one = numpy.ones(len(u))
+	faces = [(zero, u, v), (one, u, v), (u, zero, v), (u, one, v),
+			 (u, v, zero), (u, v, one)]
+	RGB = numpy.concatenate([numpy.column_stack(face) for face in faces])
+	Lab = colormath.RGB2Lab_array(RGB, "sRGB")
+	quads = []
+	for face in xrange(6):
+		offset = face * steps * steps
+		for row in xrange(steps - 1):
+			for col in xrange(steps - 1):
+				i = offset + row * steps + col
+				quads.append((i, i + 1, i + steps + 1, i + steps))
+	lines = ["#VRML V2.0 utf8", "",
+			 "# Created by benchmark_vrml2x3dom", "",
+			 "Transform {", "  children [", "    Shape {",
+			 "      geometry IndexedFaceSet {", "        ccw FALSE",
+			 "        convex TRUE", "", "        coord Coordinate {",
+			 "          point [			# Verticy coordinates"]
+	lines.extend("            %f %f %f," % (a, b, L) for L, a, b in Lab)
+	lines.extend(["          ]", "        }",
+				  "        coordIndex [ 		# Indexes of poligon Verticies "])
+	for i, j, k, l in quads:
+		lines.append("          %i, %i, %i, -1," % (i, j, k))
+		lines.append("          %i, %i, %i, -1," % (i, k, l))
+	lines.extend(["        ]", "", "        colorPerVertex TRUE",
+				  "        color Color {", "          color [			# RGB colors of each vertex"])
+	lines.extend("            %f %f %f," % tuple(rgb) for rgb in RGB)
+	lines.extend(["          ] ", "        }", "      }",
+				  "      appearance Appearance { ",
+				  "        material Material {",
+				  "          transparency 0.0",
+				  "        }", "      }", "    }", "  ]", "}", ""])
+	return "\n".join(lines)
+
+
+def measurement_vrml():
+	""" Return VRML of verify_xxxl.ti1 in L*a*b* (CGATS.export_3d) """
+	ti1 = CGATS.CGATS(os.path.join(os.path.dirname(CGATS.__file__), "ref",
+								   "verify_xxxl.ti1"))
+	fd, filename = tempfile.mkstemp(".wrl")
+	os.close(fd)
+	try:
+		ti1.export_3d(filename, "Lab", compress=False)
+		with open(filename, "rb") as vrmlfile:
+			return vrmlfile.read()
+	finally:
+		os.remove(filename)
+
+
+def best_of(fn, runs=5):
+	best = None
+	for i in xrange(runs):
+		ts = time.time()
+		fn()
+		elapsed = time.time() - ts
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+
+def main(*args):
+	if args and args[0].isdigit():
+		steps = int(args[0])
+		args = args[1:]
+	else:
+		steps = 65
+	if args:
+		sources = []
+		for filename in args:
+			if os.path.splitext(filename)[1].lower() in (".gz", ".wrz"):
+				cls = gzip.open
+			else:
+				cls = open
+			with cls(filename, "rb") as vrmlfile:
+				sources.append((os.path.basename(filename), vrmlfile.read()))
+	else:
+		sources = [("gamut %i^3" % steps, gamut_vrml(steps)),
+				   ("verify_xxxl.ti1 Lab", measurement_vrml())]
+	for name, vrml in sources:
+		print "%s: %.1f KiB VRML" % (name, len(vrml) / 1024.0)
+		x3d = x3dom.vrml2x3dom(vrml)
+		stream = StringIO()
+		x3d.x3d(stream)
+		print "  vrml2x3dom  %8.3f seconds" % best_of(lambda:
+													  x3dom.vrml2x3dom(vrml))
+		print "  x3d         %8.3f seconds (%.1f KiB)" % (best_of(lambda:
+																  x3d.x3d(StringIO())),
+														  len(stream.getvalue()) /
+														  1024.0)
+		print "  markup      %8.3f seconds" % best_of(lambda:
+													  x3d.markup(x3dom=True))
+
+
+if __name__ == "__main__":
+	main(*sys.argv[1:])
@@ -0,0 +1,157 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Check the colormath *_array functions against their scalar counterparts
+
+Each array function is fed the device RGB and XYZ values of the reference
+charts (ref/*.ti1), and L*a*b* and other values derived from them, and
+compared value by value to the scalar function applied to every row. The
+same checks are repeated with random input as an additional check of value
+ranges the charts don't cover. Reports the maximum absolute difference per
+function and exits with a non-zero status if any difference exceeds the
+tolerance.
+
+"""
+
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from DisplayCAL import CGATS, colormath as cm
+
+
+def chart_inputs():
+	"""
+	Return RGB and XYZ (0..1) of the reference charts' patches, their
+	L*a*b*, and the L*a*b* of the respective previous patch (to compare
+	against)
+	
+	"""
+	values = []
+	for filename in sorted(glob.glob(os.path.join(os.path.dirname(cm.__file__),
+												  "ref", "*.ti1"))):
+		data, valueslist = CGATS.CGATS(filename).get_RGB_XYZ_values()
+		if valueslist:
+			values.extend(valueslist)
+	values = numpy.array(values) / 100.0
+	RGB, XYZ = values[:, :3], values[:, 3:]
+	Lab = numpy.array([cm.XYZ2Lab(*(row * 100)) for row in XYZ])
+	return RGB, XYZ, Lab, numpy.roll(Lab, 1, axis=0)
+
+
+def random_inputs(rs, n):
+	""" Return random RGB, XYZ and two sets of L*a*b* """
+	return (rs.uniform(0, 1, (n, 3)), rs.uniform(0, 1.1, (n, 3)),
+			random_Lab(rs, n), random_Lab(rs, n))
+
+
+def random_Lab(rs, n):
+	return numpy.column_stack((rs.uniform(0, 100, n),
+							   rs.uniform(-128, 128, (n, 2))))
+
+
+def scalar(fn, *args, **kwargs):
+	""" Apply scalar fn(X, Y, Z, ...) to every row """
+	return lambda values: numpy.array([fn(*tuple(row) + args, **kwargs)
+									   for row in values])
+
+
+def checks(RGB, XYZ, Lab, Lab2):
+	""" Yield (name, input, array result function, scalar result function) """
+	v = RGB.ravel()
+	for b in (2.2, 1 / 2.2, -2.4, 1 / -2.4, -3.0, 1 / -3.0, -240, 1 / -240.,
+			  -601, 1 / -601., -709, 1 / -709., -2084, 1 / -2084.):
+		yield ("specialpow(%s)" % b, v,
+			   lambda v, b=b: cm.specialpow_array(v, b),
+			   lambda v, b=b: numpy.array([cm.specialpow(x, b) for x in v]))
+	yield ("adapt", XYZ, lambda v: cm.adapt_array(v, "D65", "D50"),
+		   scalar(cm.adapt, "D65", "D50"))
+	bp = (0.002, 0.0021, 0.0025)
+	yield ("apply_bpc", XYZ, lambda v: cm.apply_bpc_array(v, bp),
+		   scalar(cm.apply_bpc, bp))
+	yield ("blend_ab", XYZ,
+		   lambda v: cm.blend_ab_array(v, bp, cm.get_whitepoint("D50")),
+		   scalar(cm.blend_ab, bp, cm.get_whitepoint("D50")))
+	yield ("blend_blackpoint", XYZ,
+		   lambda v: cm.blend_blackpoint_array(v, bp, (0, 0, 0)),
+		   scalar(cm.blend_blackpoint, bp, (0, 0, 0)))
+	for method in ("1976", "1994", "2000", "CMC(2:1)", "CMC(1:1)"):
+		for key in ("E", "L", "C", "H"):
+			yield ("delta(%s)[%s]" % (method, key), Lab,
+				   lambda v, method=method, key=key: cm.delta_array(v, Lab2,
+																	method)[key],
+				   lambda v, method=method, key=key:
+				   numpy.array([cm.delta(*tuple(row1) + tuple(row2) +
+										 (method, ))[key]
+								for row1, row2 in zip(v, Lab2)]))
+	yield ("Lab2XYZ", Lab, cm.Lab2XYZ_array, scalar(cm.Lab2XYZ))
+	yield ("XYZ2Lab", XYZ, cm.XYZ2Lab_array, scalar(cm.XYZ2Lab))
+	yield ("XYZ2RGB", XYZ, lambda v: cm.XYZ2RGB_array(v, "sRGB"),
+		   scalar(cm.XYZ2RGB, "sRGB"))
+	yield ("XYZ2ICtCp", XYZ, cm.XYZ2ICtCp_array, scalar(cm.XYZ2ICtCp))
+	ICtCp = numpy.array([cm.XYZ2ICtCp(*row) for row in XYZ])
+	yield ("ICtCp2XYZ", ICtCp, cm.ICtCp2XYZ_array, scalar(cm.ICtCp2XYZ))
+	yield ("HSV2RGB", RGB, cm.HSV2RGB_array, scalar(cm.HSV2RGB))
+	LCH = numpy.array([cm.Lab2LCHab(*row) for row in Lab])
+	yield ("LCHab2Lab", LCH, cm.LCHab2Lab_array, scalar(cm.LCHab2Lab))
+	yield ("Lab2LCHab", Lab, cm.Lab2LCHab_array, scalar(cm.Lab2LCHab))
+	yield ("RGB2HSI", RGB, cm.RGB2HSI_array, scalar(cm.RGB2HSI))
+	yield ("RGB2HSL", RGB, cm.RGB2HSL_array, scalar(cm.RGB2HSL))
+	yield ("RGB2HSV", RGB, cm.RGB2HSV_array, scalar(cm.RGB2HSV))
+	yield ("RGB2XYZ", RGB, lambda v: cm.RGB2XYZ_array(v, "sRGB"),
+		   scalar(cm.RGB2XYZ, "sRGB"))
+	yield ("RGB2Lab", RGB, lambda v: cm.RGB2Lab_array(v, "sRGB"),
+		   scalar(cm.RGB2Lab, "sRGB"))
+	yield ("XYZ2xyY", XYZ, cm.XYZ2xyY_array, scalar(cm.XYZ2xyY))
+	xyY = numpy.array([cm.XYZ2xyY(*row) for row in XYZ])
+	yield ("xyY2XYZ", xyY, cm.xyY2XYZ_array, scalar(cm.xyY2XYZ))
+	values = v[:len(v) // 64 * 64].reshape((-1, 64))
+	for window in (None, (1, 2, 1), (1, 1, 1, 1, 1)):
+		yield ("smooth_avg(%s)" % (window, ), values,
+			   lambda v, window=window: cm.smooth_avg_array(v, 2, window),
+			   lambda v, window=window:
+			   numpy.array([cm.smooth_avg(list(row), 2, window)
+							for row in v]))
+
+
+def main(n=1000, seed=0, tolerance=1e-9):
+	rs = numpy.random.RandomState(int(seed))
+	failed = []
+	for source, inputs in (("ref/*.ti1", chart_inputs()),
+						   ("random", random_inputs(rs, int(n)))):
+		print "%s (%i values)" % (source, len(inputs[0]))
+		for name, values, array_fn, scalar_fn in checks(*inputs):
+			expected = numpy.asarray(scalar_fn(values), dtype=numpy.float64)
+			result = numpy.asarray(array_fn(values), dtype=numpy.float64)
+			if result.shape != expected.shape:
+				print "  %-24s FAIL shape %r != %r" % (name, result.shape,
+														expected.shape)
+				failed.append(name)
+				continue
+			diff = numpy.abs(result - expected)
+			nan = numpy.isnan(result) != numpy.isnan(expected)
+			maxdiff = numpy.nanmax(diff) if not numpy.isnan(diff).all() else 0
+			if nan.any() or maxdiff > float(tolerance):
+				status = "FAIL"
+				failed.append("%s %s" % (source, name))
+			elif (result == expected).all():
+				status = "identical"
+			else:
+				status = "ok"
+			print "  %-24s %-9s max difference %g" % (name, status, maxdiff)
+	if failed:
+		print "%i of the checks failed" % len(failed)
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	if len(sys.argv[1:]) < 4:
+		sys.exit(main(*sys.argv[1:]))
+	else:
+		print "Usage: %s [N [SEED [TOLERANCE]]]" % os.path.basename(__file__)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Check gamut volume and voxelized intersection of gamut surfaces
+
+The intersection of a surface with itself has to equal its exact volume for
+a cube whose edges fall on the voxel grid (columns running along edges shared
+by two triangles must be counted once), and come close to it for the
+reference gamuts. Exits with a non-zero status if any check fails.
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DisplayCAL import gamut
+from DisplayCAL.config import get_data_path
+
+
+def surfaces():
+	""" Yield (name, surface, tolerance as fraction of the volume) """
+	for steps in (2, 5, 17):
+		vertices, triangles = gamut.device_cube_surface(steps)
+		for scale, offset in ((100, 0), (100, 3.3), (64, -1)):
+			surface = gamut.GamutSurface(vertices * scale + offset, triangles)
+			yield "cube %i^3 x %s %+g" % (steps, scale, offset), surface, 1e-9
+	for name in ("sRGB", "ClayRGB1998", "SMPTE431_P3"):
+		yield (name, gamut.GamutSurface.from_gam(get_data_path("ref/%s.gam" %
+															   name)),
+			   .001)
+
+
+def main():
+	failed = 0
+	for name, surface, tolerance in surfaces():
+		volume = surface.volume
+		intersection = surface.intersection(surface)[2]
+		if abs(intersection - volume) > volume * tolerance:
+			status = "FAIL"
+			failed += 1
+		else:
+			status = "ok"
+		print "%-22s %-4s volume %11.1f  intersection %11.1f" % (name, status,
+																 volume,
+																 intersection)
+	if failed:
+		print "%i of the checks failed" % failed
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
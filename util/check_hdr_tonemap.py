@@ -0,0 +1,123 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+Compare HDR tonemapping against the previous stepwise implementation
+
+Synthetic PQ cLUT profiles are created twice, once with the current
+ICCProfile._mp_hdr_tonemap and once with the previous implementation below,
+which desaturated every out of gamut cLUT node in 1% steps. Reports the
+difference of the A2B0 cLUTs in delta E 2000 per mode and exits with a
+non-zero status if it exceeds the tolerance.
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from DisplayCAL import ICCProfile as ICCP, colormath, config
+
+
+# (mode, white cd/m2, saturation, cLUT resolution)
+CASES = [(mode, white_cdm2, sat, clutres)
+		 for mode in ("HSV_ICtCp", "RGB_ICtCp", "YRGB")
+		 for white_cdm2, sat, clutres in ((400, 1.0, 17), (400, 0.5, 17),
+										  (100, 0.7, 33))]
+
+
+def _mp_hdr_tonemap_stepwise(HDR_XYZ, thread_abort_event, progress_queue,
+							 rgb_space, maxv, sat, cat="Bradford",
+							 tolerance=None):
+	""" Previous implementation of _mp_hdr_tonemap (tolerance is unused) """
+	for row in HDR_XYZ:
+		RGB_in = row[:3].tolist()
+		ICtCp_XYZ = row[3:6].tolist()
+		RGB_ICtCp_XYZ = row[6:].tolist()
+		is_neutral = all(v == RGB_in[0] for v in RGB_in)
+		for j, XYZ in enumerate((ICtCp_XYZ, RGB_ICtCp_XYZ)):
+			if j == 0 and (sat == 1 or ICtCp_XYZ == RGB_ICtCp_XYZ):
+				ICtCp_XYZ = RGB_ICtCp_XYZ
+				continue
+			X, Y, Z = XYZ
+			I = None
+			its = 10000
+			while not is_neutral and its:
+				X_D50, Y_D50, Z_D50 = colormath.adapt(*(v / maxv for v in (X, Y, Z)),
+													  whitepoint_source=rgb_space[1],
+													  cat=cat)
+				negative_clip = min(X_D50, Y_D50, Z_D50) < 0
+				positive_clip = (round(X_D50, 4) > 0.9642 or Y_D50 > 1 or
+								 round(Z_D50, 4) > 0.8249)
+				if not (negative_clip or positive_clip):
+					break
+				if I is None:
+					I, Ct, Cp = colormath.XYZ2ICtCp(X, Y, Z)
+				Ct *= 0.99
+				Cp *= 0.99
+				X, Y, Z = colormath.ICtCp2XYZ(I, Ct, Cp)
+				if Y > XYZ[1]:
+					X, Y, Z = (v / Y * XYZ[1] for v in (X, Y, Z))
+					I, Ct, Cp = colormath.XYZ2ICtCp(X, Y, Z)
+				its -= 1
+			XYZ[:] = X, Y, Z
+		row[3:6] = ICtCp_XYZ
+		row[6:] = RGB_ICtCp_XYZ
+	return HDR_XYZ
+
+
+def create_clut(tonemap, mode, white_cdm2, sat, clutres):
+	""" Return A2B0 cLUT as array of D50 Lab and the time it took """
+	ICCP._mp_hdr_tonemap = tonemap
+	ts = time.time()
+	profile = ICCP.create_synthetic_hdr_clut_profile("PQ", "Rec. 2020",
+													 "Tonemapping check",
+													 white_cdm2=white_cdm2,
+													 clutres=clutres,
+													 mode=mode, sat=sat)
+	elapsed = time.time() - ts
+	XYZ = numpy.array([XYZ for block in profile.tags.A2B0.clut
+					   for XYZ in block]) / 32768.0
+	return colormath.XYZ2Lab_array(XYZ * 100), elapsed
+
+
+def main(tolerance=0.8):
+	config.initcfg()
+	# Run the tonemapping in this process
+	config.setcfg("multiprocessing.max_cpus", 1)
+	tonemap = ICCP._mp_hdr_tonemap
+	failed = 0
+	try:
+		for mode, white_cdm2, sat, clutres in CASES:
+			Lab, elapsed = create_clut(tonemap, mode, white_cdm2, sat,
+									   clutres)
+			Lab_stepwise, elapsed_stepwise = create_clut(_mp_hdr_tonemap_stepwise,
+														 mode, white_cdm2, sat,
+														 clutres)
+			dE = colormath.delta_array(Lab_stepwise, Lab, 2000)["E"]
+			if dE.max() > float(tolerance):
+				status = "FAIL"
+				failed += 1
+			else:
+				status = "ok"
+			print ("%-9s %5i cd/m2 sat %.1f %2i^3  %-4s  dE max %.2f  avg %.3f  "
+				   "nodes > 1 %4i  %.1f s (stepwise %.1f s)" %
+				   (mode, white_cdm2, sat, clutres, status, dE.max(), dE.mean(),
+					(dE > 1).sum(), elapsed, elapsed_stepwise))
+	finally:
+		ICCP._mp_hdr_tonemap = tonemap
+	if failed:
+		print "%i of the checks failed" % failed
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	if len(sys.argv[1:]) < 2:
+		sys.exit(main(*sys.argv[1:]))
+	else:
+		print "Usage: %s [TOLERANCE]" % os.path.basename(__file__)